@@ -0,0 +1,118 @@
+#!/usr/bin/env coopr_python
+
+"""
+Temoa - Tools for Energy Model Optimization and Analysis
+  linear optimization; least cost; dynamic system visualization
+
+Copyright (C) 2011-2014  Kevin Hunter, Joseph DeCarolis
+
+This program is free software: you can redistribute it and/or modify it under
+the terms of the GNU Affero General Public License as published by the Free
+Software Foundation, either version 3 of the License, or (at your option) any
+later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+PARTICULAR PURPOSE.  See the GNU Affero General Public License for more details.
+
+Developers of this script will check out a complete copy of the GNU Affero
+General Public License in the file COPYING.txt.  Users uncompressing this from
+an archive may not have received this license file.  If not, see
+<http://www.gnu.org/licenses/>.
+"""
+
+# This script compares the monolithic (perfect foresight) solve of Temoa with
+# the --benders decomposition, by wall clock time, peak memory, and objective
+# value.  By default it runs each of the bundled data_files; otherwise it runs
+# the dot dat files given as arguments.  Any further Temoa options (e.g.,
+# --solver) may follow a lone '--':
+#
+#   $ coopr_python benchmark_benders.py
+#   $ coopr_python benchmark_benders.py data_files/utopia-15.dat -- --solver cplex
+
+import os
+import re
+import sys
+
+from glob import glob
+from subprocess import Popen, PIPE
+from time import time
+
+objective_re = re.compile( r'^Objective function value \(\w+\): (\S+)$', re.M )
+iterations_re = re.compile( r'^\[\s*[\d.]+\] Benders iteration (\d+):', re.M )
+
+
+def run_temoa ( dot_dat, extra_args ):
+	"""\
+Run Temoa in a separate process, and return a tuple of (seconds, peak memory
+in MiB of the largest process, objective value or None, Temoa's stderr).
+"""
+	here = os.path.dirname( os.path.abspath( __file__ ))
+	cmd = [ sys.executable, os.path.join( here, 'temoa_model' ) ]
+	cmd.extend( extra_args )
+	cmd.append( dot_dat )
+
+	begin = time()
+	proc = Popen( cmd, stdout=PIPE, stderr=PIPE )
+	stdout, stderr = proc.communicate()
+	seconds = time() - begin
+
+	# ru_maxrss is in KiB on Linux, and includes the child's own children
+	# (e.g., the Benders subproblem workers) once they have been reaped.
+	import resource
+	peak = resource.getrusage( resource.RUSAGE_CHILDREN ).ru_maxrss / 1024.0
+
+	objective = objective_re.search( stdout )
+	if objective:
+		objective = float( objective.group( 1 ))
+
+	return seconds, peak, objective, stderr
+
+
+def main ( argv ):
+	if '--' in argv:
+		split = argv.index( '--' )
+		dot_dats, extra_args = argv[ :split ], argv[ split +1: ]
+	else:
+		dot_dats, extra_args = argv, []
+
+	if not dot_dats:
+		here = os.path.dirname( os.path.abspath( __file__ ))
+		dot_dats = sorted( glob( os.path.join( here, 'data_files', '*.dat' )))
+
+	header = '{:<24s} {:>10s} {:>10s} {:>18s}   {:>10s} {:>10s} {:>18s} {:>6s} {:>10s}'
+	row    = '{:<24s} {:>10.2f} {:>10.1f} {:>18s}   {:>10.2f} {:>10.1f} {:>18s} {:>6s} {:>10s}'
+	print header.format( 'data file', 'mono (s)', 'mono MiB', 'mono objective',
+	  'bend (s)', 'bend MiB', 'bend objective', 'iters', 'rel diff' )
+
+	for dot_dat in dot_dats:
+		# Each measurement runs in a fresh child of this child, so that the
+		# peak memory of one run does not mask that of the next.
+		results = list()
+		for args in ( extra_args, ['--benders'] + extra_args ):
+			proc = Popen( [sys.executable, __file__, '--measure', dot_dat] + args,
+			  stdout=PIPE )
+			out, err = proc.communicate()
+			results.append( eval( out ))
+
+		(m_sec, m_mem, m_obj, m_err), (b_sec, b_mem, b_obj, b_err) = results
+
+		iterations = iterations_re.findall( b_err )
+		iterations = iterations[-1] if iterations else '-'
+
+		diff = '-'
+		if m_obj is not None and b_obj is not None:
+			diff = '{:.2e}'.format( abs( b_obj - m_obj ) / max( abs( m_obj ), 1e-9 ))
+
+		fmt = lambda obj: '{:.8g}'.format( obj ) if obj is not None else 'failed'
+		print row.format( os.path.basename( dot_dat ), m_sec, m_mem, fmt( m_obj ),
+		  b_sec, b_mem, fmt( b_obj ), iterations, diff )
+		sys.stdout.flush()
+
+
+if '__main__' == __name__:
+	if sys.argv[1:2] == ['--measure']:
+		dot_dat, extra_args = sys.argv[2], sys.argv[3:]
+		print repr( run_temoa( dot_dat, extra_args ))
+	else:
+		main( sys.argv[1:] )
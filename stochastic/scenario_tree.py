@@ -0,0 +1,1379 @@
+"""\
+The scenario tree engine behind generate_scenario_tree.py and
+generate_scenario_tree-nonhomogenous.py.  Given an options file (see
+options/README.txt), it builds the event tree of a Temoa model, and writes the
+dot dat file of each node and the ScenarioStructure.dat that PySP reads.
+
+How each node branches, and with what conditional probability, is up to a
+Branching strategy: HomogeneousBranching (every stochastic node has the same
+branches), MarkovBranching (the branches and their probabilities depend on the
+node's own decision), or a subclass of Branching named by the options file.
+"""
+
+__all__ = ('Branching', 'HomogeneousBranching', 'MarkovBranching',
+  'NodeDataProvider', 'ScenarioTree', 'create_tree', 'reduce_tree', 'run',
+  'write_scenario_file')
+
+import os
+import sys
+
+from array import array
+from cStringIO import StringIO
+from itertools import imap, product
+from shutil import copy as copyfile, rmtree
+from textwrap import TextWrapper
+
+import pyomo.environ
+from pyomo.core.base.sets import _SetProduct
+
+SE = sys.stderr
+instance = None
+
+node_count = 0
+stringify = lambda x: ', '.join(str(i) for i in x)
+
+class KeyIndex ( object ):
+	"""\
+The keys of one model parameter at one stochastic point: the model's keys, the
+same keys without the stochastic index (which the owning tree node knows), the
+position of each, and the model's values.  The key filtering depends only on
+(parameter, stochastic point), so every node at that point shares one
+KeyIndex; see get_key_index().  A KeyIndex holds no reference to the model, so
+that it may be pickled with a ScenarioTree.
+"""
+
+	__slots__ = ('model_keys', 'my_keys', 'position', 'values', 'product',
+	             'rates')
+
+	def __init__ ( self, param, spoint, pidx ):
+		pindex = param.index_set()
+
+		# Only the sparse keys: those with a value in the dat file, and not
+		# all the keys of a (possibly dense) index set.
+		keys = param.sparse_keys()
+
+		# we filter out the spoint because it's inherently known by the tree
+		# node, which "owns" these values
+		f = lambda x: x[pidx] == spoint
+		r = lambda x: tuple(x[0:pidx] + x[pidx+1:])
+		model_keys = filter( f, keys )
+		my_keys    = map( r, model_keys )
+
+		values = list()
+		for actual in model_keys:
+			try:
+				values.append( param[ actual ] )   # pulled from model
+			except ValueError:
+				values.append( 0 )
+
+		self.model_keys = model_keys   # these keys are linked -- in the same
+		self.my_keys    = my_keys      #   order -- for zip()-ability
+		self.position   = dict( (k, i) for i, k in enumerate( my_keys ))
+		self.values     = values
+		self.product    = isinstance( pindex, _SetProduct )
+		self.rates      = dict()       # { rates : [rate per key] }
+
+	def skeys ( self ):
+		"""The model's keys, as strings."""
+		if self.product:
+			return (' '.join(str(i) for i in k) for k in self.model_keys)
+		return ' '.join(str(i) for i in self.model_keys)
+
+	def key_rates ( self, table ):
+		"""\
+Return the rate of each key, in order, per table, a RateTable.  Nodes with the
+same rates share the returned list.
+"""
+		if table.rates not in self.rates:
+			self.rates[ table.rates ] = map( table.rate, self.my_keys )
+
+		return self.rates[ table.rates ]
+
+
+class RateTable ( object ):
+	"""\
+The rates of one model parameter, a tuple of (pattern, rate), compiled for
+lookup by key.  A pattern -- e.g., 'imp_natgas,*' or '*,*,r_cooling' -- is a
+comma separated list of index values, one per dimension of the (reduced) key,
+where '*' matches anything.  The first pattern to match a key gives its rate;
+a key that no pattern matches keeps a rate of 1.
+
+Pattern i is bit i of an integer mask.  Per dimension, a dict maps each index
+value to the mask of patterns that name it, and a separate mask holds the
+patterns with a wildcard (or no entry) there.  The patterns that match a key
+are then the AND, over its dimensions, of one dict lookup each, and the rate
+is that of the lowest bit set.
+"""
+
+	__slots__ = ('name', 'rates', 'tables', 'wildcards', 'matched')
+
+	def __init__ ( self, name, rates ):
+		patterns = [ pattern.split(',') for pattern, r in rates ]
+		ndims = max( [0] + map( len, patterns ))
+
+		tables    = [ dict() for d in range( ndims ) ]
+		wildcards = [ 0 ] * ndims
+		for i, pattern in enumerate( patterns ):
+			bit = 1 << i
+			for d in range( ndims ):
+				p = pattern[ d ] if d < len( pattern ) else '*'
+				if '*' == p:
+					wildcards[ d ] |= bit
+				else:
+					tables[ d ][ p ] = tables[ d ].get( p, 0 ) | bit
+
+		self.name      = name
+		self.rates     = rates
+		self.tables    = tables
+		self.wildcards = wildcards
+		self.matched   = 0     # mask of the patterns that have matched a key
+
+	def rate ( self, key ):
+		mask = (1 << len( self.rates )) - 1
+		for table, wild, t in zip( self.tables, self.wildcards, key ):
+			if not mask: break
+			mask &= table.get( t, 0 ) | wild
+
+		if not mask:
+			return 1
+
+		self.matched |= mask
+		first = (mask & -mask).bit_length() - 1
+		return self.rates[ first ][1]
+
+	def unmatched ( self ):
+		"""Return the patterns that have not matched any key."""
+		return [
+		  pattern
+		  for i, (pattern, r) in enumerate( self.rates )
+		  if not self.matched & (1 << i)
+		]
+
+
+# { (parameter name, spoint) : KeyIndex }, and
+# { (parameter name, rates) : RateTable }
+_key_indices = dict()
+_rate_tables = dict()
+
+def get_key_index ( name, spoint, pidx ):
+	key = (name, spoint)
+	if key not in _key_indices:
+		param = getattr( instance, name ) # intentionally die if not found.
+		_key_indices[ key ] = KeyIndex( param, spoint, pidx )
+	return _key_indices[ key ]
+
+
+def get_rate_table ( name, rates ):
+	key = (name, rates)
+	if key not in _rate_tables:
+		_rate_tables[ key ] = RateTable( name, rates )
+	return _rate_tables[ key ]
+
+
+def warn_unmatched_rates ( ):
+	"""\
+Warn of any rate pattern that matched no key of its parameter, at any
+stochastic point -- most likely a typo in the options file.
+"""
+	unmatched = set()
+	for table in _rate_tables.itervalues():
+		unmatched.update( (table.name, p) for p in table.unmatched() )
+
+	for name, pattern in sorted( unmatched ):
+		msg = ("\nWarning: the rate pattern '{}' of parameter {} matches no "
+		  'keys.  Is it a typo?\n')
+		SE.write( msg.format( pattern, name ))
+
+
+def format_param ( name, index, values, comment='', positions=None ):
+	"""\
+Return the AMPL (dot dat) format of the model parameter name, with keys per
+index, a KeyIndex, and the corresponding values.  With positions, only the
+keys at those positions.
+"""
+	if comment:
+		comment = '# Decision: %s\n\n' % str(comment)
+
+	keys = index.skeys()
+	if isinstance( keys, str ):
+		keys = [ keys ]
+
+	# Together, these functions return the length of a printed version of a
+	# number, in characters.  They are used to make columns of data line up so
+	# one may have an easier time getting an overall sense of a data file.
+	def get_int_padding ( v ):
+		return len(str(int(v)))
+	def get_str_padding ( index ):
+		def anonymous_function ( obj ):
+			val = obj[ index ]
+			return len(str(val))
+		return anonymous_function
+
+	keys = tuple( tuple(i.split()) for i in keys )
+	int_padding = max(map( get_int_padding, values ))
+	str_padding = [
+	  max(map( get_str_padding(i), keys ))
+	  for i in range(len(keys[0]))
+	]
+	str_format = '  %-{}s' * len( index.model_keys[0] )
+	str_format = str_format.format(*str_padding)
+
+	format = '\n%%s   %%%ds%%s' % int_padding
+	# works out to something like '\n  %s   %8d%-6s'
+	#                                 index { val }
+
+	items = zip( index.model_keys, values )
+	if positions is not None:
+		items = [ items[ i ] for i in positions ]
+
+	data = StringIO()
+	data.write( comment + 'param  %s  :=' % name )
+	for actual_key, v in sorted( items ):
+		int_part = str(int(abs(v)))
+		if int_part != str(abs(v)):
+			dec_part = str(abs(v))[len(int_part):]
+		else:
+			dec_part = ''
+		if '.0' == dec_part:
+			dec_part = ''   # the values are stored as floats; e.g., 5.0 -> 5
+
+		if v < 0: int_part = '-%s' % int_part
+		index_str = str_format % tuple(actual_key)
+		data.write( format % (index_str, int_part, dec_part) )
+	data.write( '\n\t;\n' )
+
+	return data.getvalue()
+
+
+class ScenarioTree ( object ):
+	"""\
+The event tree, by columns rather than by node objects.  The nodes are
+numbered in preorder (so a parent precedes its children), and per node there
+is one entry in each of names, bnames (the dot dat file name, minus
+extension), parent (-1 for the root), stage (the position of its stochastic
+point in spoints), prob (conditional probability), and decision (the key of
+its rates, or None).
+
+Each node of a stage is also a row of that stage's value matrices: per
+(parameter, stage), values is a flat array of rows x keys, in the key order of
+the KeyIndex of (parameter, stochastic point).  The rate vectors, likewise in
+key order, are shared by every node with the same decision; rate_ids holds,
+per parameter, each node's position in rate_vectors[ parameter, stage ].
+
+The memory is then about 8 bytes per (node, key), where a dict of objects per
+node was many times that.  Without store_values, there are no value matrices
+at all, and a NodeDataProvider computes the values of nodes on request.
+"""
+
+	__slots__ = ('params', 'rates', 'sindices', 'spoints', 'names', 'bnames',
+	  'parent', 'stage', 'row', 'prob', 'decision', 'rate_ids',
+	  'rate_vectors', 'rate_positions', 'values', 'stage_rows', 'key_indices',
+	  'key_maps')
+
+	def __init__ ( self, spoints, rates, sindices, store_values=True ):
+		self.params   = tuple( rates )      # names of the stochastic parameters
+		self.rates    = rates               # { param : { decision : rates }}
+		self.sindices = sindices            # { param : stochastic index }
+		self.spoints  = tuple( spoints )    # the stochastic set, in order
+
+		self.names    = list()
+		self.bnames   = list()
+		self.parent   = array( 'i' )
+		self.stage    = array( 'H' )
+		self.row      = array( 'i' )
+		self.prob     = list()
+		self.decision = list()
+
+		self.rate_ids = dict( (p, array( 'i' )) for p in self.params )
+		self.rate_vectors = dict()     # { (param, stage) : [array, ...] }
+		self.rate_positions = dict()   # { (param, stage, rates) : position }
+		self.values = dict() if store_values else None  # { (param, stage) : array }
+		self.stage_rows = array( 'i', [0] * len( self.spoints ))
+
+		self.key_indices = dict()   # { (param, spoint) : KeyIndex }
+		self.key_maps = dict()      # { (param, parent spoint, child spoint) : map }
+
+
+	def __len__ ( self ):
+		return len( self.names )
+
+
+	def add_node ( self, name, parent, spoint, prob, decision, bname ):
+		"""\
+Append a node, with its values initialized to the model's, and return its
+number.  Nodes must be added in preorder.
+"""
+		node = len( self.names )
+		stage = self.spoints.index( spoint )
+
+		for p in self.params:
+			index = get_key_index( p, spoint, int( self.sindices[ p ] ))
+			self.key_indices[ p, spoint ] = index
+			rates = ()
+			if decision is not None:
+				rates = tuple( self.rates[ p ][ decision ])
+
+			key = (p, stage, rates)
+			if key not in self.rate_positions:
+				table = get_rate_table( p, rates )
+				vectors = self.rate_vectors.setdefault( (p, stage), list() )
+				self.rate_positions[ key ] = len( vectors )
+				vectors.append( array( 'd', index.key_rates( table )))
+			self.rate_ids[ p ].append( self.rate_positions[ key ])
+
+			if self.values is not None:
+				self.values.setdefault( (p, stage), array( 'd' )).extend( index.values )
+
+		self.names.append( name )
+		self.bnames.append( bname )
+		self.parent.append( parent )
+		self.stage.append( stage )
+		self.row.append( self.stage_rows[ stage ])
+		self.stage_rows[ stage ] += 1
+		self.prob.append( prob )
+		self.decision.append( decision )
+
+		return node
+
+
+	def key_map ( self, param, parent, child ):
+		"""\
+Return the (parent position, child position) of the keys that the model
+parameter param has in common at the stochastic points parent and child.
+"""
+		key = (param, parent, child)
+		if key not in self.key_maps:
+			position = self.key_indices[ param, child ].position
+			self.key_maps[ key ] = [
+			  (i, position[ k ])
+			  for i, k in enumerate( self.key_indices[ param, parent ].my_keys )
+			  if k in position
+			]
+		return self.key_maps[ key ]
+
+
+	def child_values ( self, param, child, pvalues ):
+		"""\
+Return the values of param at the node child, given pvalues, those of its
+parent: the parent's value of each shared key times the child's rate, and the
+model's value of any other key.
+"""
+		spoints = self.spoints
+		stage = self.stage[ child ]
+		index = self.key_indices[ param, spoints[ stage ]]
+		rates = self.rate_vectors[ param, stage ][ self.rate_ids[ param ][ child ]]
+		pspoint = spoints[ self.stage[ self.parent[ child ]]]
+
+		values = array( 'd', index.values )
+		for ppos, pos in self.key_map( param, pspoint, spoints[ stage ]):
+			values[ pos ] = pvalues[ ppos ] * rates[ pos ]
+		return values
+
+
+	def node_values ( self, param, node ):
+		"""The values of param at node, in the key order of its KeyIndex."""
+		stage = self.stage[ node ]
+		width = len( self.key_indices[ param, self.spoints[ stage ]].values )
+		start = self.row[ node ] * width
+		return self.values[ param, stage ][ start:start + width ]
+
+
+	def propagate_values ( self ):
+		"""\
+Compute the parameter values of every node below the root: each child's value
+is its parent's value multiplied by the child's rate.  Nodes that have no key
+in common with their parent's keep the model's values.
+"""
+		spoints = self.spoints
+		for p in self.params:
+			rate_ids = self.rate_ids[ p ]
+			for child in xrange( 1, len( self )):
+				parent = self.parent[ child ]
+				pstage, cstage = self.stage[ parent ], self.stage[ child ]
+				pvalues = self.values[ p, pstage ]
+				cvalues = self.values[ p, cstage ]
+				rates = self.rate_vectors[ p, cstage ][ rate_ids[ child ]]
+
+				pwidth = len( self.key_indices[ p, spoints[ pstage ]].values )
+				cwidth = len( rates )
+				pbase = self.row[ parent ] * pwidth
+				cbase = self.row[ child ] * cwidth
+
+				for ppos, pos in self.key_map( p, spoints[ pstage ], spoints[ cstage ]):
+					cvalues[ cbase + pos ] = pvalues[ pbase + ppos ] * rates[ pos ]
+
+
+	def as_dat ( self, node, values=None ):
+		"""\
+Return the contents of node's dot dat file, with values, { param : values },
+or else the values of the value matrices.
+"""
+		if self.decision[ node ] is None:
+			return '# Decision: HedgingStrategy (no change from R.dat)\n'
+
+		if values is None:
+			values = dict( (p, self.node_values( p, node )) for p in self.params )
+
+		spoint = self.spoints[ self.stage[ node ]]
+		return '\n'.join(
+		  format_param( p, self.key_indices[ p, spoint ], values[ p ],
+		    self.names[ node ] if 0 == i else '' )
+		  for i, p in enumerate( self.params )
+		)
+
+
+	def as_delta ( self, node, values=None, pvalues=None ):
+		"""\
+Return the contents of node's dot dat file in the delta format: only the
+values that differ from those the node inherits from its parent.  values and
+pvalues are { param : values } of node and its parent, or else those of the
+value matrices.
+
+A node inherits, per key, its parent's value of the same key (less the
+stochastic index), or else the model's value.  The first line records what a
+loader needs to recover the rest, e.g.
+
+  # delta  apply  point=2010  parent_point=2000  CostInvest=1  Demand=0
+
+that the node's values are to be applied (or, 'hedge', only passed on to its
+children), its stochastic point and its parent's, and the stochastic index of
+each parameter.  PySP cannot read this format; Temoa's loaders can.
+"""
+		from itertools import izip
+
+		parent = self.parent[ node ]
+		if -1 == parent:
+			return self.as_dat( node, values )
+
+		if values is None:
+			values  = dict( (p, self.node_values( p, node )) for p in self.params )
+			pvalues = dict( (p, self.node_values( p, parent )) for p in self.params )
+
+		spoint  = self.spoints[ self.stage[ node ]]
+		pspoint = self.spoints[ self.stage[ parent ]]
+		decision = self.decision[ node ]
+
+		data = StringIO()
+		data.write( '# delta  {}  point={}  parent_point={}  {}\n'.format(
+		  'hedge' if decision is None else 'apply', spoint, pspoint,
+		  '  '.join( '{}={}'.format( p, self.sindices[ p ])
+		    for p in sorted( self.params ))
+		))
+		if decision is None:
+			data.write( '# Decision: HedgingStrategy (no change from R.dat)\n' )
+			return data.getvalue()
+
+		data.write( '# Decision: %s\n' % self.names[ node ])
+		for p in self.params:
+			index = self.key_indices[ p, spoint ]
+			inherited = array( 'd', index.values )
+			for ppos, pos in self.key_map( p, pspoint, spoint ):
+				inherited[ pos ] = pvalues[ p ][ ppos ]
+
+			changed = [
+			  i for i, (v, w) in enumerate( izip( values[ p ], inherited ))
+			  if v != w
+			]
+			if changed:
+				data.write( '\n' + format_param( p, index, values[ p ],
+				  positions=changed ))
+
+		return data.getvalue()
+
+
+	def write_dat_files ( self, jobs=None, delta=False ):
+		"""\
+Write the dot dat file of every node -- with delta, in the delta format of
+as_delta().  The parameter values are first propagated down the whole tree;
+the files are then rendered and written by jobs processes (default: one per
+CPU), each of which inherits the tree by fork.
+"""
+		global node_count, _write_tree, _write_delta
+
+		self.propagate_values()
+
+		_write_tree = self
+		_write_delta = delta
+		num_nodes = len( self )
+
+		pool = None
+		if sys.platform.startswith('win') or 1 == jobs:
+			counts = imap( _write_dat_chunk, [ (0, num_nodes) ] )
+		else:
+			import multiprocessing as MP
+
+			jobs = jobs or MP.cpu_count()
+			size = max( 1, min( 100, num_nodes // (4 * jobs) ))
+			chunks = [ (i, min( i + size, num_nodes ))
+			  for i in xrange( 0, num_nodes, size ) ]
+			pool = MP.Pool( jobs )
+			counts = pool.imap_unordered( _write_dat_chunk, chunks )
+
+		for count in counts:
+			node_count += count
+			inform( '\b' * (len(str(node_count -count))+1) + str(node_count) + ' ' )
+
+		if pool:
+			pool.close()
+			pool.join()
+		_write_tree = None
+
+
+	def children ( self ):
+		"""Return the list of children of each node."""
+		children = [ list() for i in xrange( len( self )) ]
+		for node in xrange( 1, len( self )):
+			children[ self.parent[ node ]].append( node )
+		return children
+
+
+	def get_scenario_data ( self ):
+		bnames = self.bnames
+		nodes = list( bnames )
+		nodestage = [
+		  ( bnames[ n ], 's' + str( self.spoints[ self.stage[ n ]]))
+		  for n in xrange( len( self ))
+		]
+		probability = [ (bnames[ n ], self.prob[ n ]) for n in xrange( len( self )) ]
+
+		scenarios, children = list(), list()
+		for node, kids in enumerate( self.children() ):
+			if not kids:
+				scenarios.append( bnames[ node ][2:] )
+			else:
+				children.append( (bnames[ node ], [ bnames[ c ] for c in kids ]) )
+
+		return scenarios, nodes, nodestage, children, probability
+
+
+	def reduced ( self, leaf_probability ):
+		"""\
+Return a tree of only the leaves of leaf_probability, { leaf : probability },
+and their ancestors, with the conditional probabilities recomputed so that
+each leaf has its given probability.  The nodes keep their names, and the new
+tree shares the key indices and rate vectors of this one.
+"""
+		mass = [ 0.0 ] * len( self )
+		for leaf, prob in leaf_probability.iteritems():
+			node = leaf
+			while -1 != node:
+				mass[ node ] += prob
+				node = self.parent[ node ]
+
+		kept = set()
+		for leaf in leaf_probability:
+			node = leaf
+			while -1 != node and node not in kept:
+				kept.add( node )
+				node = self.parent[ node ]
+
+		tree = ScenarioTree( self.spoints, self.rates, self.sindices,
+		  self.values is not None )
+		tree.rate_vectors   = self.rate_vectors
+		tree.rate_positions = self.rate_positions
+		tree.key_indices    = self.key_indices
+		tree.key_maps       = self.key_maps
+
+		new_id = dict()
+		for node in xrange( len( self )):   # preorder, so parents come first
+			if node not in kept: continue
+
+			parent = self.parent[ node ]
+			stage = self.stage[ node ]
+			if -1 == parent:
+				prob = self.prob[ node ]
+			elif mass[ parent ]:
+				prob = mass[ node ] / mass[ parent ]
+			else:
+				prob = self.prob[ node ]
+
+			for p in self.params:
+				tree.rate_ids[ p ].append( self.rate_ids[ p ][ node ])
+				if tree.values is not None:
+					tree.values.setdefault( (p, stage), array( 'd' )).extend(
+					  self.node_values( p, node ))
+
+			new_id[ node ] = len( tree.names )
+			tree.names.append( self.names[ node ])
+			tree.bnames.append( self.bnames[ node ])
+			tree.parent.append( new_id.get( parent, -1 ))
+			tree.stage.append( stage )
+			tree.row.append( tree.stage_rows[ stage ])
+			tree.stage_rows[ stage ] += 1
+			tree.prob.append( prob )
+			tree.decision.append( self.decision[ node ])
+
+		return tree
+
+# The tree being written, and whether in the delta format; worker processes
+# inherit them by fork, so that only (start, stop) ranges cross the process
+# boundary.
+_write_tree = None
+_write_delta = False
+
+def _write_dat_chunk ( chunk ):
+	start, stop = chunk
+	render = _write_tree.as_delta if _write_delta else _write_tree.as_dat
+	for node in xrange( start, stop ):
+		with open( _write_tree.bnames[ node ] + '.dat', 'w' ) as f:
+			f.write( render( node ))
+	return stop - start
+
+
+class NodeDataProvider ( object ):
+	"""\
+The parameter values of the nodes of a ScenarioTree, computed on request from
+the model's values and the rates along each node's path, rather than for the
+whole tree up front.  The values of the most recently used cache_size nodes
+are kept, so that siblings -- and the many scenarios through the same
+ancestors -- share the work.
+
+A provider pickles to the tree alone (see save()), so that a later process --
+e.g., the ECIU workers -- may produce the dot dat files of just the nodes it
+needs, with write_dat_file().
+"""
+
+	__slots__ = ('tree', 'cache_size', 'cache', 'ids')
+
+	def __init__ ( self, tree, cache_size=64 ):
+		self.__setstate__( (tree, cache_size) )
+
+	def __getstate__ ( self ):
+		return (self.tree, self.cache_size)
+
+	def __setstate__ ( self, state ):
+		from collections import OrderedDict
+
+		self.tree, self.cache_size = state
+		self.cache = OrderedDict()    # { node : { param : values }}
+		self.ids = dict( (b, i) for i, b in enumerate( self.tree.bnames ))
+
+	def __contains__ ( self, bname ):
+		return bname in self.ids
+
+	def node_values ( self, node ):
+		"""Return { param : values } of node, by number."""
+		cache = self.cache
+		if node in cache:
+			values = cache.pop( node )
+		else:
+			tree = self.tree
+			parent = tree.parent[ node ]
+			if -1 == parent:
+				spoint = tree.spoints[ tree.stage[ node ]]
+				values = dict(
+				  (p, array( 'd', tree.key_indices[ p, spoint ].values ))
+				  for p in tree.params
+				)
+			else:
+				pvalues = self.node_values( parent )
+				values = dict(
+				  (p, tree.child_values( p, node, pvalues[ p ] ))
+				  for p in tree.params
+				)
+
+			while len( cache ) >= max( 1, self.cache_size ):
+				cache.popitem( last=False )
+
+		cache[ node ] = values   # most recently used is last
+		return values
+
+	def as_dat ( self, bname ):
+		"""Return the contents of the dot dat file of the node bname."""
+		node = self.ids[ bname ]
+		return self.tree.as_dat( node, self.node_values( node ))
+
+	def write_dat_file ( self, bname ):
+		"""\
+Write bname.dat.  The file appears whole, or not at all, so that concurrent
+processes may each write the same node.
+"""
+		fname = bname + '.dat'
+		tmpname = '{}.{}.tmp'.format( fname, os.getpid() )
+		with open( tmpname, 'w' ) as f:
+			f.write( self.as_dat( bname ))
+		os.rename( tmpname, fname )
+		return fname
+
+	def save ( self, fname ):
+		import cPickle
+
+		with open( fname, 'wb' ) as f:
+			cPickle.dump( self, f, cPickle.HIGHEST_PROTOCOL )
+
+
+def scenario_vectors ( tree ):
+	"""\
+Return (leaves, probabilities, vectors): per leaf of tree, its unconditional
+probability, and the values of the stochastic parameters of the nodes along
+its path that vary their parent's (i.e., have a decision), concatenated in
+path order.  Each value is relative to the model's value of the same key, so
+that parameters of different units weigh alike.
+"""
+	from itertools import izip
+
+	params = tree.params
+	children = tree.children()
+
+	def relative ( values, base ):
+		return array( 'd', (
+		  v / b if b else v for v, b in izip( values, base )))
+
+	leaves, probabilities, vectors = list(), list(), list()
+	path = list()   # per depth: (node values, vector, probability)
+	for node in xrange( len( tree )):   # preorder
+		parent = tree.parent[ node ]
+		spoint = tree.spoints[ tree.stage[ node ]]
+		if -1 == parent:
+			values = dict(
+			  (p, array( 'd', tree.key_indices[ p, spoint ].values )) for p in params )
+			vector, prob = array( 'd' ), tree.prob[ node ]
+			del path[:]
+		else:
+			while path[-1][0] != parent:
+				path.pop()
+			pvalues, vector, prob = path[-1][1:]
+			values = dict(
+			  (p, tree.child_values( p, node, pvalues[ p ])) for p in params )
+			prob *= tree.prob[ node ]
+
+		if tree.decision[ node ] is not None:
+			vector = vector + array( 'd' )
+			for p in params:
+				vector.extend( relative( values[ p ],
+				  tree.key_indices[ p, spoint ].values ))
+
+		if children[ node ]:
+			path.append( (node, values, vector, prob) )
+		else:
+			leaves.append( node )
+			probabilities.append( prob )
+			vectors.append( vector )
+
+	return leaves, probabilities, vectors
+
+
+def _distance_matrix ( vectors ):
+	"""The L1 (city block) distances between each pair of vectors."""
+	from operator import sub
+
+	num = len( vectors )
+	dist = [ array( 'd', [0.0] * num ) for i in xrange( num ) ]
+	for i in xrange( num ):
+		a = vectors[ i ]
+		for j in xrange( i +1, num ):
+			d = sum( imap( abs, imap( sub, a, vectors[ j ] )))
+			dist[ i ][ j ] = dist[ j ][ i ] = d
+	return dist
+
+
+def forward_selection ( probabilities, dist, budget ):
+	"""\
+Fast forward selection (Heitsch and Roemisch): starting with none, repeatedly
+select the scenario that most reduces the probability weighted distance of the
+unselected scenarios to their nearest selected one, until budget scenarios are
+selected.  Return the positions of the selected scenarios.
+"""
+	num = len( probabilities )
+	nearest = [ float('inf') ] * num   # distance to the nearest selected
+	selected = list()
+	unselected = set( xrange( num ))
+	while unselected and len( selected ) < budget:
+		best, best_cost = None, None
+		for u in unselected:
+			du = dist[ u ]
+			cost = sum( probabilities[ k ] * min( nearest[ k ], du[ k ] )
+			  for k in unselected if k != u )
+			if best is None or cost < best_cost:
+				best, best_cost = u, cost
+
+		selected.append( best )
+		unselected.remove( best )
+		dbest = dist[ best ]
+		for k in unselected:
+			nearest[ k ] = min( nearest[ k ], dbest[ k ] )
+
+	return selected
+
+
+def backward_reduction ( probabilities, dist, budget ):
+	"""\
+Backward reduction (Dupacova et al.): starting with all, repeatedly remove the
+scenario whose probability times distance to its nearest remaining scenario is
+least, until budget scenarios remain.  Return the positions of those that
+remain.
+"""
+	remaining = set( xrange( len( probabilities )))
+
+	def nearest_to ( l ):
+		dl = dist[ l ]
+		return min( (j for j in remaining if j != l), key=lambda j: dl[ j ])
+
+	# per scenario, its nearest remaining scenario; only those whose nearest
+	# is removed need look again
+	nearest = dict( (l, nearest_to( l )) for l in remaining )
+	while len( remaining ) > max( 1, budget ):
+		worst = min( remaining,
+		  key=lambda l: probabilities[ l ] * dist[ l ][ nearest[ l ]])
+		remaining.remove( worst )
+		del nearest[ worst ]
+		for l in remaining:
+			if worst == nearest[ l ] and len( remaining ) > 1:
+				nearest[ l ] = nearest_to( l )
+
+	return sorted( remaining )
+
+
+def redistribute ( probabilities, dist, selected ):
+	"""\
+Return ({ position : probability }, distance): the probability of each
+unselected scenario moved to its nearest selected scenario, and the resulting
+(Kantorovich) distance between the original and the reduced distributions.
+"""
+	new = dict( (s, probabilities[ s ]) for s in selected )
+	distance = 0.0
+	for k in xrange( len( probabilities )):
+		if k in new: continue
+		dk = dist[ k ]
+		nearest = min( selected, key=lambda s: dk[ s ])
+		new[ nearest ] += probabilities[ k ]
+		distance += probabilities[ k ] * dk[ nearest ]
+
+	return new, distance
+
+
+def sample_scenarios ( probabilities, budget, seed=None ):
+	"""\
+Draw budget scenarios, with replacement, per probabilities, and return
+{ position : probability }, the fraction of the draws of each drawn scenario.
+"""
+	from bisect import bisect
+	from random import Random
+
+	cumulative, total = list(), 0.0
+	for prob in probabilities:
+		total += prob
+		cumulative.append( total )
+
+	rng = Random( seed )
+	new = dict()
+	for i in xrange( budget ):
+		k = min( bisect( cumulative, rng.random() * total ), len( cumulative ) -1 )
+		new[ k ] = new.get( k, 0.0 ) + 1.0 / budget
+
+	return new
+
+
+def reduce_tree ( tree, budget, method='forward', seed=None ):
+	"""\
+Return (tree, report): a tree of at most budget scenarios, chosen from those of
+tree by method -- 'forward' (fast forward selection), 'backward' (backward
+reduction), or 'sample' (Monte Carlo sampling) -- and a description of the
+probability mass moved.  Selection and reduction compare every pair of
+scenarios, so their effort grows with the square of the number of scenarios;
+sampling does not compare scenarios at all.
+"""
+	leaves, probabilities, vectors = scenario_vectors( tree )
+	if len( leaves ) <= budget:
+		msg = 'Scenario reduction: the tree has only {} scenarios; none removed.\n'
+		return tree, msg.format( len( leaves ))
+
+	distance = None
+	if 'sample' == method:
+		del vectors
+		new = sample_scenarios( probabilities, budget, seed )
+		name = 'sampling'
+	elif method in ('forward', 'backward'):
+		dist = _distance_matrix( vectors )
+		del vectors
+		if 'forward' == method:
+			selected = forward_selection( probabilities, dist, budget )
+			name = 'fast forward selection'
+		else:
+			selected = backward_reduction( probabilities, dist, budget )
+			name = 'backward reduction'
+		new, distance = redistribute( probabilities, dist, selected )
+	else:
+		msg = ("Unknown scenario_reduction method '{}'.  Choose one of "
+		  "'forward', 'backward', or 'sample'.")
+		raise ValueError( msg.format( method ))
+
+	# The mass moved is the total variation between the distributions
+	moved = 0.5 * sum(
+	  abs( new.get( k, 0.0 ) - prob ) for k, prob in enumerate( probabilities ))
+
+	report = ('\nScenario reduction ({}): kept {} of {} scenarios; moved '
+	  'probability mass {:.6g}').format( name, len( new ), len( leaves ), moved )
+	if distance is not None:
+		report += '; (relative L1) distance {:.6g}'.format( distance )
+	report += '\n'
+
+	reduced = tree.reduced(
+	  dict( (leaves[ k ], prob) for k, prob in new.iteritems() ))
+	return reduced, report
+
+
+def _stage_variables ( stochasticset, wildcards=False ):
+	"""\
+Yield (stochastic element, stage variable names) for each element of
+stochasticset, after a single pass over the model's flow variables.  With
+wildcards, name each variable family with one PySP wildcard index where that
+is the same set of variables; e.g., V_FlowOut[2010,*,*,*,*,*,*].
+"""
+	# XXX: Absolute hack, that currently only works for Temoa models.  I have
+	# not yet thought about how to make this generic.  Can it be done?
+
+	flow_keys = dict( (se, list()) for se in stochasticset )
+	for index in instance.V_FlowOut.keys():
+		if index[0] in flow_keys:
+			flow_keys[ index[0] ].append( index )
+
+	capacity_keys = dict()
+	if wildcards:
+		for t, v in instance.V_Capacity.keys():
+			capacity_keys.setdefault( v, set() ).add( (t, v) )
+
+	flow_fmt = '[{},{},{},{},{},{},{}]'
+	for se in stochasticset:  # se = "stochastic element"
+		keys = flow_keys.pop( se )
+		processes = set( (t, v) for p, s, d, i, t, v, o in keys if v == se )
+
+		if wildcards:
+			# V_FlowIn and V_FlowOut share the index set FlowVar_psditvo
+			flows = ( '[{},*,*,*,*,*,*]'.format( se ), ) if keys else ()
+		else:
+			flows = sorted( flow_fmt.format( *index ) for index in keys )
+
+		stage_vars = [ 'V_FlowIn' + f for f in flows ]
+		stage_vars.extend( 'V_FlowOut' + f for f in flows )
+		if wildcards and processes and processes == capacity_keys.get( se ):
+			stage_vars.append( 'V_Capacity[*,{}]'.format( se ))
+		else:
+			stage_vars.extend(
+			  sorted( 'V_Capacity[{},{}]'.format( *index )
+			    for index in processes ))
+
+		yield se, stage_vars
+
+
+def write_scenario_file ( stochasticset, tree, wildcards=False ):
+	"""\
+Write ScenarioStructure.dat, the description of tree that PySP reads.  The
+stage variable sets, which may be hundreds of MB for a large model, are
+streamed to the file one stage at a time.
+"""
+	( scenarios,
+	  nodes,
+	  nodestage,
+	  children,
+	  probability,
+	) = tree.get_scenario_data()
+
+	child_fmt     = 'set  Children[%s]  :=\n  %s\n\t;\n'
+	scenario_fmt  = 'S%(i)s  Rs%(i)s'
+	stages_fmt    = 'set  StageVariables[s{}]  :='
+	stagecost_fmt = 's%s StochasticPointCost[%s]'
+
+	leaves      = '\n  '.join( scenario_fmt % {'i' : i} for i in scenarios )
+	nodes       = '\n  '.join( nodes )
+	nodestage   = '\n  '.join( ('   '.join(ns) for ns in nodestage) )
+	scenarios   = 'S%s' % '\n  S'.join( scenarios )
+	stagecost   = '\n  '.join( stagecost_fmt % (s, s) for s in stochasticset )
+	stages      = '\n  s'.join( str(se) for se in stochasticset )
+
+	probability = '\n  '.join(
+	  ('  '.join(str(i) for i in p) for p in probability)
+	)
+	children    = '\n'.join(
+	  child_fmt % (c[0], '\n  '.join(c[1]) )
+	  for c in children
+	)
+
+	header = """\
+set  Stages  :=
+  s%(stages)s
+	;
+
+set  Scenarios  :=
+  %(scenarios)s
+	;
+
+set  Nodes  :=
+  %(nodes)s
+	;
+
+%(children_sets)s
+
+"""
+
+	footer = """
+
+param  NodeStage  :=
+  %(nodestage)s
+	;
+
+param  ConditionalProbability  :=
+  %(cond_prob)s
+	;
+
+param  ScenarioLeafNode  :=
+  %(leaves)s
+	;
+
+param  StageCostVariable  :=
+  %(stagecost)s
+	;
+
+param  ScenarioBasedData  :=  False ;
+"""
+
+	with open( 'ScenarioStructure.dat', 'w' ) as f:
+		f.write( header % dict(
+		  stages        = stages,
+		  scenarios     = scenarios,
+		  nodes         = nodes,
+		  children_sets = children,
+		))
+
+		separator = ''
+		for se, stage_vars in _stage_variables( stochasticset, wildcards ):
+			f.write( separator + stages_fmt.format( se ))
+			f.writelines( '\n  ' + v for v in stage_vars )
+			f.write( '\n\t;' )
+			separator = '\n\n'
+
+		f.write( footer % dict(
+		  nodestage     = nodestage,
+		  cond_prob     = probability,
+		  leaves        = leaves,
+		  stagecost     = stagecost
+		))
+
+
+class Branching ( object ):
+	"""\
+How the event tree branches.  At each stochastic point, a node branches into
+the nodes of branches(); each node applies the rates of its decision() to its
+parent's values.  At any other point of the stochastic set, a node has a
+single child, 'HedgingStrategy', with a conditional probability of 1 and no
+decision.
+
+A custom strategy subclasses Branching, and the options file names it:
+
+  branching = MyBranching   # a subclass of Branching
+"""
+
+	root_name = 'Root'
+
+	def __init__ ( self, opts ):
+		self.opts = opts
+
+	def branches ( self, name ):
+		"""\
+Return the branches below the node name, as a sequence of (name, conditional
+probability).
+"""
+		raise NotImplementedError
+
+	def decision ( self, name, parent, prob ):
+		"""\
+Return the key, per parameter, of a node's rates in the options' rates dict,
+or None if the node does not vary its parent's values.
+"""
+		raise NotImplementedError
+
+
+class HomogeneousBranching ( Branching ):
+	"""\
+Every stochastic node branches into all of the options' types, each with the
+conditional probability of conditional_probability[ type ], and each varies
+by rates[ param ][ type ].
+"""
+
+	def branches ( self, name ):
+		cprob = self.opts.conditional_probability
+		return [ (d, cprob[ d ]) for d in self.opts.types ]
+
+	def decision ( self, name, parent, prob ):
+		if prob < 1:
+			return name
+		return None
+
+
+class MarkovBranching ( Branching ):
+	"""\
+A non-homogeneous Markov tree: a node named name branches as listed in
+conditional_probability[ name ], a sequence of (type, conditional probability),
+and a node of type t below a node named n varies by rates[ param ][ n + t ].
+"""
+
+	root_name = 'HedgingStrategy'
+
+	def branches ( self, name ):
+		return self.opts.conditional_probability[ name ]
+
+	def decision ( self, name, parent, prob ):
+		if 'HedgingStrategy' == name:
+			return None
+		return '{}{}'.format( parent, name )
+
+
+def _create_tree ( tree, stochasticset, spoints, **kwargs ):
+	name   = kwargs.get('name')
+	bname  = kwargs.get('bname')
+	parent = kwargs.get('parent')
+	prob   = kwargs.get('prob')
+	branching = kwargs.get('branching')
+
+	try:
+		spoint = stochasticset.pop() # stochastic point, use of pop implies ordering
+	except:
+		SE.write('\nError: mismatch in specified stochastic set.  Does '
+		  'stochastic_points match the dat file?')
+		raise
+
+	node = tree.add_node( name, kwargs.get('parent_node'), spoint, prob,
+	  branching.decision( name, parent, prob ), bname )
+	global node_count
+	node_count += 1
+	inform( '\b' * (len(str(node_count -1))+1) + str(node_count) + ' ' )
+
+	if spoint not in spoints:
+		kwargs.update(
+		  name  = 'HedgingStrategy',
+		  parent = name,
+		  parent_node = node,
+		  bname = '%ss0' % bname,
+		  prob  = 1,
+		)
+		_create_tree( tree, stochasticset[:], spoints, **kwargs )
+	elif stochasticset:
+		decisions = enumerate( branching.branches( name ))
+		bname = '%ss%%d' % bname  # the format for the basename of the file
+		for enum, (d, prob) in decisions:
+			kwargs.update(
+			  name  = d,
+			  parent = name,
+			  parent_node = node,
+			  bname = bname % enum,
+			  prob  = prob,
+			)
+			_create_tree( tree, stochasticset[:], spoints, **kwargs )
+
+	return node
+
+
+def create_tree ( stochasticset, spoints, opts, branching, store_values=True ):
+	tree = ScenarioTree( stochasticset, opts.rates, opts.stochastic_indices,
+	  store_values )
+
+	stochasticset.reverse()
+	spoints.sort()
+	spoints.reverse()
+
+	kwargs = dict(
+	  name      = branching.root_name,
+	  parent    = '',
+	  parent_node = -1,
+	  bname     = 'R',
+	  branching = branching,
+	  prob      = 1,  # conditional probability, but root guaranteed to occur
+	)
+	_create_tree( tree, stochasticset, spoints, **kwargs )
+	return tree
+
+
+def inform ( x ):
+	global verbose
+	if verbose:
+		SE.write( x )
+		SE.flush()
+
+
+def setup_directory ( dname, force ):
+	if os.path.exists( dname ):
+		if os.path.isdir( dname ):
+			files = os.listdir( dname )
+			if files and not force:
+				msg = ('Not empty: {}\n\nIf you want to use this directory anyway, '
+				   "set 'force = True' in the options.py file.")
+				raise Warning( msg.format(dname) )
+
+			# would be potentially useful to put this into a thread to speed up
+			# the process.  like 'mv somedir to_del; rm -rf to_del &'
+			rmtree( dname )
+			os.mkdir( dname )
+		else:
+			msg = 'Error - already exists: {}'
+			raise NameError( msg.format(dname))
+	else:
+		os.mkdir( dname )
+
+
+
+
+def test_model_parameters ( M, opts ):
+	try:
+		getattr(M, opts.stochasticset)
+	except:
+		msg = ('Whoops!  The stochastic set is not available from the model.  '
+		   'Did you perhaps typo the name?\n'
+		   '  Model name: {}\n'
+		   '  Stochastic name: {}')
+		raise ValueError( msg.format(M.name, opts.stochasticset))
+
+	try:
+		for pname in opts.rates:
+			param = getattr(M, pname)
+	except:
+		msg = ('Whoops!  Parameter not available from the model.  Have you '
+		   'perhaps typoed the name?\n'
+		   '  Model name: {}\n'
+		   '  Parameter name: {}')
+		raise ValueError( msg.format(M.name, pname) )
+
+
+def usage ( ):
+	SE.write("""
+synopsis: pyomo_python  {0}  <options_to_import.py>
+
+Example: pyomo_python  {0}  options/utopia_coal_vs_nuc.py
+
+For information about the options_to_import.py file, please see
+options/README.txt
+""".format( sys.argv[0] )
+	)
+
+	raise SystemExit
+
+def main ( default_branching ):
+	from os import getcwd
+	from os.path import abspath, basename, dirname
+	from time import clock
+
+	if len(sys.argv) < 2:
+		usage()
+	module_name = sys.argv[1][:-3].replace('/', '.')  # remove the '.py'
+
+	mbase = basename( module_name )[:-3]
+	mdir  = abspath( dirname( module_name ))
+	sys.path.insert(0, mdir)
+
+	try:
+		__import__(module_name)
+		opts = sys.modules[ module_name ]
+		sys.path.pop(0)
+
+	except ImportError:
+		msg = ('Unable to import {}.\n\nRun this script with no arguments for '
+		       'more information.\n')
+		SE.write( msg.format( sys.argv[1] ) )
+		raise
+
+	try:
+		opts.dirname
+	except AttributeError:
+		opts.dirname = module_name.split('.')[-1]
+
+	global verbose
+	verbose = opts.verbose
+
+	cwd = getcwd()
+
+	begin = clock()
+	duration = lambda: clock() - begin
+
+	inform( '[      ] Setting up working directory (%s)' % opts.dirname )
+	setup_directory( opts.dirname, opts.force )
+	inform( '\r[%6.2f\n' % duration() )
+
+	inform( '[      ] Import model definition (%s)' % opts.modelpath )
+	mp = opts.modelpath
+	modelbase = basename(mp)[:-3]
+	modeldir  = abspath( dirname( mp ))
+
+	sys.path.insert(0, modeldir)
+	_temp = __import__(modelbase, globals(), locals(), ('model',))
+	M = _temp.model
+	del _temp
+	sys.path.pop(0)
+
+	test_model_parameters( M, opts )
+
+	inform( '\r[%6.2f\n' % duration() )
+
+	inform( '[      ] Create concrete instance (%s)' % opts.dotdatpath )
+	ins = M.create( opts.dotdatpath )
+	inform( '\r[%6.2f\n' % duration() )
+
+	global instance
+	instance = ins
+
+	inform( '[      ] Collecting stochastic points from model (%s)' % M.name )
+	all_spoints = sorted( getattr(ins, opts.stochasticset).value )
+	try:
+		spoints = list(opts.stochastic_points)
+	except AttributeError:
+		spoints = all_spoints
+
+	inform( '\r[%6.2f\n' % duration() )
+
+	os.chdir( opts.dirname )
+	inform( '[      ] Building tree:                          ')
+	branching = getattr( opts, 'branching', default_branching )( opts )
+	export = getattr( opts, 'export_dat_files', True )
+	tree = create_tree( all_spoints[:], spoints[:], opts, branching, export )  # give an intentional copy
+	inform( '\r[%6.2f\n' % duration() )
+	warn_unmatched_rates()
+
+	budget = getattr( opts, 'scenario_budget', None )
+	if budget:
+		inform( '[      ] Reducing scenarios to at most %d' % budget )
+		tree, report = reduce_tree( tree, budget,
+		  getattr( opts, 'scenario_reduction', 'forward' ),
+		  getattr( opts, 'scenario_seed', None ))
+		inform( '\r[%6.2f\n' % duration() )
+		SE.write( report )
+
+	global node_count
+	node_count = 0
+
+	if export:
+		inform( '[      ] Writing scenario "dot dat" files:       ')
+		tree.write_dat_files( getattr( opts, 'jobs', None ),
+		  getattr( opts, 'delta_dat_files', False ))
+		done = '\r[%6.2f] Writing scenario "dot dat" files\n'
+	else:
+		# The node files are written on request, from the saved tree; e.g., by
+		# the ECIU analysis (temoa_model --eciu)
+		inform( '[      ] Saving tree for on-demand "dot dat" files')
+		NodeDataProvider( tree ).save( 'ScenarioTree.pickle' )
+		done = '\r[%6.2f\n'
+	write_scenario_file( all_spoints, tree,
+	  getattr( opts, 'stage_variable_wildcards', False ))
+	inform( done % duration() )
+
+	os.chdir( cwd )
+	inform( '[      ] Copying ReferenceModel.dat as scenario tree root' )
+	copyfile( opts.dotdatpath, '%s/ReferenceModel.dat' % opts.dirname)
+	copyfile( opts.dotdatpath, '%s/R.dat' % opts.dirname)
+	inform( '\r[%6.2f\n' % duration() )
+
+
+def run ( default_branching ):
+	"""\
+The entry point of the generate_scenario_tree scripts: build and write the
+tree per the options file in sys.argv[1], and with default_branching unless
+the options file names another.
+"""
+	try:
+		main( default_branching )
+	except Exception, e:
+		if '--debug' in sys.argv:
+			raise
+
+		msg = ('\n\nIf you need more verbose (potentially helpful) information '
+		      'about this error, you can run this program again, and add the'
+		      ' "--debug" command line flag.\n')
+		msg = '\n\n' + str(e) + msg
+		SE.write(msg)
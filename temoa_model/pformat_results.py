@@ -27,6 +27,11 @@ from sys import stderr as SE, stdout as SO
 
 from pyomo.core import value
 
+from temoa_lib import (
+  ActivityExpression, ActivityByPeriodAndProcessExpression,
+  CapacityAvailableExpression
+)
+
 def stringify_data ( data, ostream=SO, format='plain' ):
 	# data is a list of tuples of ('var_name[index]', value)
 	#  data must be a list, as this function replaces each row,
@@ -47,7 +52,13 @@ def stringify_data ( data, ostream=SO, format='plain' ):
 
 
 
-def pformat_results ( pyomo_instance, pyomo_result ):
+def pformat_results ( pyomo_instance, pyomo_result, slice_map=None ):
+	"""\
+Format the solution of pyomo_instance for human consumption.  If the time
+slices were clustered before the solve (see --cluster_seasons), slice_map maps
+each solved slice back to the original slices it represents, and the
+slice-indexed variables are reported over the original slices.
+"""
 	from pyomo.core import Objective, Var, Constraint
 
 	output = StringIO()
@@ -104,14 +115,22 @@ def pformat_results ( pyomo_instance, pyomo_result ):
 	MPL = m.ModelProcessLife
 	x   = 1 + GDR    # convenience variable, nothing more
 
-	for p, s, d, t, v in m.V_Activity:
-		val = value( m.V_Activity[p, s, d, t, v] )
+	# The bookkeeping variables may have been eliminated from the model (see
+	# --presolve), so iterate over their index sets and reconstruct the values
+	def original_slices ( s, d ):
+		if slice_map is None:
+			return (((s, d), 1),)
+		return slice_map[ s, d ]
+
+	for p, s, d, t, v in m.ActivityVar_psdtv:
+		val = value( ActivityExpression( m, p, s, d, t, v ))
 		if abs(val) < epsilon: continue
 
-		svars['V_Activity'][p, s, d, t, v] = val
+		for (S_s, S_d), frac in original_slices( s, d ):
+			svars['V_Activity'][p, S_s, S_d, t, v] = val * frac
 
-	for p, t, v in m.V_ActivityByPeriodAndProcess:
-		val = value( m.V_ActivityByPeriodAndProcess[p, t, v] )
+	for p, t, v in m.ActivityByPeriodAndProcessVar_ptv:
+		val = value( ActivityByPeriodAndProcessExpression( m, p, t, v ))
 		if abs(val) < epsilon: continue
 
 		svars['V_ActivityByPeriodAndProcess'][p, t, v] = val
@@ -122,8 +141,8 @@ def pformat_results ( pyomo_instance, pyomo_result ):
 
 		svars['V_Capacity'][t, v] = val
 
-	for p, t in m.V_CapacityAvailableByPeriodAndTech:
-		val = value( m.V_CapacityAvailableByPeriodAndTech[p, t] )
+	for p, t in m.CapacityAvailableVar_pt:
+		val = value( CapacityAvailableExpression( m, p, t ))
 		if abs(val) < epsilon: continue
 
 		svars['V_CapacityAvailableByPeriodAndTech'][p, t] = val
@@ -132,7 +151,8 @@ def pformat_results ( pyomo_instance, pyomo_result ):
 		val = value( m.V_FlowIn[p, s, d, i, t, v, o] )
 		if abs(val) < epsilon: continue
 
-		svars['V_FlowIn'][p, s, d, i, t, v, o] = val
+		for (S_s, S_d), frac in original_slices( s, d ):
+			svars['V_FlowIn'][p, S_s, S_d, i, t, v, o] = val * frac
 
 		psvars['V_EnergyConsumptionByTech'               ][ t ]     += val
 		psvars['V_EnergyConsumptionByPeriodAndTech'      ][p, t]    += val
@@ -145,7 +165,8 @@ def pformat_results ( pyomo_instance, pyomo_result ):
 		val = value( m.V_FlowOut[p, s, d, i, t, v, o] )
 		if abs(val) < epsilon: continue
 
-		svars['V_FlowOut'][p, s, d, i, t, v, o] = val
+		for (S_s, S_d), frac in original_slices( s, d ):
+			svars['V_FlowOut'][p, S_s, S_d, i, t, v, o] = val * frac
 		psvars['V_ActivityByInputAndTech'          ][i, t]       += val
 		psvars['V_ActivityByPeriodAndTech'         ][p, t]       += val
 		psvars['V_ActivityByTechAndOutput'         ][t, o]       += val
@@ -214,7 +235,7 @@ def pformat_results ( pyomo_instance, pyomo_result ):
 		psvars[ 'V_DiscountedPeriodCost'          ][ p ]  += fcost
 
 	for p, t, v in m.CostVariable.sparse_iterkeys():
-		vcost = value( m.V_ActivityByPeriodAndProcess[p, t, v] )
+		vcost = value( ActivityByPeriodAndProcessExpression( m, p, t, v ))
 		if abs(vcost) < epsilon: continue
 
 		vcost *= value( m.CostVariable[p, t, v] )
@@ -0,0 +1,463 @@
+"""
+Temoa - Tools for Energy Model Optimization and Analysis
+  linear optimization; least cost; dynamic system visualization
+
+Copyright (C) 2011-2014  Kevin Hunter, Joseph DeCarolis
+
+This program is free software: you can redistribute it and/or modify it under
+the terms of the GNU Affero General Public License as published by the Free
+Software Foundation, either version 3 of the License, or (at your option) any
+later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+PARTICULAR PURPOSE.  See the GNU Affero General Public License for more details.
+
+Developers of this script will check out a complete copy of the GNU Affero
+General Public License in the file COPYING.txt.  Users uncompressing this from
+an archive may not have received this license file.  If not, see
+<http://www.gnu.org/licenses/>.
+"""
+
+__all__ = ('solve_benders',)
+
+from copy import deepcopy
+from sys import stderr as SE, stdout as SO
+
+import multiprocessing as MP
+
+from pyomo.core import (
+  Constraint, ConstraintList, NonNegativeReals, Objective, Param, Suffix, Var,
+  minimize, value
+)
+
+from temoa_lib import (
+  TemoaError, TemoaInfeasibleError, TemoaValidationError, SetSolverLimits,
+  SolveWithProgress, dataportal_set, dataportal_param
+)
+from temoa_rules import PeriodCapitalCost_rule, PeriodOperatingCost_rule
+
+
+# The only decisions that link the periods of Temoa are the capacity
+# decisions.  The master problem therefore keeps V_Capacity and the
+# constraints that involve nothing else, while each period's subproblem keeps
+# the flows, activity, and the constraints upon them.
+
+# Components of the operational (per-period) part of the model, and therefore
+# not part of the master problem.
+_operational_components = (
+  'V_FlowIn',
+  'V_FlowOut',
+  'V_Activity',
+  'V_ActivityByPeriodAndProcess',
+  'ActivityConstraint',
+  'ActivityByPeriodAndProcessConstraint',
+  'CapacityConstraint',
+  'DemandConstraint',
+  'DemandActivityConstraint',
+  'ProcessBalanceConstraint',
+  'CommodityBalanceConstraint',
+  'ResourceExtractionConstraint',
+  'BaseloadDiurnalConstraint',
+  'StorageConstraint',
+  'TechInputSplitConstraint',
+  'TechOutputSplitConstraint',
+  'EmissionLimitConstraint',
+)
+
+# Components that constrain only the capacity decisions, and are therefore
+# solely the responsibility of the master problem.
+_capacity_components = (
+  'ExistingCapacityConstraint',
+  'MinCapacityConstraint',
+  'MaxCapacityConstraint',
+  'GrowthRateConstraint',
+  'CapacityAvailableByPeriodAndTechConstraint',
+  'V_CapacityAvailableByPeriodAndTech',
+)
+
+
+def _delete_components ( M, names ):
+	for name in names:
+		if hasattr( M, name ):
+			delattr( M, name )
+
+
+##############################################################################
+# Master problem
+
+def BendersMasterCost_rule ( M ):
+	"""\
+The capital (loan and fixed) costs of the capacity decisions, plus the
+estimate (BendersTheta) of the operating cost of each period, as bounded from
+below by the optimality cuts of the subproblems.
+"""
+	return sum(
+	  PeriodCapitalCost_rule( M, p ) + M.BendersTheta[ p ]
+	  for p in M.time_optimize
+	)
+
+
+def CreateMasterModel ( M ):
+	"""\
+Convert the abstract Temoa model M into the Benders master problem: remove
+the operational components, and replace the objective with the capital costs
+plus one operating cost estimate per period.
+"""
+	_delete_components( M, _operational_components + ('TotalCost',) )
+
+	# Operating costs are non-negative, so 0 is a valid initial bound, and
+	# keeps the first master problem bounded.
+	M.BendersTheta = Var( M.time_optimize, domain=NonNegativeReals )
+	M.BendersCuts  = ConstraintList()
+
+	M.TotalCost = Objective( rule=BendersMasterCost_rule, sense=minimize )
+
+	return M
+
+
+##############################################################################
+# Subproblems
+
+def BendersLink_Constraint ( M, t, v ):
+	"""\
+A subproblem may use at most the capacity the master problem installed.  The
+shortfall variable keeps the subproblem feasible for any master decision, at
+a penalty, so that every iteration yields an optimality cut.  The dual of this
+constraint is the marginal operating value of another unit of capacity.
+"""
+	expr = (
+	  M.V_Capacity[t, v] - M.V_BendersShortfall[t, v] <= M.BendersCapacity[t, v]
+	)
+	return expr
+
+
+def CreateSubproblemModel ( period, penalty, presolve=False ):
+	"""\
+Return an abstract Temoa model of the operation of a single period, given the
+(mutable) capacity decisions of the master problem in BendersCapacity.  The
+objective is the operating cost of the period, discounted to the period
+itself, plus the penalty for any capacity shortfall.
+"""
+	from temoa_model import temoa_create_model
+	from temoa_lib import EliminateDefinitionalVariables
+
+	M = temoa_create_model()
+	if presolve:
+		EliminateDefinitionalVariables( M )
+
+	_delete_components( M, _capacity_components + ('TotalCost',) )
+
+	M.BendersCapacity = Param( M.CapacityVar_tv, mutable=True, default=0 )
+	M.V_BendersShortfall = Var( M.CapacityVar_tv, domain=NonNegativeReals )
+
+	M.BendersLinkConstraint = Constraint(
+	  M.CapacityVar_tv, rule=BendersLink_Constraint )
+
+	def SubproblemCost_rule ( M ):
+		shortfall = sum( M.V_BendersShortfall[tv] for tv in M.CapacityVar_tv )
+		return PeriodOperatingCost_rule( M, period ) + penalty * shortfall
+
+	M.TotalCost = Objective( rule=SubproblemCost_rule, sense=minimize )
+	M.dual = Suffix( direction=Suffix.IMPORT )
+
+	return M
+
+
+def _load_data ( model, options ):
+	from pyomo.core import DataPortal
+
+	modeldata = DataPortal( model=model )
+	for fname in options.dot_dat:
+		modeldata.load( filename=fname )
+
+	if options.cluster_seasons:
+		# deterministic, so every process arrives at the same representatives
+		from temoa_clustering import ClusterTimeSeasons
+		ClusterTimeSeasons( modeldata, options.cluster_seasons )
+
+	return modeldata
+
+
+def _subproblem_worker ( connection, periods, penalty, options ):
+	"""\
+Create and then repeatedly solve the subproblems of periods, as directed by
+the master process through connection.  Each request is a tuple of
+(period, { (t, v) : capacity }); each response is either
+
+  ('ok', period, objective, operating_cost, shortfall, { (t, v) : dual })
+
+or ('error', period, message).  A request of None ends the worker.
+"""
+	import traceback
+
+	from pyomo.core import DataPortal
+	from pyomo.opt import SolverFactory
+	from temoa_myopic import restrict_data_to_window
+
+	instances = dict()
+	operating = dict()   # { period : operating cost expression }
+	try:
+		opt = SolverFactory( options.solver )
+		SetSolverLimits( opt, options.solver, options.time_limit, options.mip_gap )
+
+		# read the data files only once; every subproblem starts from a copy
+		modeldata = _load_data( CreateSubproblemModel( periods[0], penalty ), options )
+		base = deepcopy( modeldata.data() )
+
+		time_future = sorted( dataportal_set( modeldata, 'time_future' ))
+		efficiency = dataportal_param( modeldata, 'Efficiency' )
+
+		for p in periods:
+			future_end = time_future[ time_future.index( p ) +1 ]
+
+			# Every process that the master might have built before p is
+			# "existing" for the subproblem.  The value is a placeholder; the
+			# actual capacity is BendersCapacity.
+			built = dict(
+			  ((t, v), 1)
+			  for i, t, v, o in efficiency
+			  if v in time_future[:-1] and v < p
+			)
+
+			model = CreateSubproblemModel( p, penalty, options.presolve )
+			modeldata = DataPortal( model=model )
+			restrict_data_to_window( modeldata, base, [p], future_end, built )
+
+			instances[ p ] = model.create( modeldata )
+
+			# Build the cost expression now: each create resets the process
+			# caches of temoa_lib (InitializeProcessParameters), from which
+			# the rules read with --presolve, to the data of that period.
+			operating[ p ] = PeriodOperatingCost_rule( instances[ p ], p )
+
+	except Exception:
+		connection.send(( 'error', periods, traceback.format_exc() ))
+		return
+
+	connection.send(( 'ready', periods ))
+
+	while True:
+		request = connection.recv()
+		if request is None:
+			break
+
+		p, capacities = request
+		try:
+			instance = instances[ p ]
+			for tv in instance.CapacityVar_tv:
+				instance.BendersCapacity[ tv ] = capacities.get( tv, 0 )
+			instance.preprocess()
+
+			results = opt.solve( instance )
+			instance.load( results )
+
+			if 'infeasible' in str( results['Solver'] ):
+				msg = ('The operational subproblem of period {} is infeasible, '
+				  'even with unlimited capacity.  Does the full model solve?')
+				connection.send(( 'error', p, msg.format( p ) ))
+				continue
+
+			duals = dict(
+			  (tv, instance.dual[ instance.BendersLinkConstraint[ tv ]])
+			  for tv in instance.CapacityVar_tv
+			)
+			shortfall = sum(
+			  value( instance.V_BendersShortfall[ tv ])
+			  for tv in instance.CapacityVar_tv
+			)
+			connection.send((
+			  'ok', p, value( instance.TotalCost ),
+			  value( operating[ p ] ), shortfall, duals
+			))
+
+		except Exception:
+			connection.send(( 'error', p, traceback.format_exc() ))
+
+
+##############################################################################
+# Driver
+
+def solve_benders (
+  model, optimizer, options, tolerance=1e-4, max_iterations=100,
+  penalty=1e6, epsilon=1e-6
+):
+	"""\
+Solve the model by Benders (L-shaped) decomposition over its periods.  The
+master problem decides V_Capacity; given those decisions, the operation of
+each period is an independent LP.  The subproblems are solved in parallel by
+a set of worker processes, each of which creates the instances of its periods
+once and thereafter only updates their capacities.  Each subproblem solve
+adds an optimality cut to the master problem, until the lower bound (the
+master objective) and upper bound (the best complete solution found) are
+within the relative tolerance.
+"""
+	from time import clock
+
+	opt = optimizer              # for us lazy programmer types
+
+	if not opt:
+		SE.write( '\r---------- Not solving: no available solver\n' )
+		return
+
+	tolerance = getattr( options, 'benders_tolerance', None ) or tolerance
+	max_iterations = getattr( options, 'benders_iterations', None ) or max_iterations
+
+	for fname in options.dot_dat:
+		if fname[-4:] != '.dat':
+			msg = "\n\nExpecting a dot dat (e.g., data.dat) file, found '{}'\n"
+			raise TemoaValidationError( msg.format( fname ))
+
+	begin = clock()
+	duration = lambda: clock() - begin
+
+	SE.write( '[        ] Creating Benders master problem.'); SE.flush()
+	if options.presolve:
+		from temoa_lib import EliminateDefinitionalVariables
+		EliminateDefinitionalVariables( model )
+	CreateMasterModel( model )
+	master = model.create( _load_data( model, options ))
+	SE.write( '\r[%8.2f\n' % duration() )
+
+	periods = sorted( master.time_optimize )
+	P_0 = periods[ 0 ]
+	GDR = value( master.GlobalDiscountRate )
+
+	# Subproblems discount to their own period; the master to the first.
+	scale = dict( (p, (1 + GDR) ** (P_0 - p)) for p in periods )
+
+	num_workers = min( options.jobs or MP.cpu_count(), len( periods ))
+	owner = dict()
+	workers = list()
+	for w in xrange( num_workers ):
+		owned = periods[ w::num_workers ]
+		parent_end, child_end = MP.Pipe()
+		proc = MP.Process(
+		  target=_subproblem_worker,
+		  args=(child_end, owned, penalty, options)
+		)
+		proc.start()
+		workers.append( (proc, parent_end) )
+		for p in owned:
+			owner[ p ] = parent_end
+
+	def receive ( connection ):
+		response = connection.recv()
+		if 'error' == response[0]:
+			msg = '\nBenders subproblem (period {}) failed:\n{}'
+			raise TemoaError( msg.format( response[1], response[2] ))
+		return response
+
+	try:
+		SE.write( '[        ] Creating subproblems ({} worker processes).'
+		  .format( num_workers ))
+		SE.flush()
+		for proc, connection in workers:
+			receive( connection )
+		SE.write( '\r[%8.2f\n' % duration() )
+
+		lower, upper = float('-inf'), float('inf')
+		best = None
+		history = list()
+
+		for iteration in xrange( 1, max_iterations +1 ):
+			result = SolveWithProgress( opt, master, options )
+			master.load( result )
+			if 'infeasible' in str( result['Solver'] ):
+				msg = ('The Benders master problem is infeasible.  The capacity '
+				  'constraints (e.g., Min/MaxCapacity, GrowthRate, '
+				  'ExistingCapacity) cannot all be met.')
+				raise TemoaInfeasibleError( msg )
+
+			lower = max( lower, value( master.TotalCost ))
+
+			capacities = dict(
+			  (tv, max( value( master.V_Capacity[ tv ] ), 0 ))
+			  for tv in master.V_Capacity
+			)
+			capital = dict(
+			  (p, value( PeriodCapitalCost_rule( master, p ))) for p in periods )
+
+			for p in periods:
+				owner[ p ].send(( p, capacities ))
+
+			operating, shortfall = dict(), dict()
+			for p in periods:
+				ok, p_, objective, op_cost, short, duals = receive( owner[ p ] )
+				s = scale[ p_ ]
+				operating[ p_ ] = (s * op_cost, s * objective)
+				shortfall[ p_ ] = short
+
+				cut_rhs = s * objective + sum(
+				  s * duals[ tv ] * (master.V_Capacity[ tv ] - capacities[ tv ])
+				  for tv in duals
+				  if tv in capacities and duals[ tv ]
+				)
+				master.BendersCuts.add( master.BendersTheta[ p_ ] >= cut_rhs )
+
+			candidate = sum( capital.values() ) + sum(
+			  penalized for op_cost, penalized in operating.values() )
+			if candidate < upper:
+				upper = candidate
+				best = (capacities, capital, operating, shortfall)
+
+			gap = (upper - lower) / max( abs( upper ), epsilon )
+			history.append( (iteration, lower, upper, gap, duration()) )
+			msg = ('[%8.2f] Benders iteration %d: lower bound %s, upper bound %s, '
+			  'gap %.4g%%\n')
+			SE.write( msg % (duration(), iteration, lower, upper, 100 * gap) )
+
+			if gap <= tolerance:
+				break
+
+			master.preprocess()   # include the new cuts
+
+		else:
+			msg = ('\nWarning: Benders decomposition did not converge to within '
+			  '{:g} in {} iterations.  Reporting the best solution found.\n')
+			SE.write( msg.format( tolerance, max_iterations ))
+
+	finally:
+		for proc, connection in workers:
+			try:
+				connection.send( None )
+			except (IOError, EOFError):
+				pass
+		for proc, connection in workers:
+			proc.join()
+
+	_write_report( best, history, periods, P_0, epsilon )
+
+
+def _write_report ( best, history, periods, P_0, epsilon ):
+	capacities, capital, operating, shortfall = best
+
+	total = sum( capital.values() ) + sum(
+	  op_cost for op_cost, penalized in operating.values() )
+
+	SO.write( '\n# Benders decomposition\n' )
+	SO.write( '  iteration  lower bound  upper bound  gap  seconds\n' )
+	for iteration, lower, upper, gap, seconds in history:
+		SO.write( '  {}  {}  {}  {:.4g}%  {:.2f}\n'.format(
+		  iteration, lower, upper, 100 * gap, seconds ))
+
+	SO.write( '\nObjective function value (TotalCost): {}\n'.format( total ))
+
+	SO.write( '\n# Cost of each period, discounted to {}\n'.format( P_0 ))
+	SO.write( '  period  capital  operating\n' )
+	for p in periods:
+		SO.write( '  {}  {}  {}\n'.format( p, capital[ p ], operating[ p ][0] ))
+
+	SO.write( '\n# Capacity decisions\n' )
+	for (t, v) in sorted( capacities ):
+		cap = capacities[ t, v ]
+		if cap < epsilon: continue
+		SO.write( '  {:>14.8g}   V_Capacity[{},{}]\n'.format( cap, t, v ))
+
+	short = dict( (p, val) for p, val in shortfall.iteritems() if val > epsilon )
+	if short:
+		msg = ('\nWarning: the reported solution leaves some periods short of '
+		  'capacity: {}.  The data may be infeasible, or the shortfall penalty '
+		  'may be too low for the costs of this model.\n')
+		SE.write( msg.format( ', '.join(
+		  '{} ({:g})'.format( p, short[ p ]) for p in sorted( short ))))
@@ -0,0 +1,297 @@
+"""
+Temoa - Tools for Energy Model Optimization and Analysis
+  linear optimization; least cost; dynamic system visualization
+
+Copyright (C) 2011-2014  Kevin Hunter, Joseph DeCarolis
+
+This program is free software: you can redistribute it and/or modify it under
+the terms of the GNU Affero General Public License as published by the Free
+Software Foundation, either version 3 of the License, or (at your option) any
+later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+PARTICULAR PURPOSE.  See the GNU Affero General Public License for more details.
+
+Developers of this script will check out a complete copy of the GNU Affero
+General Public License in the file COPYING.txt.  Users uncompressing this from
+an archive may not have received this license file.  If not, see
+<http://www.gnu.org/licenses/>.
+"""
+
+__all__ = ('ClusterTimeSeasons',)
+
+from collections import defaultdict
+from cStringIO import StringIO
+from math import fsum, sqrt
+
+from temoa_lib import (
+  TemoaValidationError, dataportal_set, dataportal_set_update,
+  dataportal_param, dataportal_param_update
+)
+
+
+# Every flow, activity, and slice-indexed constraint in Temoa is indexed by
+# the full cross product of time_season and time_of_day, so the only way to
+# shrink the grid while keeping that structure is to reduce one of the two
+# sets.  We reduce time_season: with hourly data, a "season" is generally a
+# day, and clustering days into representative days leaves the chronology
+# within each day -- upon which BaseloadDiurnal_Constraint and
+# Storage_Constraint rely -- untouched.
+
+
+def _season_features ( seasons, times, SegFrac, DSD, CFT, CFP ):
+	"""\
+Return a dict of { season : [feature, ...] }, and a parallel list of the name
+of the group (SegFrac, DemandSpecificDistribution, CapacityFactor) from which
+each feature column came.  Each column is scaled by its largest absolute value
+so that no one parameter dominates the distance calculation merely because of
+its units.
+"""
+	columns = list()   # (group, getter)
+
+	for d in times:
+		columns.append(('SegFrac', lambda s, d=d: SegFrac.get( (s, d), 0 )))
+
+	demands = sorted(set( dem for s, d, dem in DSD ))
+	for dem in demands:
+		for d in times:
+			columns.append((
+			  'DemandSpecificDistribution',
+			  lambda s, d=d, dem=dem: DSD.get( (s, d, dem), 0 )
+			))
+
+	techs = sorted(set( t for s, d, t in CFT ))
+	for t in techs:
+		for d in times:
+			columns.append((
+			  'CapacityFactor',
+			  lambda s, d=d, t=t: CFT.get( (s, d, t), 1 )
+			))
+
+	processes = sorted(set( (t, v) for s, d, t, v in CFP ))
+	for t, v in processes:
+		for d in times:
+			columns.append((
+			  'CapacityFactor',
+			  lambda s, d=d, t=t, v=v: CFP.get( (s, d, t, v), CFT.get((s, d, t), 1))
+			))
+
+	features = dict( (s, [get( s ) for group, get in columns]) for s in seasons )
+	groups = [ group for group, get in columns ]
+
+	for col in xrange( len( columns )):
+		scale = max( abs( features[ s ][ col ] ) for s in seasons )
+		if not scale: continue
+		for s in seasons:
+			features[ s ][ col ] /= float( scale )
+
+	return features, groups
+
+
+def _distance2 ( a, b ):
+	return sum( (x - y) ** 2 for x, y in zip( a, b ))
+
+
+def _kmeans ( seasons, features, weights, k, max_iterations=100 ):
+	"""\
+A weighted k-means, with a deterministic farthest-point initialization so that
+the same data always results in the same clusters.  Returns a dict of
+{ season : cluster number } and the list of cluster centroids.
+"""
+	# initialization: start from the "heaviest" season, and repeatedly add the
+	# season farthest from all current centers
+	first = max( seasons, key=lambda s: (weights[ s ], s) )
+	centers = [ list( features[ first ] ) ]
+	while len( centers ) < k:
+		far = max( seasons, key=lambda s: (
+		  weights[ s ] * min( _distance2( features[ s ], c ) for c in centers ),
+		  s
+		))
+		centers.append( list( features[ far ] ))
+
+	assignment = dict()
+	for iteration in xrange( max_iterations ):
+		new_assignment = dict(
+		  (s, min( xrange( k ), key=lambda c: _distance2( features[ s ], centers[c] )))
+		  for s in seasons
+		)
+		if new_assignment == assignment:
+			break
+		assignment = new_assignment
+
+		for c in xrange( k ):
+			members = [ s for s in seasons if assignment[ s ] == c ]
+			if not members: continue   # keep the old center for an empty cluster
+			total = fsum( weights[ s ] for s in members ) or float( len(members) )
+			centers[ c ] = [
+			  fsum( (weights[ s ] or 1) * features[ s ][ col ] for s in members ) / total
+			  for col in xrange( len( centers[ c ] ))
+			]
+
+	return assignment, centers
+
+
+def _weighted_mean ( values_and_weights ):
+	total = fsum( w for val, w in values_and_weights )
+	if not total:
+		return fsum( val for val, w in values_and_weights ) / len(values_and_weights)
+	return fsum( val * w for val, w in values_and_weights ) / total
+
+
+def ClusterTimeSeasons ( modeldata, num_clusters ):
+	"""\
+Reduce the time_season set of the (not yet instantiated) data in modeldata to
+num_clusters representative seasons.  Seasons are clustered by their SegFrac,
+DemandSpecificDistribution, and CapacityFactor{Tech,Process} profiles over the
+times of day, and each cluster is represented by its medoid season, which
+takes on the aggregate data of all the cluster's members:
+
+  - SegFrac, DemandDefaultDistribution, DemandSpecificDistribution: the sum of
+    the members' values, so that each still sums to 1 over all slices
+  - CapacityFactorTech, CapacityFactorProcess: the SegFrac-weighted mean of the
+    members' values, so that the energy a process may produce is unchanged
+
+Returns a tuple of (slice_map, report).  slice_map maps each representative
+slice back to the original slices:
+
+  { (rep_s, d) : (((s, d), fraction), ...) }
+
+where fraction is the share of the representative slice's SegFrac that
+belongs to original slice (s, d).  report is a human readable summary of the
+clustering error.
+"""
+	seasons = dataportal_set( modeldata, 'time_season' )
+	times   = dataportal_set( modeldata, 'time_of_day' )
+
+	if num_clusters < 1:
+		msg = 'The number of representative seasons must be at least 1.  Got: {}'
+		raise TemoaValidationError( msg.format( num_clusters ))
+
+	if num_clusters >= len( seasons ):
+		msg = ('Notice: Requested {} representative seasons, but the data only '
+		  'has {}.  Not clustering.\n')
+		return None, msg.format( num_clusters, len( seasons ))
+
+	SegFrac = dataportal_param( modeldata, 'SegFrac' )
+	DDD     = dataportal_param( modeldata, 'DemandDefaultDistribution' )
+	DSD     = dataportal_param( modeldata, 'DemandSpecificDistribution' )
+	CFT     = dataportal_param( modeldata, 'CapacityFactorTech' )
+	CFP     = dataportal_param( modeldata, 'CapacityFactorProcess' )
+
+	weights = dict(
+	  (s, fsum( SegFrac.get( (s, d), 0 ) for d in times ))
+	  for s in seasons
+	)
+
+	features, groups = _season_features( seasons, times, SegFrac, DSD, CFT, CFP )
+	assignment, centers = _kmeans( seasons, features, weights, num_clusters )
+
+	clusters = defaultdict( list )
+	for s in seasons:   # preserve the modeler's order of seasons
+		clusters[ assignment[ s ] ].append( s )
+
+	representative = dict()
+	for c, members in clusters.iteritems():
+		rep = min( members, key=lambda s: (_distance2( features[ s ], centers[c] ), s))
+		representative[ c ] = rep
+
+	new_SegFrac, new_DDD, new_DSD = dict(), dict(), dict()
+	new_CFT, new_CFP = dict(), dict()
+	slice_map = dict()
+
+	demands   = sorted(set( dem for s, d, dem in DSD ))
+	techs     = sorted(set( t for s, d, t in CFT ))
+	processes = sorted(set( (t, v) for s, d, t, v in CFP ))
+
+	for c, members in clusters.iteritems():
+		rep = representative[ c ]
+		for d in times:
+			seg = dict( (s, SegFrac.get( (s, d), 0 )) for s in members )
+			total = fsum( seg.values() )
+
+			new_SegFrac[ rep, d ] = total
+			slice_map[ rep, d ] = tuple(
+			  ((s, d), (seg[ s ] / total if total else 1.0 / len(members)))
+			  for s in members
+			)
+
+			if any( (s, d) in DDD for s in members ):
+				new_DDD[ rep, d ] = fsum(
+				  DDD.get( (s, d), SegFrac.get( (s, d), 0 )) for s in members )
+
+			for dem in demands:
+				if not any( (s, d, dem) in DSD for s in members ): continue
+				new_DSD[ rep, d, dem ] = fsum(
+				  DSD.get( (s, d, dem), 0 ) for s in members )
+
+			for t in techs:
+				new_CFT[ rep, d, t ] = _weighted_mean([
+				  (CFT.get( (s, d, t), 1 ), seg[ s ]) for s in members ])
+
+			for t, v in processes:
+				new_CFP[ rep, d, t, v ] = _weighted_mean([
+				  (CFP.get( (s, d, t, v), CFT.get( (s, d, t), 1 )), seg[ s ])
+				  for s in members
+				])
+
+	reps = [ s for s in seasons if s in representative.values() ]
+	dataportal_set_update( modeldata, 'time_season', reps )
+	dataportal_param_update( modeldata, 'SegFrac', new_SegFrac )
+	dataportal_param_update( modeldata, 'DemandDefaultDistribution', new_DDD )
+	dataportal_param_update( modeldata, 'DemandSpecificDistribution', new_DSD )
+	dataportal_param_update( modeldata, 'CapacityFactorTech', new_CFT )
+	dataportal_param_update( modeldata, 'CapacityFactorProcess', new_CFP )
+
+	report = _clustering_report(
+	  seasons, features, groups, weights, assignment, centers, clusters,
+	  representative
+	)
+
+	return slice_map, report
+
+
+def _clustering_report (
+  seasons, features, groups, weights, assignment, centers, clusters,
+  representative
+):
+	"""\
+The clustering error is reported per parameter group as the weighted RMS
+distance of each season's (scaled) profile from its cluster's centroid, and
+as the fraction of the total variance in the data not explained by the
+clusters (0 = perfect, 1 = no better than a single cluster).
+"""
+	num_cols = len( groups )
+	total_weight = fsum( weights[ s ] or 1 for s in seasons )
+	mean = [
+	  fsum( (weights[ s ] or 1) * features[ s ][ col ] for s in seasons ) / total_weight
+	  for col in xrange( num_cols )
+	]
+
+	within  = defaultdict( float )
+	overall = defaultdict( float )
+	for s in seasons:
+		w = weights[ s ] or 1
+		center = centers[ assignment[ s ]]
+		for col, group in enumerate( groups ):
+			within[ group ]  += w * (features[ s ][ col ] - center[ col ]) ** 2
+			overall[ group ] += w * (features[ s ][ col ] - mean[ col ]) ** 2
+
+	report = StringIO()
+	msg = ('Clustered {} seasons into {} representative seasons.\n'
+	  '  Clustering error, by parameter group (weighted RMS of scaled profiles;'
+	  ' unexplained variance):\n')
+	report.write( msg.format( len( seasons ), len( clusters )))
+
+	for group in sorted( within ):
+		rms = sqrt( within[ group ] / total_weight )
+		unexplained = within[ group ] / overall[ group ] if overall[ group ] else 0
+		report.write( '    {:<28s} {:8.4f}   {:6.2%}\n'.format(
+		  group, rms, unexplained ))
+
+	report.write( '  Representative seasons (and the seasons they represent):\n' )
+	for c in sorted( clusters, key=lambda c: representative[ c ] ):
+		report.write( '    {}: {}\n'.format(
+		  representative[ c ], ', '.join( str(s) for s in clusters[ c ] )))
+
+	return report.getvalue()
@@ -0,0 +1,1365 @@
+"""
+Temoa - Tools for Energy Model Optimization and Analysis
+  linear optimization; least cost; dynamic system visualization
+
+Copyright (C) 2011-2014  Kevin Hunter, Joseph DeCarolis
+
+This program is free software: you can redistribute it and/or modify it under
+the terms of the GNU Affero General Public License as published by the Free
+Software Foundation, either version 3 of the License, or (at your option) any
+later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+PARTICULAR PURPOSE.  See the GNU Affero General Public License for more details.
+
+Developers of this script will check out a complete copy of the GNU Affero
+General Public License in the file COPYING.txt.  Users uncompressing this from
+an archive may not have received this license file.  If not, see
+<http://www.gnu.org/licenses/>.
+"""
+
+__all__ = ('solve_true_cost_of_guessing',)
+
+from itertools import product as cross_product
+from sys import stderr as SE
+
+from pyomo.core import value
+
+from temoa_executor import MemoryBudget, format_memory, peak_memory
+from temoa_lib import (
+  TemoaError, TemoaInfeasibleError, PreprocessFixedVariables, SetSolverLimits,
+  iter_in_chunks
+)
+
+
+class ECIUResultStore ( object ):
+	"""\
+The results of the ECIU solves, keyed by (node, assumptions): the cost of the
+node and the values of its stage variables, as
+
+    (node_cost, {'var' : (array('I', ids), array('d', vals))})
+
+where ids are positions in the order of the variable family's indices given by
+ECIUContext.variable_order, and any omitted index has the value 0.  (Records
+imported from previous versions of Temoa have the form
+{'var' : (index, val, index, val ...)} instead.)
+
+The store is a SQLite database in write-ahead-log (WAL) mode, so that any
+number of solve processes may read it while one writes.  Each writer inserts
+only its own record, and each reader fetches only the record it needs; there
+is no per-node lock, and no rewriting of a node's entire history.
+
+The store also keeps a journal of the completed solves, (node, assumptions)
+of the solve and its seconds, so that an interrupted run may be resumed.  A
+solve is journaled only after all of its results have been stored.  Finally,
+it maps the fingerprint of each solve (see eciu_fingerprint) to the solve that
+produced it, so that solves of identical problems may reuse its results.
+
+A connection is opened lazily by each process that uses the store, as SQLite
+connections may not cross a fork.
+"""
+
+	__slots__ = ('path', '_connection', '_pid')
+
+	def __init__ ( self, path ):
+		self.path = path
+		self._connection = None
+		self._pid = None
+
+		con = self.connection()
+		con.execute( 'PRAGMA journal_mode=WAL' )
+		con.execute(
+		  'CREATE TABLE IF NOT EXISTS results ('
+		  '  node        TEXT NOT NULL,'
+		  '  assumptions TEXT NOT NULL,'
+		  '  cost        REAL NOT NULL,'
+		  '  variables   BLOB NOT NULL,'
+		  '  PRIMARY KEY (node, assumptions)'
+		  ')'
+		)
+		con.execute(
+		  'CREATE TABLE IF NOT EXISTS journal ('
+		  '  node        TEXT NOT NULL,'
+		  '  assumptions TEXT NOT NULL,'
+		  '  seconds     REAL NOT NULL,'
+		  '  PRIMARY KEY (node, assumptions)'
+		  ')'
+		)
+		con.execute(
+		  'CREATE TABLE IF NOT EXISTS fingerprints ('
+		  '  fingerprint TEXT NOT NULL PRIMARY KEY,'
+		  '  node        TEXT NOT NULL,'
+		  '  assumptions TEXT NOT NULL'
+		  ')'
+		)
+		con.commit()
+
+	def connection ( self ):
+		import os, sqlite3
+
+		if self._pid != os.getpid():
+			# generous timeout: writers wait on each other, not on readers
+			self._connection = sqlite3.connect( self.path, timeout=300 )
+			self._connection.execute( 'PRAGMA synchronous=NORMAL' )
+			self._pid = os.getpid()
+		return self._connection
+
+	def __getitem__ ( self, key ):
+		import cPickle as pickle
+
+		node, assumptions = key
+		row = self.connection().execute(
+		  'SELECT cost, variables FROM results WHERE node=? AND assumptions=?',
+		  (node, assumptions)
+		).fetchone()
+		if row is None:
+			raise KeyError( key )
+
+		cost, variables = row
+		return cost, pickle.loads( str( variables ))
+
+	def __setitem__ ( self, key, data ):
+		import cPickle as pickle, sqlite3
+
+		node, assumptions = key
+		cost, variables = data
+		variables = sqlite3.Binary( pickle.dumps( variables, pickle.HIGHEST_PROTOCOL ))
+
+		con = self.connection()
+		with con:    # a transaction: commit, or rollback on exception
+			con.execute(
+			  'INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)',
+			  (node, assumptions, cost, variables)
+			)
+
+	def __contains__ ( self, key ):
+		node, assumptions = key
+		row = self.connection().execute(
+		  'SELECT 1 FROM results WHERE node=? AND assumptions=?',
+		  (node, assumptions)
+		).fetchone()
+		return row is not None
+
+	def node_costs ( self, node ):
+		"""\
+Iterate over the (assumptions, cost) of node, sorted by assumptions, without
+loading the saved variables.
+"""
+		return self.connection().execute(
+		  'SELECT assumptions, cost FROM results WHERE node=? '
+		  'ORDER BY assumptions', (node,)
+		).fetchall()
+
+	def is_valid ( self, key ):
+		"""Return whether the record of key exists and can be loaded."""
+		from math import isnan, isinf
+
+		try:
+			cost, variables = self[ key ]
+		except Exception:
+			return False
+		return not (isnan( cost ) or isinf( cost )) and isinstance( variables, dict )
+
+	def record_task ( self, node, assumptions, seconds ):
+		"""Journal the solve of (node, assumptions) as complete."""
+		con = self.connection()
+		with con:
+			con.execute( 'INSERT OR REPLACE INTO journal VALUES (?, ?, ?)',
+			  (node, assumptions, seconds) )
+
+	def completed_tasks ( self ):
+		"""Return { (node, assumptions) : seconds } of the journaled solves."""
+		rows = self.connection().execute(
+		  'SELECT node, assumptions, seconds FROM journal' )
+		return { (node, assumptions) : seconds
+		         for node, assumptions, seconds in rows }
+
+	def forget_tasks ( self, tasks=None ):
+		"""Remove tasks (default: all solves) from the journal."""
+		con = self.connection()
+		with con:
+			if tasks is None:
+				con.execute( 'DELETE FROM journal' )
+			else:
+				con.executemany(
+				  'DELETE FROM journal WHERE node=? AND assumptions=?', tasks )
+
+	def fingerprint_source ( self, fingerprint ):
+		"""\
+Return the (node, assumptions) of the solve with fingerprint, or None.
+"""
+		row = self.connection().execute(
+		  'SELECT node, assumptions FROM fingerprints WHERE fingerprint=?',
+		  (fingerprint,)
+		).fetchone()
+		return tuple( map( str, row )) if row else None
+
+	def record_fingerprint ( self, fingerprint, node, assumptions ):
+		con = self.connection()
+		with con:
+			con.execute( 'INSERT OR REPLACE INTO fingerprints VALUES (?, ?, ?)',
+			  (fingerprint, node, assumptions) )
+
+	def forget_fingerprints ( self ):
+		con = self.connection()
+		with con:
+			con.execute( 'DELETE FROM fingerprints' )
+
+	def import_pickle ( self, node, fname ):
+		"""\
+Import the results of node from fname, a per-node pickle file as written by
+previous versions of Temoa, if the store does not already have them.
+"""
+		import cPickle as pickle
+
+		try:
+			with open( fname, 'rb' ) as f:
+				saved_data = pickle.load( f )
+		except (IOError, EOFError):
+			return
+
+		for assumptions, data in saved_data.iteritems():
+			if (node, assumptions) not in self:
+				self[ node, assumptions ] = data
+
+	def close ( self ):
+		import os
+
+		if self._connection is not None and self._pid == os.getpid():
+			self._connection.close()
+		self._connection = None
+
+
+class ScenarioInstanceCache ( object ):
+	"""\
+A least-recently-used cache of model instances, one per scenario (i.e., per
+assumed final node), each of which is constructed from the data files of the
+nodes along that scenario's path.  Each entry also remembers the variables
+that its last solve fixed, so that they may be released before the next, and
+the variables of each (stage, family) in the order of
+ECIUContext.variable_order, so that saved values need not be looked up index
+by index.
+"""
+
+	__slots__ = ('size', 'entries')
+
+	def __init__ ( self, size ):
+		from collections import OrderedDict
+
+		self.size = max( 1, size )
+		# { scenario : [instance, fixed vars, families, {(stage, vname) : vars}] }
+		self.entries = OrderedDict()
+
+	def __contains__ ( self, scenario ):
+		return scenario in self.entries
+
+	def get ( self, scenario, data_files ):
+		if scenario in self.entries:
+			entry = self.entries.pop( scenario )
+		else:
+			while len( self.entries ) >= self.size:
+				self.entries.popitem( last=False )
+			entry = [ _create_scenario_instance( data_files ), list(), set(), dict() ]
+
+		self.entries[ scenario ] = entry   # most recently used is last
+		return entry
+
+
+def _create_scenario_instance ( data_files ):
+	from temoa_lib import load_path_data
+	from temoa_model import temoa_create_model
+
+	model = temoa_create_model()
+	return model.create( load_path_data( model, data_files ))
+
+
+def load_node_data ( fname ):
+	"""\
+Load the NodeDataProvider that the scenario tree generator saves in place of
+the node dot dat files (see export_dat_files in stochastic/options/README.txt).
+"""
+	import cPickle, sys
+	from os.path import abspath, dirname, join
+
+	# The provider's class is that of the generator, in stochastic/
+	stochastic = join( dirname( dirname( abspath( __file__ ))), 'stochastic' )
+	if stochastic not in sys.path:
+		sys.path.append( stochastic )
+
+	with open( fname, 'rb' ) as f:
+		return cPickle.load( f )
+
+
+class ScenarioTreeTopology ( object ):
+	"""\
+The shape of a scenario tree, computed once from the PySP scenario structure
+and not modified thereafter.  Nodes have integer IDs in depth-first preorder
+(the root is 0), so that the descendants of node i are exactly the IDs
+range( i, end[ i ] ).  Per ID, there are arrays of the parent (-1 for the
+root), the depth, the conditional and unconditional probabilities, whether an
+ECIU assumption is made at the node (the root, and any node with siblings),
+and whether the node branches; and a precomputed tuple of the names along the
+path from the root, so that any subpath is a slice of it.
+
+The methods take and return node names; the ids mapping converts to IDs.
+Worker processes inherit the topology by fork.
+"""
+
+	__slots__ = ('names', 'ids', 'parent', 'depth', 'end', 'children',
+	  'conditional', 'probability', 'decides', 'branches', 'node_stage',
+	  'stages', 'leaves', 'paths')
+
+	def __init__ ( self, root, children, conditional, node_stage, stages ):
+		"""\
+children is { name : [child names] } of the non-leaf nodes, conditional is
+{ name : conditional probability }, node_stage is { name : stage }, and stages
+the ordered stage names.
+"""
+		from array import array
+
+		names = list()
+		parent = array( 'i' )
+		end = list()
+		paths = list()
+
+		# depth-first preorder, without recursion
+		to_process = [ (root, -1) ]
+		while to_process:
+			name, parent_id = to_process.pop()
+			if name is None:
+				end[ parent_id ] = len( names )
+				continue
+
+			node_id = len( names )
+			names.append( name )
+			parent.append( parent_id )
+			end.append( None )
+			if parent_id < 0:
+				paths.append( (name,) )
+			else:
+				paths.append( paths[ parent_id ] + (name,) )
+
+			to_process.append( (None, node_id) )
+			for child in sorted( children.get( name, () ), reverse=True ):
+				to_process.append( (child, node_id) )
+
+		self.names    = tuple( names )
+		self.ids      = { name : i for i, name in enumerate( names ) }
+		self.parent   = parent
+		self.end      = array( 'i', end )
+		self.paths    = tuple( paths )
+		self.depth    = array( 'i', ( len( path ) -1 for path in paths ))
+		self.children = tuple(
+		  tuple( self.ids[ c ] for c in sorted( children.get( name, () )))
+		  for name in names
+		)
+		self.conditional = array( 'd', ( conditional[ n ] for n in names ))
+
+		probability = array( 'd', self.conditional )
+		probability[ 0 ] = 1.0
+		for i in xrange( 1, len( names )):
+			probability[ i ] *= probability[ parent[ i ]]
+		self.probability = probability
+
+		self.decides = array( 'b', (
+		  i == 0 or self.conditional[ i ] < 1 for i in xrange( len( names ))))
+		self.branches = array( 'b', ( len( c ) > 1 for c in self.children ))
+
+		self.node_stage = tuple( node_stage[ n ] for n in names )
+		self.stages = tuple( stages )
+		self.leaves = tuple( i for i, c in enumerate( self.children ) if not c )
+
+	@classmethod
+	def from_pysp ( cls, s_structure ):
+		children = {
+		  node : list( s_structure.Children[ node ])
+		  for node in s_structure.Children
+		  if len( s_structure.Children[ node ] )
+		}
+
+		# The root is the only node that is no one's child
+		child_nodes = set( c for cs in children.itervalues() for c in cs )
+		root, = set( s_structure.Nodes ) - child_nodes
+
+		conditional = dict( (n, value( s_structure.ConditionalProbability[ n ]))
+		  for n in s_structure.Nodes )
+		node_stage = dict( (n, s_structure.NodeStage[ n ])
+		  for n in s_structure.Nodes )
+
+		return cls( root, children, conditional, node_stage, s_structure.Stages )
+
+	@property
+	def root ( self ):
+		return self.names[ 0 ]
+
+	def __len__ ( self ):
+		return len( self.names )
+
+	def path ( self, node ):
+		"""The names of the nodes from the root to node, inclusive."""
+		return self.paths[ self.ids[ node ]]
+
+	def index ( self, node ):
+		"""The position of node along any path through it; i.e., its depth."""
+		return self.depth[ self.ids[ node ]]
+
+	def stage ( self, node ):
+		return self.node_stage[ self.ids[ node ]]
+
+	def child_names ( self, node ):
+		return tuple( self.names[ c ] for c in self.children[ self.ids[ node ]] )
+
+	def leaf_names ( self, node=None ):
+		"""The names of the leaves under node (default: the root)."""
+		i = self.ids[ node ] if node is not None else 0
+		return tuple( self.names[ j ]
+		  for j in xrange( i, self.end[ i ] ) if not self.children[ j ] )
+
+
+class ECIUContext ( object ):
+	"""The read-only information every ECIU solve needs."""
+
+	__slots__ = ('options', 'topology', 'store', 'epsilon', 'variable_orders',
+	  'wildcards', 'file_digests', 'node_data')
+
+	def __init__ ( self, options, topology, s_structure, store, epsilon,
+	  node_data=None ):
+		self.options        = options
+		self.topology       = topology        # ScenarioTreeTopology
+		self.store          = store           # ECIUResultStore
+		self.epsilon        = epsilon
+		self.file_digests = dict()            # { fname : file_digest() }
+		self.node_data    = node_data         # NodeDataProvider, or None
+
+		# { stage : { vname : (index, ...) }}; computed here, so that the
+		# workers need not have the PySP structure object.  The stage variables
+		# given by wildcard (e.g., V_FlowOut[2010,*,*,*,*,*,*]) await a model
+		# instance, in { stage : { vname : [template, ...] }}.
+		self.variable_orders = dict()
+		self.wildcards = dict()
+		for stage in s_structure.Stages:
+			order, templates = _variable_order( s_structure.StageVariables[ stage ])
+			self.variable_orders[ stage ] = order
+			if templates:
+				self.wildcards[ stage ] = templates
+
+	def data_file ( self, node ):
+		"""\
+Return the name of node's dot dat file, first writing it from node_data if it
+does not yet exist.
+"""
+		from os.path import isfile
+
+		fname = node + '.dat'
+		if self.node_data is not None and not isfile( fname ):
+			if node in self.node_data:
+				self.node_data.write_dat_file( node )
+		return fname
+
+	def file_digest ( self, fname ):
+		"""Return the SHA-1 digest of the contents of the file fname."""
+		if fname not in self.file_digests:
+			from hashlib import sha1
+
+			digest = sha1()
+			with open( fname, 'rb' ) as f:
+				for block in iter( lambda: f.read( 1 << 20 ), '' ):
+					digest.update( block )
+			self.file_digests[ fname ] = digest.digest()
+
+		return self.file_digests[ fname ]
+
+	def variable_order ( self, stage, instance ):
+		"""\
+Return { vname : (index, ...) }, the stage variables of stage in the fixed
+order by which the store encodes their values.  Any wildcard stage variables
+are first expanded per the variables of instance; every instance of the model
+has the same variables, so every process arrives at the same order.
+"""
+		if stage in self.wildcards:
+			self.variable_orders[ stage ] = _expand_wildcards(
+			  self.variable_orders[ stage ], self.wildcards.pop( stage ), instance )
+
+		return self.variable_orders[ stage ]
+
+
+def _variable_order ( stage_vars ):
+	"""\
+Return ({ vname : (index, ...) }, { vname : [template, ...] }): the explicit
+stage variables, sorted, and the wildcard ones, whose index contains a '*'.
+"""
+	from collections import defaultdict
+
+	from pyomo.pysp.phutils import extractVariableNameAndIndex
+
+	indices = defaultdict( set )
+	templates = defaultdict( list )
+	for var_string in stage_vars:
+		vname, index = extractVariableNameAndIndex( var_string )
+		if isinstance( index, tuple ) and '*' in index:
+			templates[ vname ].append( index )
+		else:
+			indices[ vname ].add( index )
+
+	order = {
+	  vname : tuple( sorted( vindices ))
+	  for vname, vindices in indices.iteritems()
+	}
+	return order, dict( templates )
+
+
+def _expand_wildcards ( order, templates, instance ):
+	"""\
+Return order, with the indices of instance's variables that match templates
+merged in, and each family sorted again.
+"""
+	from itertools import izip
+
+	order = dict( (vname, set( indices )) for vname, indices in order.iteritems() )
+	for vname, vtemplates in templates.iteritems():
+		indices = order.setdefault( vname, set() )
+		vtemplates = [ tuple( str( e ) for e in t ) for t in vtemplates ]
+
+		for index in getattr( instance, vname ).keys():
+			if isinstance( index, tuple ):
+				key = tuple( str( k ) for k in index )
+			else:
+				key = (str( index ),)
+			for template in vtemplates:
+				if len( template ) != len( key ): continue
+				if all( '*' == t or t == k for t, k in izip( template, key )):
+					indices.add( index )
+					break
+
+	return {
+	  vname : tuple( sorted( vindices ))
+	  for vname, vindices in order.iteritems()
+	}
+
+
+def eciu_task_keys ( topology, this_node, this_assumptions ):
+	"""\
+Return the store keys that the ECIU solve of (this_node, this_assumptions)
+requires -- the saved results of each node before this_node along the
+assumed scenario -- and the keys that it produces -- the results of this_node
+and each node after it -- as a tuple of two lists of (node, assumptions).
+"""
+	ids, decides, branches = topology.ids, topology.decides, topology.branches
+
+	assumptions = this_assumptions.split(',')
+	assumed_fs = assumptions[-1]
+	assumptions = assumptions[:-1]
+
+	node_path = topology.path( assumed_fs )
+	node_index = topology.index( this_node )
+
+	# path_so_far includes nodes with CP of 1.
+	requires = list()
+	past_assumed = ''
+	i_assume = iter( assumptions )
+	for node in node_path[0:node_index]:
+		if decides[ ids[ node ]]:
+			assumed = next( i_assume )
+			if past_assumed:
+				past_assumed += ',' + assumed
+			else:
+				past_assumed += assumed
+		requires.append( (node, past_assumed) )
+
+	produces = list()
+	node_assumptions = this_assumptions
+	for node in node_path[node_index:]:
+		produces.append( (node, node_assumptions) )
+		if branches[ ids[ node ]]:
+			node_assumptions += ',' + assumed_fs
+
+	return requires, produces
+
+
+def _is_array_record ( values ):
+	from array import array
+
+	return len( values ) == 2 and isinstance( values[0], array )
+
+
+def eciu_fingerprint ( context, node_path, node_index, saved ):
+	"""\
+Return a digest of what determines the results of an ECIU solve: the contents
+of the data files along its scenario, the position along it of the node from
+which it solves, and the saved results (store key, record) that it fixes, in
+path order.  Solves with equal fingerprints are the same problem, whatever the
+names of their nodes, so one may reuse the results of the other.
+"""
+	from hashlib import sha1
+
+	topology = context.topology
+
+	digest = sha1()
+	digest.update( '{}\0{!r}\0{}\0'.format(
+	  context.options.solver, context.epsilon, node_index ))
+	for node in node_path:
+		digest.update( context.file_digest( context.data_file( node )))
+
+	for (node, past_assumed), (node_cost, var_values) in saved:
+		digest.update( topology.stage( node ) + '\0' )
+		for vname in sorted( var_values ):
+			values = var_values[ vname ]
+			digest.update( vname + '\0' )
+			if _is_array_record( values ):
+				ids, vals = values
+				digest.update( ids.tostring() + '\0' + vals.tostring() + '\0' )
+			else:
+				digest.update( repr( values ) + '\0' )
+
+	return digest.hexdigest()
+
+
+def solve_eciu_task (
+  context,
+  cache,              # ScenarioInstanceCache of this process
+  opt,                # the solver plugin of this process
+  solve_counts,
+  this_node,          # a string, representing which node in the tree
+  this_assumptions,   # Assumptions so far, comma separated, last one is
+                      # the assumptions to make from this_node
+):
+	"""\
+Solve the ECIU task (this_node, this_assumptions), and store its results.
+Return False if it instead reused the results of an identical solve.
+"""
+	from array import array
+	from itertools import izip
+
+	from temoa_rules import PeriodCost_rule
+
+	solve_num, num_solves = solve_counts
+	topology    = context.topology
+	store       = context.store
+	epsilon     = context.epsilon
+
+	try:
+		from setproctitle import setproctitle as setProcessTitle
+		msg = '({}/{}) Solving assumption: {}'
+		msg = msg.format( solve_num, num_solves, this_assumptions )
+		setProcessTitle( msg )
+		del msg
+	except ImportError, e:
+		pass
+
+	assumptions = this_assumptions.split(',')
+	assumed_fs = assumptions[-1]
+	assumptions = assumptions[:-1]
+
+	node_path = topology.path( assumed_fs )
+	requires, produces = eciu_task_keys( topology, this_node, this_assumptions )
+
+	msg = ("({}) Solving from node '{}', having assumed '{}' and assuming "
+	  "'{}'.\n")
+	SE.write( msg.format( solve_num, this_node, ','.join(assumptions),
+	   assumed_fs ))
+
+	saved = list()
+	for node, past_assumed in requires:
+		try:
+			saved.append(( (node, past_assumed), store[ node, past_assumed ] ))
+		except Exception:
+			msg = ( 'An exception, while loading {}[{}], from node {}, '
+			  ' with path_so_far {};  my_assumptions: {}\n')
+			msg = msg.format( node, past_assumed, this_node,
+			                  [n for n, a in requires], assumptions )
+			raise TemoaError( msg )
+
+	# If an identical problem has already been solved, copy its results.
+	fingerprint = eciu_fingerprint(
+	  context, node_path, topology.index( this_node ), saved )
+	source = store.fingerprint_source( fingerprint )
+	if source is not None:
+		src_requires, src_produces = eciu_task_keys( topology, *source )
+		if ( len( src_produces ) == len( produces ) and
+		     all( store.is_valid( key ) for key in src_produces )):
+			for src_key, key in izip( src_produces, produces ):
+				if src_key != key:
+					store[ key ] = store[ src_key ]
+
+			msg = "({}) Reused the identical solve from node '{}', assuming '{}'.\n"
+			SE.write( msg.format( solve_num, source[0], source[1] ))
+			return False
+
+	entry = cache.get( assumed_fs, [ context.data_file( n ) for n in node_path ])
+	m, fixed_vars, fixed_families, var_data = entry
+
+	# Release whatever the previous solve of this instance fixed.  Those
+	# families must be preprocessed again, whether or not this solve refixes
+	# them.
+	for v in fixed_vars:
+		v.fixed = False
+	del fixed_vars[:]
+	preprocess_families = set( fixed_families )
+	fixed_families.clear()
+
+	for (node, past_assumed), saved_data in saved:
+		# saved_data is a tuple of
+		#  (node_cost, {'var' : (array( ids ), array( vals ))})
+
+		node_cost, var_values = saved_data
+		stage = topology.stage( node )
+		order = context.variable_order( stage, m )
+
+		# Fix variables per what was saved previously
+		for vname, values in var_values.iteritems():
+			if not _is_array_record( values ):
+				# a record imported from a previous version of Temoa
+				m_var = getattr(m, vname)
+				for index, val in iter_in_chunks( values, 2 ):
+					v = m_var[ index ]
+					v.fixed = True
+					v.set_value( val )
+					fixed_vars.append( v )
+				fixed_families.add( vname )
+				continue
+
+			if (stage, vname) not in var_data:
+				m_var = getattr(m, vname)
+				var_data[ stage, vname ] = [ m_var[ i ] for i in order[ vname ]]
+			m_vars = var_data[ stage, vname ]
+
+			vals = [0] * len( m_vars )
+			for i, val in izip( *values ):
+				vals[ i ] = val
+
+			for v, val in izip( m_vars, vals ):
+				v.fixed = True
+				v.set_value( val )
+			fixed_vars.extend( m_vars )
+			fixed_families.add( vname )
+
+	# do the preprocess and solve.
+	PreprocessFixedVariables( m, preprocess_families | fixed_families )
+	results = opt.solve( m )
+	m.load( results )
+
+	if 'infeasible' in str( results['Solver'] ):
+		msg = ('Infeasible solve.  Node: {}, path_so_far {}; my_assumptions: '
+		  '{}')
+		msg = msg.format( this_node, [n for n, a in requires], assumptions )
+		raise TemoaInfeasibleError( msg )
+
+	# now, save the variables for any subsequent runs
+	for node, node_assumptions in produces:
+		stage = topology.stage( node )
+		order = context.variable_order( stage, m )
+
+		# Cheat, and assume some knowledge of the underlying data
+		#   This removes the leading s; e.g., s1990 -> 1990
+		period = int( stage[1:] )
+		node_cost = value( PeriodCost_rule( m, period ))
+
+		node_vars = dict()
+		for vname, indices in order.iteritems():
+			m_var = getattr(m, vname)
+			ids, vals = array( 'I' ), array( 'd' )
+			for i, index in enumerate( indices ):
+				try:
+					val = value( m_var[ index ] )
+				except:
+					if 'infeasible' in str( results['Solver'] ):
+
+						msg = ( '    ---> Solver found problem infeasible <---' )
+						SE.write( '\n' + msg + '\n\n')
+					raise
+				if val < epsilon:
+					# variables can't be negative, and they may be when within an
+					# epsilon of 0 (because the solver said "good enough").  Zero
+					# is implied by omission.
+					continue
+				ids.append( i )
+				vals.append( val )
+			node_vars[ vname ] = (ids, vals)
+
+		store[ node, node_assumptions ] = (node_cost, node_vars)
+
+	store.record_fingerprint( fingerprint, this_node, this_assumptions )
+	return True
+
+
+def _eciu_worker ( worker_id, tasks, results, context, cache_size ):
+	"""\
+The loop of a long-lived ECIU worker process: solve each task from the tasks
+queue, and report (worker_id, node, assumptions, seconds, whether it reused an
+identical solve, peak memory, error or None) to results.  A task of None ends
+the worker.
+"""
+	import traceback
+
+	from time import time
+
+	from pyomo.opt import SolverFactory
+
+	options = context.options
+	opt = SolverFactory( options.solver )
+	SetSolverLimits( opt, options.solver, options.time_limit, options.mip_gap )
+
+	cache = ScenarioInstanceCache( cache_size )
+
+	while True:
+		task = tasks.get()
+		if task is None:
+			break
+
+		solve_counts, node, assumptions = task
+		begin = time()
+		try:
+			reused = not solve_eciu_task(
+			  context, cache, opt, solve_counts, node, assumptions )
+			error = None
+		except TemoaError as e:
+			reused, error = False, e
+		except Exception:
+			reused, error = False, TemoaError( traceback.format_exc() )
+
+		results.put(( worker_id, node, assumptions, time() - begin, reused,
+		  peak_memory(), error ))
+
+
+class ECIUWorkerPool ( object ):
+	"""\
+A fixed number of long-lived worker processes, each of which caches the
+instances of the scenarios it most recently solved.  Tasks are (node,
+assumptions) pairs, each of which may depend on others; a task is dispatched
+as soon as all of its prerequisites have completed.  An idle worker preferably
+receives a ready task whose scenario it already has cached, so that most
+solves need only refix the stage variables, rather than construct a new
+instance.
+
+As a worker keeps its cached instances between tasks, the memory budget
+(see temoa_executor.MemoryBudget) accounts per worker: a worker becomes active
+with its first task, and thereafter holds the peak memory it last reported.
+Another worker becomes active only if the budget admits the largest peak of
+the active workers; until then, the active workers take all tasks.
+
+After run(), task_times holds a tuple of (node, assumptions, worker_id, ready,
+started, finished, solve seconds, reused) for each completed task, with the
+times in seconds from the start of the run.
+"""
+
+	def __init__ ( self, size, cache_size, context, max_memory=None ):
+		import multiprocessing as MP
+		from collections import OrderedDict
+
+		self.cache_size = cache_size
+		self.budget = MemoryBudget( size, max_memory )
+		self.results = MP.Queue()
+		self.processes = list()
+		self.queues = list()
+		self.cached = list()     # a mirror of each worker's cache
+		self.idle = list()
+		self.task_times = list()
+
+		for worker_id in xrange( size ):
+			tasks = MP.Queue()
+			args = (worker_id, tasks, self.results, context, cache_size)
+			proc = MP.Process( target=_eciu_worker, args=args )
+			proc.daemon = True
+			proc.start()
+
+			self.processes.append( proc )
+			self.queues.append( tasks )
+			self.cached.append( OrderedDict() )
+			self.idle.append( worker_id )
+
+	@staticmethod
+	def scenario ( task ):
+		node, assumptions = task
+		return assumptions.rsplit( ',', 1 )[-1]
+
+	def memory_estimate ( self ):
+		"""The largest peak memory of the active workers, or None."""
+		estimates = [ e for e in self.budget.holders.itervalues() if e ]
+		return max( estimates ) if estimates else None
+
+	def _available ( self ):
+		"""\
+Return the idle workers that may take a task: the active ones, and one more if
+the memory budget admits it.
+"""
+		available = [ w for w in self.idle if w in self.budget ]
+		if len( available ) < len( self.idle ):
+			if self.budget.admits( self.memory_estimate() ):
+				available.extend(
+				  [ w for w in self.idle if w not in self.budget ][:1] )
+		return available
+
+	def _assign ( self, pending, available ):
+		"""\
+Choose an available worker and a pending task for it, preferring a task whose
+scenario the worker has cached.  pending is { scenario : deque( tasks ) }.
+"""
+		for worker_id in available:
+			for scenario in reversed( self.cached[ worker_id ] ):
+				if scenario in pending:
+					break
+			else:
+				continue
+			break
+		else:
+			worker_id = available[ 0 ]
+			scenario = next( iter( pending ))
+
+		tasks = pending[ scenario ]
+		task = tasks.popleft()
+		if not tasks:
+			del pending[ scenario ]
+
+		self.idle.remove( worker_id )
+		if worker_id not in self.budget:
+			self.budget.acquire( worker_id, self.memory_estimate() )
+		cached = self.cached[ worker_id ]
+		cached.pop( scenario, None )
+		cached[ scenario ] = True
+		while len( cached ) > self.cache_size:
+			cached.popitem( last=False )
+
+		return worker_id, task
+
+	def run ( self, tasks, prerequisites=None ):
+		"""\
+Solve tasks, yielding each (node, assumptions) as it completes.  prerequisites
+is { task : [tasks] }, the tasks that must complete before each may start.  If
+any task fails, wait for the running tasks to finish and raise its error.
+"""
+		from collections import OrderedDict, defaultdict, deque
+		from time import time
+
+		if prerequisites is None:
+			prerequisites = dict()
+
+		begin = time()
+		ready_at = dict()
+		started_at = dict()
+
+		pending = OrderedDict()
+		def make_ready ( task ):
+			ready_at[ task ] = time() - begin
+			pending.setdefault( self.scenario( task ), deque() ).append( task )
+
+		waiting = dict()
+		dependents = defaultdict( list )
+		for task in tasks:
+			needs = set( prerequisites.get( task, () ))
+			if needs:
+				waiting[ task ] = needs
+				for prerequisite in needs:
+					dependents[ prerequisite ].append( task )
+			else:
+				make_ready( task )
+
+		num_solves = len( tasks )
+		solve_counter = 0
+		running = 0
+		error = None
+
+		while running or (pending and error is None):
+			while pending and error is None:
+				available = self._available()
+				if not available: break
+				worker_id, task = self._assign( pending, available )
+				node, assumptions = task
+				solve_counter += 1
+				started_at[ task ] = time() - begin
+				self.queues[ worker_id ].put(
+				  ((solve_counter, num_solves), node, assumptions) )
+				running += 1
+
+			worker_id, node, assumptions, seconds, reused, memory, task_error = \
+			  self.results.get()
+			running -= 1
+			self.idle.append( worker_id )
+			self.budget.acquire( worker_id, memory )
+
+			if task_error is not None:
+				error = error or task_error
+				continue
+
+			task = (node, assumptions)
+			self.task_times.append(( node, assumptions, worker_id,
+			  ready_at[ task ], started_at[ task ], time() - begin, seconds,
+			  reused ))
+
+			for dependent in dependents.pop( task, () ):
+				needs = waiting[ dependent ]
+				needs.discard( task )
+				if not needs:
+					del waiting[ dependent ]
+					make_ready( dependent )
+
+			yield node, assumptions
+
+		if error is not None:
+			raise error
+
+		if waiting:
+			msg = ('{} ECIU solves never became ready; their prerequisites form '
+			  'a cycle or are not among the tasks.  For example: {}')
+			raise TemoaError( msg.format( len( waiting ), next( iter( waiting ))))
+
+	def close ( self ):
+		for tasks in self.queues:
+			tasks.put( None )
+		for proc in self.processes:
+			proc.join()
+
+
+class ECIUProgress ( object ):
+	"""\
+Track the completed solves of each stage of an ECIU run, and periodically
+report to stderr the count, the throughput, and an estimate of the remaining
+time of each unfinished stage and of the run.
+"""
+
+	__slots__ = ('totals', 'done', 'begun', 'finished', 'interval',
+	  'last_report', 'reported')
+
+	def __init__ ( self, totals, interval=30 ):
+		from collections import OrderedDict
+
+		self.totals = OrderedDict( totals )   # { stage : number of solves }
+		self.done = dict.fromkeys( self.totals, 0 )
+		self.begun = dict()               # { stage : first start of a solve }
+		self.finished = 0
+		self.interval = interval
+		self.last_report = 0
+		self.reported = set()             # the completed stages already reported
+
+	def update ( self, stage, started, finished ):
+		"""\
+Count a completed solve of stage, that started and finished at the given
+seconds from the start of the run.
+"""
+		self.done[ stage ] += 1
+		self.begun[ stage ] = min( started, self.begun.get( stage, started ))
+		self.finished = max( finished, self.finished )
+
+		stage_complete = self.done[ stage ] == self.totals[ stage ]
+		if stage_complete or finished - self.last_report >= self.interval:
+			self.report()
+
+	@staticmethod
+	def _eta ( remaining, rate ):
+		if not remaining:
+			return 'done'
+		if not rate:
+			return 'unknown'
+		seconds = int( remaining / rate )
+		return '{}:{:02d}:{:02d}'.format(
+		  seconds // 3600, seconds // 60 % 60, seconds % 60 )
+
+	def report ( self ):
+		now = self.finished
+		self.last_report = now
+
+		msg = '  {:>10s}: {:5d} / {:5d} solves, {:7.3f} solves/s, ETA {}\n'
+		SE.write('\nECIU progress at {:.0f}s:\n'.format( now ))
+		for stage, total in self.totals.iteritems():
+			if stage not in self.begun or stage in self.reported: continue
+			done = self.done[ stage ]
+			if done == total:
+				self.reported.add( stage )
+			elapsed = now - self.begun[ stage ]
+			rate = float( done ) / elapsed if elapsed > 0 else 0
+			SE.write( msg.format( stage, done, total, rate,
+			  self._eta( total - done, rate )))
+
+		done, total = sum( self.done.values() ), sum( self.totals.values() )
+		rate = float( done ) / now if now > 0 else 0
+		SE.write( msg.format( 'all', done, total, rate,
+		  self._eta( total - done, rate )))
+		SE.flush()
+
+
+def write_task_times ( task_times, topology, fname ):
+	"""\
+Write the per-task timing of an ECIU run to the CSV file fname, and summarize
+it per stage to stderr.
+"""
+	import csv
+	from collections import defaultdict
+
+	by_stage = defaultdict( list )
+	with open( fname, 'wb' ) as f:
+		writer = csv.writer( f )
+		writer.writerow(( 'Node', 'Assumptions', 'Stage', 'Worker', 'Ready',
+		  'Started', 'Finished', 'Solve Seconds', 'Reused' ))
+		for node, assumptions, worker_id, ready, started, finished, seconds, \
+		  reused in task_times:
+			stage = topology.stage( node )
+			by_stage[ stage ].append(( ready, started, finished, seconds, reused ))
+			writer.writerow(( node, assumptions, stage, worker_id,
+			  '%.3f' % ready, '%.3f' % started, '%.3f' % finished,
+			  '%.3f' % seconds, int( reused ) ))
+
+	msg = ('  {:>10s}: {:5d} solves ({} reused), {:10.2f}s solving (longest '
+	  '{:.2f}s), mean wait {:.2f}s, from {:.2f}s to {:.2f}s\n')
+	SE.write('\nECIU solve times by stage:\n')
+	for stage in topology.stages:
+		if stage not in by_stage: continue
+		times = by_stage[ stage ]
+		seconds = [ t[3] for t in times ]
+		wait = sum( t[1] - t[0] for t in times ) / len( times )
+		reused = sum( 1 for t in times if t[4] )
+		SE.write( msg.format( stage, len( times ), reused, sum( seconds ),
+		  max( seconds ), wait, min( t[1] for t in times ),
+		  max( t[2] for t in times )))
+	SE.write('(Per-solve timing written to {})\n'.format( fname ))
+
+
+def write_eciu_results ( store, topology, outputs, summary ):
+	"""\
+Stream the ECIU results, breadth-first through the tree, as CSV rows to each
+file in outputs, and a JSON summary of each node to the file summary.  Rows
+are written as they are read from the store, and each node's summary is
+accumulated from its rows alone, so neither the results nor the summary are
+ever held in memory.
+
+A node's expected cost weights the cost of each assumption by the probability
+of each assumed scenario, given the node at which it was assumed; i.e., it is
+the expected cost of a planner who ignores uncertainty, but whose guesses
+follow the scenario probabilities.  Return the expected cost of ignoring
+uncertainty: the sum over nodes of the node's probability times its expected
+cost.
+"""
+	import csv, json
+	from collections import deque
+
+	ids, probability = topology.ids, topology.probability
+
+	def assumption_weight ( node, assumptions ):
+		# The assumptions were made at the root and each node with siblings
+		# along the path to node.
+		deciders = [ d for d in topology.path( node ) if topology.decides[ ids[ d ]]]
+
+		weight = 1.0
+		for decider, assumed in zip( deciders, assumptions.split(',') ):
+			weight *= probability[ ids[ assumed ]] / probability[ ids[ decider ]]
+		return weight
+
+	writers = [ csv.writer( f ) for f in outputs ]
+	def writerow ( row ):
+		for writer in writers:
+			writer.writerow( row )
+
+	writerow(('','','','"Previously Assumed" is a chronologically ordered list of assumptions made, up to "this" node',))
+	writerow(('At Node', 'Previously Assumed', 'Node Cost'))
+
+	summary.write( '{"nodes": [' )
+	separator = '\n'
+	eciu = 0.0
+
+	to_process = deque([ topology.root ])
+	last = topology.root            # for blank lines between stages
+	while to_process:
+		node = to_process.popleft()
+		if topology.index( node ) != topology.index( last ):
+			writerow( tuple() ) # blank line
+
+		records, weight, expected = 0, 0.0, 0.0
+		min_cost = max_cost = None
+		for assumption, node_cost in store.node_costs( node ):
+			writerow(( node, assumption, node_cost ))
+
+			w = assumption_weight( node, assumption )
+			records += 1
+			weight += w
+			expected += w * node_cost
+			min_cost = node_cost if min_cost is None else min( min_cost, node_cost )
+			max_cost = node_cost if max_cost is None else max( max_cost, node_cost )
+
+		if weight:
+			# normalize, in case some assumptions were not (yet) solved
+			expected /= weight
+			eciu += probability[ ids[ node ]] * expected
+		else:
+			expected = None
+
+		summary.write( separator + json.dumps({
+		  'node'          : node,
+		  'stage'         : topology.stage( node ),
+		  'probability'   : probability[ ids[ node ]],
+		  'records'       : records,
+		  'weight'        : weight,
+		  'min_cost'      : min_cost,
+		  'max_cost'      : max_cost,
+		  'expected_cost' : expected,
+		}, sort_keys=True ))
+		separator = ',\n'
+
+		to_process.extend( topology.child_names( node ))
+		last = node
+
+	summary.write( '\n],\n"expected_cost_of_ignoring_uncertainty": {}}}\n'
+	  .format( json.dumps( eciu )))
+
+	return eciu
+
+
+def solve_true_cost_of_guessing ( optimizer, options, epsilon=1e-6, cache_size=2 ):
+	import multiprocessing as MP
+
+	from collections import defaultdict
+	from os import getcwd, chdir
+	from os.path import isfile, abspath, join
+	from sys import stdout as SO
+
+	from pyomo.pysp.util.scenariomodels import scenario_tree_model
+
+	pwd = abspath( getcwd() )
+	chdir( options.eciu )
+	sStructure = scenario_tree_model.create( filename='ScenarioStructure.dat' )
+
+	topology = ScenarioTreeTopology.from_pysp( sStructure )
+
+	def build_minimal_solve_dict ( tree, node, last ):
+		""" Remove redundant solves """
+		assume = topology.leaf_names( node )
+		new_assume = assume
+		if last:
+			assume = tuple( sorted( ','.join(i)
+			  for i in cross_product( last, assume ))
+			)
+			new_assume = list()
+
+			for i, a in enumerate(assume):
+				items = a.split(',')
+				if items[ -1 ] != items[ -2 ]:
+					# This is the crux of the check: if the final two assumptions
+					# are the same, then the second is redundant.
+					new_assume.append( assume[i] )
+
+		tree[ node ] = tuple( new_assume )
+
+		children = topology.child_names( node )
+		while len( children ) == 1:
+			node = children[0]
+			children = topology.child_names( node )
+
+		for child in children:
+			build_minimal_solve_dict( tree, child, assume )
+
+	# Step 1: Find out what we need to solve
+	to_solve = dict()
+	build_minimal_solve_dict( to_solve, topology.root, () )
+
+	store = ECIUResultStore( 'eciu_results.sqlite' )
+
+	# Step 2: Bring forward the results of any previous (pickle-based) runs
+	for n in topology.names:
+		fname = n + '.pickle'
+		if isfile( fname ):
+			store.import_pickle( n, fname )
+
+
+	jobs_capacity = options.jobs or int( 1.5 * MP.cpu_count() )
+
+	# Step 3: Each (node, assumptions) solve is a task that depends on the
+	# tasks that produce the saved results it fixes.  Sorting by stage, then by
+	# the assumptions (last first) groups the solves of each scenario together,
+	# which the pool exploits to reuse instances.
+	def task_order ( task ):
+		node, assumptions = task
+		assumptions = assumptions.split(',')
+		assumptions.reverse()
+		return (len( assumptions ), assumptions, node)
+
+	tasks = sorted(
+	  ((n, a) for n in to_solve for a in to_solve[ n ]), key=task_order )
+
+	task_keys = dict()
+	for node, assumptions in tasks:
+		task_keys[ node, assumptions ] = eciu_task_keys(
+		  topology, node, assumptions )
+
+	# Step 4: With --resume, skip the journaled solves whose results are all
+	# intact.  Otherwise, start a new journal.
+	if options.resume:
+		completed = store.completed_tasks()
+		finished, partial = set(), list()
+		for task in tasks:
+			if task not in completed: continue
+			requires, produces = task_keys[ task ]
+			if all( store.is_valid( key ) for key in produces ):
+				finished.add( task )
+			else:
+				partial.append( task )
+		store.forget_tasks( partial )
+
+		msg = ('Resuming: {} of {} solves already complete; {} incomplete '
+		  'records to solve again.\n')
+		SE.write( msg.format( len( finished ), len( tasks ), len( partial )))
+		tasks = [ t for t in tasks if t not in finished ]
+	else:
+		# The previous run's fingerprints may be of a since-changed model
+		store.forget_tasks()
+		store.forget_fingerprints()
+
+	producers = dict()
+	for task in tasks:
+		requires, produces = task_keys[ task ]
+		for key in produces:
+			producers.setdefault( key, task )
+
+	prerequisites = dict()
+	for task in tasks:
+		requires, produces = task_keys[ task ]
+		needs = set()
+		for key in requires:
+			if key in producers:
+				needs.add( producers[ key ] )
+			elif key not in store:
+				msg = ('ECIU solve {} requires the results of node {} having '
+				  'assumed {}, but no solve produces them.')
+				raise TemoaError( msg.format( task, key[0], key[1] ))
+		prerequisites[ task ] = needs
+	del task_keys, producers
+
+	stage_totals = defaultdict( int )
+	for node, a in tasks:
+		stage_totals[ topology.stage( node )] += 1
+	progress = ECIUProgress(
+	  (s, stage_totals[ s ]) for s in topology.stages if s in stage_totals )
+
+	# A tree generated without export_dat_files: write each node's data file
+	# only when a solve needs it.
+	node_data = None
+	if isfile( 'ScenarioTree.pickle' ):
+		node_data = load_node_data( 'ScenarioTree.pickle' )
+
+	context = ECIUContext( options, topology, sStructure, store, epsilon,
+	  node_data )
+	pool = ECIUWorkerPool( jobs_capacity, cache_size, context, options.max_memory )
+
+	SE.write('\nThere are {} solves\n'.format( len( tasks )))
+	try:
+		for node, a in pool.run( tasks, prerequisites ):
+			started, finished, seconds = pool.task_times[-1][4:7]
+			store.record_task( node, a, seconds )
+			progress.update( topology.stage( node ), started, finished )
+
+	finally:
+		pool.close()
+		write_task_times( pool.task_times, topology, 'eciu_task_times.csv' )
+
+		msg = 'ECIU workers used: {} of {}; largest peak memory: {}\n'
+		SE.write( msg.format( len( pool.budget ), jobs_capacity,
+		  format_memory( pool.memory_estimate() )))
+
+	# Finally: let's marshal the results and give 'em to the modeler!
+	with open( 'eciu_results.csv', 'wb' ) as results, \
+	     open( 'eciu_summary.json', 'w' ) as summary:
+		eciu = write_eciu_results( store, topology, (SO, results), summary )
+
+	msg = ('\nExpected cost of ignoring uncertainty: {}\n(Results written to '
+	  '{}, and a per-node summary to {})\n')
+	SE.write( msg.format( eciu, join( options.eciu, 'eciu_results.csv' ),
+	  join( options.eciu, 'eciu_summary.json' )))
+	store.close()
+	chdir( pwd )
@@ -0,0 +1,179 @@
+"""
+Temoa - Tools for Energy Model Optimization and Analysis
+  linear optimization; least cost; dynamic system visualization
+
+Copyright (C) 2011-2014  Kevin Hunter, Joseph DeCarolis
+
+This program is free software: you can redistribute it and/or modify it under
+the terms of the GNU Affero General Public License as published by the Free
+Software Foundation, either version 3 of the License, or (at your option) any
+later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+PARTICULAR PURPOSE.  See the GNU Affero General Public License for more details.
+
+Developers of this script will check out a complete copy of the GNU Affero
+General Public License in the file COPYING.txt.  Users uncompressing this from
+an archive may not have received this license file.  If not, see
+<http://www.gnu.org/licenses/>.
+"""
+
+__all__ = ('MemoryBudget', 'current_memory', 'format_memory', 'parse_memory',
+  'peak_memory', 'run_processes')
+
+from sys import stderr as SE
+
+
+# The parallel parts of Temoa -- the ECIU solves, the Benders subproblems, and
+# the Graphviz diagrams -- share the limits of --jobs and --max_memory.  A
+# solver process for a large model may need many GiB, so the number of cores
+# alone is a poor guide to how many may safely run at once.  Memory is
+# accounted per holder (a process, or a long-lived worker), by an estimate
+# that the caller refines as it observes the actual use.
+
+_memory_units = {
+  '' : 1024 ** 2,   # a plain number is MiB
+  'K': 1024,
+  'M': 1024 ** 2,
+  'G': 1024 ** 3,
+  'T': 1024 ** 4,
+}
+
+
+def parse_memory ( text ):
+	"""\
+Convert a memory size -- e.g., '512M', '16G', '1.5T', or a plain number of
+MiB -- to bytes.  Suitable as an argparse type.
+"""
+	import argparse, re
+
+	match = re.match( r'^\s*([\d.]+)\s*([KMGT]?)i?B?\s*$', str( text ), re.I )
+	if not match:
+		msg = "invalid memory size: '{}' (e.g., 512M, 16G)".format( text )
+		raise argparse.ArgumentTypeError( msg )
+
+	number, unit = match.groups()
+	return int( float( number ) * _memory_units[ unit.upper() ])
+
+
+def format_memory ( size ):
+	if size is None:
+		return 'unknown'
+	return '{:.1f} GiB'.format( size / float( 1024 ** 3 ))
+
+
+def current_memory ( ):
+	"""\
+Return the resident memory of this process, in bytes.  Where /proc is not
+available, return its peak resident memory instead.
+"""
+	import os
+
+	try:
+		with open( '/proc/self/statm' ) as f:
+			resident = int( f.read().split()[1] )
+		return resident * os.sysconf( 'SC_PAGE_SIZE' )
+	except (IOError, OSError, ValueError, IndexError):
+		return peak_memory( children=False )
+
+
+def peak_memory ( children=True ):
+	"""\
+Return the peak resident memory, in bytes, of this process or (with children)
+of any of its completed child processes -- e.g., an external solver --
+whichever is larger.
+"""
+	import resource, sys
+
+	# ru_maxrss is in KiB on Linux, and in bytes on OS X
+	scale = 1 if 'darwin' == sys.platform else 1024
+
+	peak = resource.getrusage( resource.RUSAGE_SELF ).ru_maxrss
+	if children:
+		peak = max( peak, resource.getrusage( resource.RUSAGE_CHILDREN ).ru_maxrss )
+	return peak * scale
+
+
+class MemoryBudget ( object ):
+	"""\
+Admission control by count and by estimated memory.  Each holder -- a running
+process, or a long-lived worker that keeps its memory between tasks --
+acquires its estimated memory, and releases it when done.  A new holder is
+admitted while there are fewer than jobs holders, and while the estimates of
+all holders, plus its own, fit within max_memory.
+
+A holder with an unknown (None) estimate is admitted only if there are no
+other holders, and the first holder is always admitted, even if it alone
+exceeds max_memory, so that work always progresses.
+"""
+
+	__slots__ = ('jobs', 'max_memory', 'holders', 'warned')
+
+	def __init__ ( self, jobs, max_memory=None ):
+		self.jobs = max( 1, jobs )
+		self.max_memory = max_memory
+		self.holders = dict()      # { key : estimate }
+		self.warned = False
+
+	def __len__ ( self ):
+		return len( self.holders )
+
+	def __contains__ ( self, key ):
+		return key in self.holders
+
+	def used ( self ):
+		return sum( e for e in self.holders.itervalues() if e is not None )
+
+	def admits ( self, estimate ):
+		if len( self.holders ) >= self.jobs:
+			return False
+		if not self.holders or self.max_memory is None:
+			return True
+		if estimate is None:
+			return False
+		return self.used() + estimate <= self.max_memory
+
+	def acquire ( self, key, estimate ):
+		"""Add a holder, or update the estimate of an existing holder."""
+		self.holders[ key ] = estimate
+
+		if self.max_memory is not None and not self.warned:
+			if self.used() > self.max_memory:
+				self.warned = True
+				msg = ('\nWarning: the estimated memory in use ({}) exceeds '
+				  '--max_memory ({}).  No further processes will start until '
+				  'some finish.\n')
+				SE.write( msg.format( format_memory( self.used() ),
+				  format_memory( self.max_memory )))
+
+	def release ( self, key ):
+		self.holders.pop( key, None )
+
+
+def run_processes ( tasks, budget, poll=0.1 ):
+	"""\
+Run each of tasks, a list of (target, args, estimated memory), in a separate
+process, starting each in order as soon as budget admits it.  Return when all
+have finished.
+"""
+	import multiprocessing as MP
+	from collections import deque
+
+	pending = deque( tasks )
+	running = list()
+
+	while pending or running:
+		while pending and budget.admits( pending[0][2] ):
+			target, args, estimate = pending.popleft()
+			proc = MP.Process( target=target, args=args )
+			proc.start()
+			budget.acquire( proc, estimate )
+			running.append( proc )
+
+		running[0].join( poll )
+		for proc in list( running ):
+			if not proc.is_alive():
+				proc.join()
+				budget.release( proc )
+				running.remove( proc )
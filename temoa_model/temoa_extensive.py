@@ -0,0 +1,273 @@
+"""
+Temoa - Tools for Energy Model Optimization and Analysis
+  linear optimization; least cost; dynamic system visualization
+
+Copyright (C) 2011-2014  Kevin Hunter, Joseph DeCarolis
+
+This program is free software: you can redistribute it and/or modify it under
+the terms of the GNU Affero General Public License as published by the Free
+Software Foundation, either version 3 of the License, or (at your option) any
+later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+PARTICULAR PURPOSE.  See the GNU Affero General Public License for more details.
+
+Developers of this script will check out a complete copy of the GNU Affero
+General Public License in the file COPYING.txt.  Users uncompressing this from
+an archive may not have received this license file.  If not, see
+<http://www.gnu.org/licenses/>.
+"""
+
+
+__all__ = ('create_extensive_form', 'solve_extensive_form')
+
+from sys import stderr as SE, stdout as SO
+
+from pyomo.core import ConstraintList, Objective, Param, minimize, value
+
+from temoa_lib import TemoaInfeasibleError, SolveWithProgress
+
+
+class ScenarioData ( object ):
+	"""\
+The data of every scenario of a stochastic directory, held in memory once.
+The reference data (R.dat, the root) is read once, and each node's data once,
+as { param : { index : value }}; from ScenarioStructure.dat's description of
+the tree, node data is that of the node's stochastic parameters only.  A
+scenario's data is then the reference namespace with the parameters of the
+nodes along its path laid over it, in path order -- what PySP would read from
+the dot dat files of those nodes -- and shares with the reference namespace
+every other parameter and set.
+
+A tree generated without export_dat_files has no node files; the data of its
+nodes is computed instead from ScenarioTree.pickle.  Node files in the delta
+format (delta_dat_files) are applied in path order, each to the values its
+node inherits from its parent.
+"""
+
+	__slots__ = ('model', 'topology', 'base', 'nodes', 'node_data', 'values')
+
+	def __init__ ( self, model, topology ):
+		from os.path import isfile
+		from pyomo.core import DataPortal
+
+		self.model    = model
+		self.topology = topology
+		self.nodes    = dict()     # { node : { param : { index : value }}}
+		self.values   = dict()     # { node : values passed on by a delta node }
+
+		root = DataPortal( model=model )
+		root.load( filename=topology.root + '.dat' )
+		self.base = root.data()
+
+		self.node_data = None
+		if isfile( 'ScenarioTree.pickle' ):
+			from temoa_eciu import load_node_data
+			self.node_data = load_node_data( 'ScenarioTree.pickle' )
+
+	def node ( self, name ):
+		"""Return { param : { index : value }}, the data of the node name."""
+		if name not in self.nodes:
+			from os.path import isfile
+
+			fname = name + '.dat'
+			if self.node_data is not None and not isfile( fname ):
+				self.nodes[ name ] = self._computed_node( name )
+			else:
+				from pyomo.core import DataPortal
+				from temoa_lib import apply_node_delta, read_node_delta_header
+
+				mdata = DataPortal( model=self.model )
+				mdata.load( filename=fname )
+				header = read_node_delta_header( fname )
+				if header is None:
+					self.nodes[ name ] = dict( mdata.data() )
+				else:
+					parent = self.topology.path( name )[-2]
+					if parent != self.topology.root:
+						self.node( parent )   # its values, to inherit
+					self.nodes[ name ], self.values[ name ] = apply_node_delta(
+					  self.base, self.values.get( parent ), mdata.data(), header )
+
+		return self.nodes[ name ]
+
+	def _computed_node ( self, name ):
+		from itertools import izip
+
+		provider = self.node_data
+		tree = provider.tree
+		node = provider.ids[ name ]
+		if tree.decision[ node ] is None:
+			return dict()    # a hedging node: no change from its parent
+
+		spoint = tree.spoints[ tree.stage[ node ]]
+		return dict(
+		  (p, dict( izip( tree.key_indices[ p, spoint ].model_keys, values )))
+		  for p, values in provider.node_values( node ).iteritems()
+		)
+
+	def scenario ( self, leaf ):
+		"""Return a DataPortal of the data of the scenario ending at leaf."""
+		from pyomo.core import DataPortal
+
+		namespace = dict( self.base )
+		for name in self.topology.path( leaf )[1:]:
+			for param, items in self.node( name ).iteritems():
+				merged = dict( namespace.get( param, () ))
+				merged.update( items )
+				namespace[ param ] = merged
+
+		return DataPortal( model=self.model, data_dict={ None : namespace })
+
+
+def _drop_parameters ( instance ):
+	"""\
+Delete the (immutable) parameters of instance.  Their values are already part
+of the constraint expressions, and they are the bulk of an instance's memory
+that is not needed to solve it.
+"""
+	names = [ name for name in instance.components( Param ) ]
+	for name in names:
+		instance.del_component( name )
+
+
+def create_extensive_form ( model, topology, s_structure, data ):
+	"""\
+Return the extensive form (deterministic equivalent) of the stochastic
+program: a model with one block per scenario, named as in s_structure, in
+which the stage variables of the scenarios through each node are constrained
+to be equal (non-anticipativity), and whose objective is the probability
+weighted sum of the scenarios' costs.  model is the stochastic Temoa model
+(temoa_stochastic.py), and data a ScenarioData.
+
+The scenario instances are created one at a time, and each drops its
+parameters before the next is created.
+"""
+	from pyomo.core import ConcreteModel
+
+	from temoa_eciu import _expand_wildcards, _variable_order
+	from temoa_stochastic import Objective_rule
+
+	scenario_of = dict(
+	  (s_structure.ScenarioLeafNode[ s ], s) for s in s_structure.Scenarios )
+
+	ef = ConcreteModel( name='TEMOA Extensive Form' )
+
+	for leaf in topology.leaf_names():
+		instance = model.create( data.scenario( leaf ))
+		instance.TotalCost.deactivate()
+		_drop_parameters( instance )
+		ef.add_component( scenario_of[ leaf ], instance )
+
+	# Each node's stage variables are those of its first scenario; every other
+	# scenario through the node must agree.
+	orders = dict()
+	ef.NonAnticipativity = ConstraintList()
+	for node in topology.names:
+		leaves = topology.leaf_names( node )
+		if len( leaves ) < 2: continue
+
+		stage = topology.stage( node )
+		reference = getattr( ef, scenario_of[ leaves[0] ])
+		if stage not in orders:
+			order, templates = _variable_order( s_structure.StageVariables[ stage ])
+			if templates:
+				order = _expand_wildcards( order, templates, reference )
+			orders[ stage ] = order
+
+		for leaf in leaves[1:]:
+			scenario = getattr( ef, scenario_of[ leaf ])
+			for vname, indices in orders[ stage ].iteritems():
+				r_var, s_var = getattr( reference, vname ), getattr( scenario, vname )
+				for index in indices:
+					ef.NonAnticipativity.add( s_var[ index ] == r_var[ index ] )
+
+	probability = topology.probability
+	ef.TotalCost = Objective(
+	  expr=sum(
+	    probability[ topology.ids[ leaf ]]
+	      * Objective_rule( getattr( ef, scenario_of[ leaf ]))
+	    for leaf in topology.leaf_names()
+	  ),
+	  sense=minimize
+	)
+
+	return ef
+
+
+def solve_extensive_form ( optimizer, options ):
+	"""\
+Build the extensive form of the stochastic directory options.extensive_form
+in memory -- without PySP's runef, and without writing any files -- and solve
+it.  Reports the expected cost, and the cost of each node of the tree.
+"""
+	from os import getcwd, chdir
+	from os.path import abspath
+	from time import clock
+
+	from pyomo.pysp.phutils import extractVariableNameAndIndex
+	from pyomo.pysp.util.scenariomodels import scenario_tree_model
+
+	from pformat_results import stringify_data
+	from temoa_eciu import ScenarioTreeTopology
+	from temoa_stochastic import model
+
+	opt = optimizer              # for us lazy programmer types
+
+	pwd = abspath( getcwd() )
+	chdir( options.extensive_form )
+	try:
+		begin = clock()
+		duration = lambda: clock() - begin
+
+		SE.write( '[        ] Reading scenario tree structure.'); SE.flush()
+		s_structure = scenario_tree_model.create( filename='ScenarioStructure.dat' )
+		topology = ScenarioTreeTopology.from_pysp( s_structure )
+		SE.write( '\r[%8.2f\n' % duration() )
+
+		SE.write( '[        ] Reading reference data.'); SE.flush()
+		data = ScenarioData( model, topology )
+		SE.write( '\r[%8.2f\n' % duration() )
+
+		msg = '[        ] Creating extensive form ({} scenarios).'
+		SE.write( msg.format( len( topology.leaves ))); SE.flush()
+		ef = create_extensive_form( model, topology, s_structure, data )
+		del data
+		SE.write( '\r[%8.2f\n' % duration() )
+
+		SE.write( '[        ] Solving.'); SE.flush()
+		if not opt:
+			SE.write( '\r---------- Not solving: no available solver\n' )
+			return
+
+		result = SolveWithProgress( opt, ef, options )
+		SE.write( '\r[%8.2f\n' % duration() )
+
+		if 'infeasible' in str( result['Solver'] ):
+			msg = ('The extensive form is infeasible: some scenario of the tree '
+			  'has no feasible solution.')
+			raise TemoaInfeasibleError( msg )
+		ef.load( result )
+
+		scenario_of = dict(
+		  (s_structure.ScenarioLeafNode[ s ], s) for s in s_structure.Scenarios )
+
+		# The cost of each node is that of its stage in any of its scenarios.
+		node_costs = list()
+		for node in topology.names:
+			stage = topology.stage( node )
+			vname, index = extractVariableNameAndIndex(
+			  s_structure.StageCostVariable[ stage ])
+			block = getattr( ef, scenario_of[ topology.leaf_names( node )[0] ])
+			cost = value( getattr( block, vname )[ index ] )
+			node_costs.append( ('{}  ({:.6g})'.format(
+			  node, topology.probability[ topology.ids[ node ]] ), cost) )
+
+		SO.write( 'Model name: {}\n'.format( ef.name ))
+		SO.write( 'Objective function value (TotalCost): {}\n'
+		  .format( value( ef.TotalCost )))
+		SO.write( 'Node costs (probability):\n' )
+		stringify_data( node_costs, SO )
+	finally:
+		chdir( pwd )
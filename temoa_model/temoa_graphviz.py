@@ -387,7 +387,8 @@ def CreateProcessPartialGraphs ( **kwargs ):
 A new subgraph is created for every technology in the tech_all set.  Subgraphs
 are named model_<tech>.<format>
 """
-	from temoa_lib import g_processInputs, ProcessInputs, ProcessOutputsByInput
+	from temoa_lib import g_processInputs, ProcessInputs, ProcessOutputsByInput, \
+	  CapacityAvailableExpression
 
 	M                  = kwargs.get( 'model' )
 	ffmt               = kwargs.get( 'image_format' )
@@ -411,7 +412,7 @@ are named model_<tech>.<format>
 	splinevar     = options.splinevar
 
 	VintageCap = M.V_Capacity
-	PeriodCap  = M.V_CapacityAvailableByPeriodAndTech
+	PeriodCap  = lambda p, t: CapacityAvailableExpression( M, p, t )
 
 	url_fmt  = '../commodities/commodity_%%s.%s' % ffmt
 	dummystr = '   '
@@ -458,7 +459,7 @@ are named model_<tech>.<format>
 			if tmp != l_tech: continue
 
 			if show_capacity:
-				pattr = pattr_fmt % (l_per, value( PeriodCap[l_per, l_tech] ))
+				pattr = pattr_fmt % (l_per, value( PeriodCap(l_per, l_tech) ))
 				vattr = vattr_fmt % (l_vin, value( VintageCap[l_tech, l_vin] ))
 			pnodes.add( (p_fmt % l_per, pattr) )
 			vnodes.add( (v_fmt % l_vin, vattr) )
@@ -786,7 +787,8 @@ strict digraph model {
 
 def CreateTechResultsDiagrams ( **kwargs ):
 	from temoa_lib import g_activeCapacityAvailable_pt, g_processInputs,   \
-	  ProcessVintages, ProcessInputs, ProcessOutputsByInput
+	  ProcessVintages, ProcessInputs, ProcessOutputsByInput,                   \
+	  ActivityByPeriodAndProcessExpression, CapacityAvailableExpression
 
 	M                  = kwargs.get( 'model' )
 	ffmt               = kwargs.get( 'image_format' )
@@ -857,13 +859,13 @@ strict digraph model {
 	vnode_attr_fmt += 'label="%s\\nCap: %.2f"'
 
 	for per, tech in g_activeCapacityAvailable_pt:
-		total_cap = value( M.V_CapacityAvailableByPeriodAndTech[per, tech] )
+		total_cap = value( CapacityAvailableExpression( M, per, tech ))
 
 		# energy/vintage nodes, in/out edges
 		enodes, vnodes, iedges, oedges = set(), set(), set(), set()
 
 		for l_vin in ProcessVintages( per, tech ):
-			if not M.V_ActivityByPeriodAndProcess[per, tech, l_vin]:
+			if not value( ActivityByPeriodAndProcessExpression( M, per, tech, l_vin )):
 				continue
 
 			cap = M.V_Capacity[tech, l_vin]
@@ -925,7 +927,8 @@ strict digraph model {
 
 def CreatePartialSegmentsDiagram ( **kwargs ):
 	from temoa_lib import g_activeCapacityAvailable_pt, g_processInputs,   \
-	  ProcessVintages, ProcessInputs, ProcessOutputsByInput
+	  ProcessVintages, ProcessInputs, ProcessOutputsByInput,                   \
+	  ActivityByPeriodAndProcessExpression, CapacityAvailableExpression
 
 	M                  = kwargs.get( 'model' )
 	ffmt               = kwargs.get( 'image_format' )
@@ -993,10 +996,10 @@ strict digraph model {
 	enode_attr_fmt = 'href="../commodities/rc_%%s_%%s.%s"' % ffmt
 
 	for p, t in g_activeCapacityAvailable_pt:
-		total_cap = value( M.V_CapacityAvailableByPeriodAndTech[p, t] )
+		total_cap = value( CapacityAvailableExpression( M, p, t ))
 
 		for v in ProcessVintages( p, t ):
-			if not M.V_ActivityByPeriodAndProcess[p, t, v]:
+			if not value( ActivityByPeriodAndProcessExpression( M, p, t, v )):
 				continue
 
 			cap = M.V_Capacity[t, v]
@@ -1199,7 +1202,7 @@ strict digraph result_commodity_%(commodity)s {
 
 def CreateMainResultsDiagram ( **kwargs ):
 	from temoa_lib import ProcessVintages, ProcessInputs,  ProcessOutputs,     \
-	  ValidActivity
+	  ValidActivity, CapacityAvailableExpression
 
 	M                  = kwargs.get( 'model' )
 	images_dir         = kwargs.get( 'images_dir' )
@@ -1315,7 +1318,7 @@ strict digraph model {
 	commodity_fmt = 'href="../commodities/rc_%%s_%%s.%s"' % ffmt
 	flow_fmt = 'label="%.2f"'
 
-	V_Cap = M.V_CapacityAvailableByPeriodAndTech
+	V_Cap = M.CapacityAvailableVar_pt
 	FI = M.V_FlowIn
 	FO = M.V_FlowOut
 	EI = M.V_EnergyConsumptionByPeriodInputAndTech    # Energy In
@@ -1337,7 +1340,7 @@ strict digraph model {
 		for tt in M.tech_all:
 			if (pp, tt) not in V_Cap: continue
 
-			cap = V_Cap[pp, tt]
+			cap = value( CapacityAvailableExpression( M, pp, tt ))
 
 			if cap:
 				etechs.add( (tt, tech_attr_fmt % (tt, cap, tt, pp)) )
@@ -1506,17 +1509,18 @@ def CreateModelDiagrams ( M, options ):
 			func( **kwargs )
 
 	else:
-		sem = MP.Semaphore( MP.cpu_count() )
+		from temoa_executor import MemoryBudget, current_memory, run_processes
+
 		def do_work ( func ):
-			sem.acquire()
 			func( **kwargs )
-			sem.release()
 
-		processes = [
-		  MP.Process( target=do_work, args=(func,) )
-		  for func in gvizFunctions
-		]
-		for p in processes: p.start()
-		for p in processes: p.join()
+		# Each process is a fork of this one, and as it reads the instance and
+		# results it touches -- and so copies -- up to all of this process'
+		# memory.
+		jobs = options.jobs or MP.cpu_count()
+		budget = MemoryBudget( jobs, options.max_memory )
+		estimate = current_memory()
+		run_processes(
+		  [ (do_work, (func,), estimate) for func in gvizFunctions ], budget )
 
 	os.chdir( '..' )
@@ -115,6 +115,151 @@ For example:
 	return izip( *[islice(iterable, i, None, chunk_size)
 	             for i in xrange(chunk_size)] )
 
+
+# These next functions give access to the raw data of a DataPortal, after the
+# "dot dat" files have been read, but before Pyomo has used them to create a
+# model instance.  This is the point at which Temoa may rework the modeler's
+# data (e.g., cluster time slices) without the cost of instantiating twice.
+# The DataPortal wraps Set (and scalar) data in a {None : data} dict.
+
+def dataportal_set ( modeldata, name ):
+	data = modeldata.data().get( name, () )
+	if isinstance( data, dict ):
+		data = data.get( None, () )
+	return list( data )
+
+
+def dataportal_set_update ( modeldata, name, elements ):
+	namespace = modeldata.data()
+	if isinstance( namespace.get( name ), dict ):
+		namespace[ name ] = { None : list( elements ) }
+	else:
+		namespace[ name ] = list( elements )
+
+
+def dataportal_param ( modeldata, name ):
+	return dict( modeldata.data().get( name, {} ))
+
+
+def dataportal_param_update ( modeldata, name, items ):
+	namespace = modeldata.data()
+	if items:
+		namespace[ name ] = dict( items )
+	elif name in namespace:
+		del namespace[ name ]
+
+
+# The node dot dat files of a stochastic tree may be in the delta format of
+# the tree generator (stochastic/scenario_tree.py, ScenarioTree.as_delta):
+# only the values that differ from those the node inherits from its parent,
+# under a first line such as
+#
+#   # delta  apply  point=2010  parent_point=2000  CostInvest=1  Demand=0
+#
+# A loader must therefore apply a scenario's files in path order.
+
+def read_node_delta_header ( fname ):
+	"""\
+Return (apply, point, parent_point, { param : stochastic index }) from the
+first line of the node dot dat file fname, or None if it is not in the delta
+format.  The points are strings.
+"""
+	with open( fname ) as f:
+		words = f.readline().split()
+
+	if words[:2] != ['#', 'delta']:
+		return None
+
+	apply = 'apply' == words[2]
+	fields = dict( w.split( '=', 1 ) for w in words[3:] )
+	point = fields.pop( 'point' )
+	parent_point = fields.pop( 'parent_point' )
+	indices = dict( (p, int( i )) for p, i in fields.iteritems() )
+
+	return apply, point, parent_point, indices
+
+
+def point_values ( base, param, pidx, point ):
+	"""\
+Return { reduced key : value } of param in base, a DataPortal namespace, for
+the keys whose stochastic index (at position pidx) is point, a string.  A
+reduced key is a key less its stochastic index.
+"""
+	return dict(
+	  (key[:pidx] + key[pidx+1:], val)
+	  for key, val in base.get( param, {} ).iteritems()
+	  if str( key[ pidx ]) == point
+	)
+
+
+def apply_node_delta ( base, parent_values, delta, header ):
+	"""\
+Return ({ param : { key : value }}, { param : { reduced key : value }}): the
+data of a node in the delta format to lay over the scenario's namespace (none,
+for a hedging node), and the node's values by reduced key, which its children
+inherit.  base is the reference namespace, parent_values the second of the
+parent's return (or None, for the root's children), delta the data of the
+node's file, and header its read_node_delta_header().
+"""
+	apply, point, parent_point, indices = header
+
+	overlay, values = dict(), dict()
+	for param, pidx in indices.iteritems():
+		if parent_values is None:
+			inherited = point_values( base, param, pidx, parent_point )
+		else:
+			inherited = parent_values[ param ]
+		changed = delta.get( param, {} )
+
+		items, node_values = dict(), dict()
+		for key, val in base.get( param, {} ).iteritems():
+			if str( key[ pidx ]) != point: continue
+			reduced = key[:pidx] + key[pidx+1:]
+			if key in changed:
+				val = changed[ key ]
+			elif reduced in inherited:
+				val = inherited[ reduced ]
+			items[ key ] = val
+			node_values[ reduced ] = val
+
+		values[ param ] = node_values
+		if apply:
+			overlay[ param ] = items
+
+	return overlay, values
+
+
+def load_path_data ( model, data_files ):
+	"""\
+Return a DataPortal of data_files, the reference data file and then the node
+files of a scenario, in path order, whether the node files are complete or in
+the delta format.
+"""
+	from pyomo.core import DataPortal
+
+	modeldata = DataPortal( model=model )
+	modeldata.load( filename=data_files[0] )
+	namespace = modeldata.data()
+	base = dict( namespace )
+
+	parent_values = None
+	for fname in data_files[1:]:
+		header = read_node_delta_header( fname )
+		if header is None:
+			modeldata.load( filename=fname )
+			continue
+
+		node_data = DataPortal( model=model )
+		node_data.load( filename=fname )
+		overlay, parent_values = apply_node_delta(
+		  base, parent_values, node_data.data(), header )
+		for param, items in overlay.iteritems():
+			merged = dict( namespace.get( param, () ))
+			merged.update( items )
+			namespace[ param ] = merged
+
+	return modeldata
+
 ###############################################################################
 # Temoa rule "partial" functions (excised from indidivual constraints for
 #   readability)
@@ -558,6 +703,13 @@ def InitializeProcessParameters ( M ):
 	global g_activeCapacity_tv
 	global g_activeCapacityAvailable_pt
 
+	# Start from empty caches, in case this is not the first instance created
+	# by this process (e.g., the successive windows of a myopic run).
+	g_processInputs   = dict()
+	g_processOutputs  = dict()
+	g_processVintages = dict()
+	g_processLoans    = dict()
+
 	l_first_period = min( M.time_future )
 	l_exist_indices = M.ExistingCapacity.sparse_keys()
 	l_used_techs = set()
@@ -1093,10 +1245,533 @@ output carrier.
 	return False
 
 
+# The next three functions stand in for the "bookkeeping" variables in the
+# rules that use them.  While the model still has the variable, they merely
+# return it.  If EliminateDefinitionalVariables has removed the variable (and
+# its defining constraint) from the model, they instead return the defining
+# expression, effectively substituting the definition into the caller.
+
+def ActivityExpression ( M, p, s, d, t, v ):
+	"""\
+Return the activity of process (t, v) in slice (p, s, d): either the
+V_Activity variable or, if eliminated, the sum of the process' outputs.
+"""
+	if hasattr( M, 'V_Activity' ):
+		return M.V_Activity[p, s, d, t, v]
+
+	activity = sum(
+	  M.V_FlowOut[p, s, d, S_i, t, v, S_o]
+
+	  for S_i in ProcessInputs( p, t, v )
+	  for S_o in ProcessOutputsByInput( p, t, v, S_i )
+	)
+
+	return activity
+
+
+def ActivityByPeriodAndProcessExpression ( M, p, t, v ):
+	"""\
+Return the activity of process (t, v) summed over all slices of period p:
+either the V_ActivityByPeriodAndProcess variable or, if eliminated, the sum of
+the slice activities.
+"""
+	if hasattr( M, 'V_ActivityByPeriodAndProcess' ):
+		return M.V_ActivityByPeriodAndProcess[p, t, v]
+
+	activity = sum(
+	  ActivityExpression( M, p, S_s, S_d, t, v )
+
+	  for S_s in M.time_season
+	  for S_d in M.time_of_day
+	  if v in ProcessVintages( p, t )
+	)
+
+	return activity
+
+
+def CapacityAvailableExpression ( M, p, t ):
+	"""\
+Return the capacity of tech t available in period p: either the
+V_CapacityAvailableByPeriodAndTech variable or, if eliminated, the life-fraction
+weighted sum of the installed capacity of each active vintage.
+"""
+	if hasattr( M, 'V_CapacityAvailableByPeriodAndTech' ):
+		return M.V_CapacityAvailableByPeriodAndTech[p, t]
+
+	cap_avail = sum(
+	    value( M.ProcessLifeFrac[p, t, S_v] )
+	  * M.V_Capacity[t, S_v]
+
+	  for S_v in ProcessVintages( p, t )
+	)
+
+	return cap_avail
+
+
+def EliminateDefinitionalVariables ( M ):
+	"""\
+Remove the "bookkeeping" variables (V_Activity, V_ActivityByPeriodAndProcess,
+and V_CapacityAvailableByPeriodAndTech) and the constraints that define them
+from the abstract model M.  Each removal saves the LP one column and one
+equality row per index.  The rules that use these variables instead receive
+the defining expression via the *Expression helper functions above, and
+pformat_results reconstructs the reported values after the solve.
+
+This must be called before the model is instantiated.
+"""
+	components = (
+	  'ActivityConstraint',
+	  'ActivityByPeriodAndProcessConstraint',
+	  'CapacityAvailableByPeriodAndTechConstraint',
+	  'V_Activity',
+	  'V_ActivityByPeriodAndProcess',
+	  'V_CapacityAvailableByPeriodAndTech',
+	)
+
+	for name in components:
+		if hasattr( M, name ):
+			delattr( M, name )
+
 
 # End helper functions
 ##############################################################################
 
+###############################################################################
+# Bulk variable fixing
+
+# The constraints (and objective) in which each variable family appears.  When
+# a variable is fixed, only these need to be re-preprocessed.  If the
+# definitional variables have been eliminated (--presolve), their users are
+# instead users of the variable that defined them; see
+# _definitional_variables.
+_variable_users = {
+  'V_FlowIn' : (
+    'CommodityBalanceConstraint', 'ProcessBalanceConstraint',
+    'StorageConstraint', 'TechInputSplitConstraint',
+  ),
+  'V_FlowOut' : (
+    'ActivityConstraint', 'CommodityBalanceConstraint',
+    'DemandActivityConstraint', 'DemandConstraint', 'EmissionLimitConstraint',
+    'ProcessBalanceConstraint', 'ResourceExtractionConstraint',
+    'StorageConstraint', 'TechOutputSplitConstraint',
+  ),
+  'V_Activity' : (
+    'ActivityConstraint', 'ActivityByPeriodAndProcessConstraint',
+    'BaseloadDiurnalConstraint', 'CapacityConstraint',
+    'TechOutputSplitConstraint',
+  ),
+  'V_ActivityByPeriodAndProcess' : (
+    'ActivityByPeriodAndProcessConstraint', 'TotalCost',
+  ),
+  'V_Capacity' : (
+    'CapacityConstraint', 'CapacityAvailableByPeriodAndTechConstraint',
+    'ExistingCapacityConstraint', 'TotalCost',
+  ),
+  'V_CapacityAvailableByPeriodAndTech' : (
+    'CapacityAvailableByPeriodAndTechConstraint', 'GrowthRateConstraint',
+    'MaxCapacityConstraint', 'MinCapacityConstraint',
+  ),
+}
+
+_definitional_variables = {
+  'V_Activity'                         : 'V_FlowOut',
+  'V_ActivityByPeriodAndProcess'       : 'V_Activity',
+  'V_CapacityAvailableByPeriodAndTech' : 'V_Capacity',
+}
+
+
+def ReadVariableValues ( fname ):
+	"""\
+Read the variable values of fname, and return a dict of
+
+    { variable name : [ (index, value, line number), ... ] }
+
+The format is determined by the file extension:
+
+  .pickle, .pkl - binary: a pickled dict of { variable name : (indices,
+                  values) }, where indices is a sequence of index tuples and
+                  values a parallel sequence of floats.  (As written by
+                  --save_variables.)
+  .csv          - columnar: one variable per row, as
+                  "variable name, value, index 1, index 2, ..."
+  anything else - the default Temoa output, as "value  V_Name[index,...]" per
+                  line.  Lines that do not match are ignored, so that the
+                  modeler may comment them out.
+
+For the text formats, index is the comma-separated string of the index, to be
+resolved against the model by FixVariables; for the binary format, index is
+the index tuple itself.
+"""
+	from collections import defaultdict
+
+	values = defaultdict( list )
+
+	if fname.endswith(( '.pickle', '.pkl' )):
+		import cPickle as pickle
+
+		with open( fname, 'rb' ) as f:
+			saved = pickle.load( f )
+		for vgroup, (indices, vals) in saved.iteritems():
+			values[ vgroup ] = zip( indices, vals, [None] * len( vals ))
+
+		return values
+
+	if fname.endswith( '.csv' ):
+		import csv
+
+		with open( fname, 'rb' ) as f:
+			for lineno, row in enumerate( csv.reader( f ), 1 ):
+				if len( row ) < 3 or not row[0].startswith( 'V_' ): continue
+				vgroup, val = row[0].strip(), row[1].strip()
+				vindex = ','.join( i.strip() for i in row[2:] )
+				values[ vgroup ].append( (vindex, val, lineno) )
+
+		return values
+
+	with open( fname, 'rb' ) as f:
+		for lineno, line in enumerate( f, 1 ):    # humans think 1-based
+			# A split is considerably cheaper than a regular expression, and
+			# with a few million lines, it matters.  The expected format is
+			# "value  V_Name[index]"
+			fields = line.split()
+			if len( fields ) != 2: continue
+
+			val, name = fields
+			vgroup, bracket, vindex = name.partition( '[' )
+			if not (bracket and vgroup.startswith( 'V_' ) and vindex.endswith( ']' )):
+				continue
+
+			values[ vgroup ].append( (vindex[:-1], val, lineno) )
+
+	return values
+
+
+def FixVariables ( instance, values ):
+	"""\
+Fix the variables of instance to values, as returned by ReadVariableValues.
+Each variable family is looked up once, and string indices are resolved
+through a lookup table of the family's own indices, rather than by guessing
+which parts of the index are integers.  Returns the set of names of the
+variable families that were fixed.
+"""
+	fixed = set()
+
+	for vgroup, items in values.iteritems():
+		try:
+			m_var = getattr( instance, vgroup )
+		except AttributeError:
+			lineno = items[0][2] if items else None
+			msg = 'Line {}: Model does not have a variable named "{}".'
+			raise TemoaObjectNotFoundError( msg.format( lineno, vgroup ))
+
+		lookup = None
+		if any( isinstance( index, basestring ) for index, val, lineno in items ):
+			lookup = dict(
+			  (','.join( str( i ) for i in index ), index)
+			  if isinstance( index, tuple ) else (str( index ), index)
+
+			  for index in m_var.iterkeys()
+			)
+
+		for index, val, lineno in items:
+			try:
+				val = float( val )
+			except ValueError:
+				msg = '\nLine {}: Unable to parse value for "{}[{}]" ({})\n'
+				raise TemoaValidationError( msg.format( lineno, vgroup, index, val ))
+
+			try:
+				if isinstance( index, basestring ):
+					index = lookup[ index ]
+				v = m_var[ index ]
+			except KeyError:
+				msg = 'Line {}: Variable "{}" has no index "{}".'
+				raise TemoaKeyError( msg.format( lineno, vgroup, index ))
+
+			v.fixed = True
+			v.set_value( val )
+
+		fixed.add( vgroup )
+
+	return fixed
+
+
+def PreprocessFixedVariables ( instance, families ):
+	"""\
+After fixing the variables of families, re-preprocess only the constraints
+(and objective) in which they appear, rather than the whole instance.  Falls
+back to instance.preprocess() for any variable family Temoa does not know
+about, or if this version of Pyomo lacks the per-component preprocessing
+functions.
+"""
+	try:
+		from pyomo.repn.compute_canonical_repn import (
+		  preprocess_block_objectives, preprocess_constraint )
+	except ImportError:
+		instance.preprocess()
+		return
+
+	users = set()
+	pending = list( families )
+	while pending:
+		vgroup = pending.pop()
+		if vgroup not in _variable_users:
+			instance.preprocess()
+			return
+		users.update( _variable_users[ vgroup ] )
+
+		# The users of an eliminated variable are users of its definition
+		for derived, defining in _definitional_variables.iteritems():
+			if defining == vgroup and not hasattr( instance, derived ):
+				pending.append( derived )
+
+	var_id_map = dict()
+	for name in sorted( users ):
+		if not hasattr( instance, name ): continue
+		component = getattr( instance, name )
+		if isinstance( component, Objective ):
+			preprocess_block_objectives( instance, var_id_map=var_id_map )
+		else:
+			preprocess_constraint( instance, component, var_id_map=var_id_map )
+
+
+def WriteVariableValues ( instance, fname, epsilon=1e-9 ):
+	"""\
+Write the non-zero variable values of instance to fname, in the format that
+ReadVariableValues expects for its extension.  (For the default text format,
+use the standard Temoa output.)
+"""
+	from array import array
+
+	saved = dict()
+	for vgroup in sorted( _variable_users ):
+		if not hasattr( instance, vgroup ): continue
+
+		m_var = getattr( instance, vgroup )
+		indices, vals = list(), list()
+		for index in m_var.iterkeys():
+			val = m_var[ index ].value
+			if val is None or abs( val ) < epsilon: continue
+			indices.append( index )
+			vals.append( val )
+		saved[ vgroup ] = (indices, array( 'd', vals ))
+
+	if fname.endswith( '.csv' ):
+		import csv
+
+		with open( fname, 'wb' ) as f:
+			writer = csv.writer( f )
+			for vgroup, (indices, vals) in sorted( saved.iteritems() ):
+				for index, val in izip( indices, vals ):
+					index = index if isinstance( index, tuple ) else (index,)
+					writer.writerow( (vgroup, repr( val )) + index )
+
+	else:
+		import cPickle as pickle
+
+		with open( fname, 'wb' ) as f:
+			pickle.dump( saved, f, pickle.HIGHEST_PROTOCOL )
+
+# End bulk variable fixing
+###############################################################################
+
+###############################################################################
+# Solver limits and progress monitoring
+
+# Each solver plugin names its options differently.  For the solvers we know
+# about, these are the names of the (wall clock) time limit, in seconds, and
+# the relative MIP gap at which to stop.
+solver_limit_options = {
+  #  solver    time limit   relative MIP gap
+  'cplex'  : ( 'timelimit', 'mip_tolerances_mipgap' ),
+  'gurobi' : ( 'TimeLimit', 'MIPGap' ),
+  'cbc'    : ( 'sec',       'ratio' ),
+  'glpk'   : ( 'tmlim',     'mipgap' ),
+}
+
+
+def SetSolverLimits ( opt, solver_name, time_limit=None, mip_gap=None ):
+	"""\
+Translate Temoa's solver-agnostic limits into the option names of the
+solver_name plugin, and set them on opt.
+"""
+	if time_limit is None and mip_gap is None:
+		return
+
+	name = str( solver_name ).lower()
+	if name not in solver_limit_options:
+		msg = ("Warning: Temoa does not know how to set a time limit or MIP gap "
+		  "for the '{}' solver.  Ignoring --time_limit and --mip_gap.  You "
+		  "may be able to set them via the solver's own options.\n")
+		SE.write( msg.format( solver_name ))
+		return
+
+	time_opt, gap_opt = solver_limit_options[ name ]
+	if time_limit is not None:
+		time_limit = int( time_limit ) if 'glpk' == name else time_limit
+		opt.options[ time_opt ] = time_limit
+	if mip_gap is not None:
+		opt.options[ gap_opt ] = mip_gap
+
+
+class SolverProgressMonitor ( object ):
+	"""\
+A file-like object that stands in for stdout while a solver writes its log.
+Each line is parsed for the progress of the solve -- iteration (or node)
+count, objective value, best bound, and gap -- which is then either written
+as a one-line status to stderr (log_path is '-') or appended as a JSON object
+per line to log_path.
+
+The recognized formats are those of CPLEX, Gurobi, GLPK, and CBC/Clp.  Lines
+that do not match are still written to the JSON log (as 'line') so that no
+solver information is lost.
+"""
+
+	_float = r'([-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)'
+	_patterns = (
+	  # GLPK simplex: "*   100: obj =   1.234567890e+04 inf =   0.000e+00 (0)"
+	  (r'^[*+ ]\s*(\d+): obj =\s*{f}'.format( f=_float ),
+	   ('iteration', 'objective')),
+	  # GLPK MIP: "+   100: mip =   1.234e+04 >=   1.000e+04  18.9% (5; 0)"
+	  (r'^[*+ ]\s*(\d+): mip =\s*{f}\s*[<>]=\s*{f}\s*{f}%'.format( f=_float ),
+	   ('iteration', 'objective', 'bound', 'gap_percent')),
+	  # CPLEX simplex: "Iteration:   100   Dual objective     =  12345.678"
+	  (r'^Iteration:\s*(\d+)\s+.*objective\s*=\s*{f}'.format( f=_float ),
+	   ('iteration', 'objective')),
+	  # CPLEX MIP node: the best integer, best bound, iteration count, and gap
+	  #   "      5     2     1234.5    10     1300.0     1234.5   15   5.04%"
+	  (r'^[\s*H]*(\d+)\+?\s+\d+\+?\s+.*\s{f}\s+{f}\s+\d+\s+{f}%$'.format( f=_float ),
+	   ('iteration', 'objective', 'bound', 'gap_percent')),
+	  # Gurobi MIP node: the incumbent, best bound, gap, iterations/node, time
+	  #   "H    5     2   1234.5    0   10   1300.0   1234.5  5.04%   3.1    0s"
+	  (r'^[\s*H]*(\d+)\s+\d+\s+.*\s{f}\s+{f}\s+{f}%\s+\S+\s+\d+s$'.format( f=_float ),
+	   ('iteration', 'objective', 'bound', 'gap_percent')),
+	  # Gurobi simplex: "     100    1.2345000e+04   1.000e+00   0.000e+00      0s"
+	  (r'^\s*(\d+)\s+{f}\s+{f}\s+{f}\s+\d+s$'.format( f=_float ),
+	   ('iteration', 'objective', None, None)),
+	  # CBC: "Cbc0010I After 100 nodes, 5 on tree, 1234.5 best solution, best
+	  #       possible 1000 (0.52 seconds)"
+	  (r'^Cbc0010I After (\d+) nodes, \d+ on tree, {f} best solution, best '
+	   r'possible {f}'.format( f=_float ),
+	   ('iteration', 'objective', 'bound')),
+	  # Clp: "Clp0006I 100  Obj 1234.5 Primal inf 4.1 (3)"
+	  (r'^Clp0006I\s+(\d+)\s+Obj\s+{f}'.format( f=_float ),
+	   ('iteration', 'objective')),
+	)
+
+	def __init__ ( self, solver_name, log_path ):
+		import re
+		from time import time
+
+		self.solver = str( solver_name )
+		self.begin  = time()
+		self.buffer = ''
+		self.status = dict()
+		self.status_shown = False
+
+		self.patterns = [ (re.compile( p ), fields) for p, fields in self._patterns ]
+
+		self.log = None
+		if log_path and log_path != '-':
+			self.log = open( log_path, 'ab' )
+
+	def _parse ( self, line ):
+		for regex, fields in self.patterns:
+			match = regex.match( line )
+			if not match: continue
+
+			record = dict()
+			for field, val in zip( fields, match.groups() ):
+				if not field: continue
+				if 'gap_percent' == field:
+					record[ 'gap' ] = float( val ) / 100
+				elif 'iteration' == field:
+					record[ field ] = int( val )
+				else:
+					record[ field ] = float( val )
+
+			if 'gap' not in record and 'bound' in record and record['objective']:
+				obj, bound = record['objective'], record['bound']
+				record[ 'gap' ] = abs( obj - bound ) / abs( obj )
+
+			return record
+
+		return None
+
+	def _emit ( self, line ):
+		from json import dumps
+		from time import time
+
+		elapsed = time() - self.begin
+		record = self._parse( line )
+		if record:
+			self.status.update( record )
+
+		if self.log:
+			entry = dict( record or {} )
+			entry.update( time=round( elapsed, 3 ), solver=self.solver, line=line )
+			self.log.write( dumps( entry, sort_keys=True ) + '\n' )
+			self.log.flush()
+
+		elif record:
+			status = self.status
+			msg = '\r[%8.2f] Solving.  iteration: %s  objective: %s' % (
+			  elapsed, status.get('iteration', '-'), status.get('objective', '-') )
+			if 'gap' in status:
+				msg += '  gap: %.4f%%' % (100 * status[ 'gap' ])
+			SE.write( msg ); SE.flush()
+			self.status_shown = True
+
+	def write ( self, data ):
+		self.buffer += data
+		while '\n' in self.buffer:
+			line, self.buffer = self.buffer.split( '\n', 1 )
+			line = line.rstrip( '\r' )
+			if line.strip():
+				self._emit( line )
+
+	def writelines ( self, lines ):
+		for line in lines:
+			self.write( line )
+
+	def flush ( self ):
+		pass
+
+	def close ( self ):
+		if self.buffer.strip():
+			self._emit( self.buffer )
+		self.buffer = ''
+		if self.status_shown:
+			SE.write( '\n' )
+		if self.log:
+			self.log.close()
+			self.log = None
+
+
+def SolveWithProgress ( opt, instance, options ):
+	"""\
+Solve instance with opt.  If the modeler asked for --solver_log, have the
+solver echo its log, and parse it with a SolverProgressMonitor, rather than
+blocking silently until the solve is complete.
+"""
+	import sys
+
+	log_path = getattr( options, 'solver_log', None )
+	if not log_path:
+		return opt.solve( instance )
+
+	monitor = SolverProgressMonitor( options.solver, log_path )
+	stdout = sys.stdout
+	sys.stdout = monitor    # the solver plugins "tee" to sys.stdout
+	try:
+		return opt.solve( instance, tee=True )
+	finally:
+		sys.stdout = stdout
+		monitor.close()
+
+# End solver limits and progress monitoring
+###############################################################################
+
 ###############################################################################
 # Miscellaneous routines
 
@@ -1196,6 +1871,8 @@ def parse_args ( ):
 	from pyomo.opt import SolverFactory as SF
 	from logging import getLogger
 
+	from temoa_executor import parse_memory
+
 	# used for some error messages below.
 	red_bold = cyan_bold = reset = ''
 	if platform.system() != 'Windows' and SE.isatty():
@@ -1243,6 +1920,7 @@ def parse_args ( ):
 
 	graphviz    = parser.add_argument_group('Graphviz Options')
 	solver      = parser.add_argument_group('Solver Options')
+	preprocess  = parser.add_argument_group('Preprocessing Options')
 	stochastic  = parser.add_argument_group('Stochastic Options')
 	postprocess = parser.add_argument_group('Postprocessing Options')
 
@@ -1256,11 +1934,22 @@ def parse_args ( ):
 
 	parser.add_argument( '--fix_variables',
 	  help='Path to file containing variables to fix.  The file format is the '
-	    'same as the default Temoa output.',
+	    'same as the default Temoa output, or, for a file ending in .csv or '
+	    '.pickle, as written by --save_variables.',
 	  action='store',
 	  dest='fix_variables',
 	  default=None)
 
+	parser.add_argument( '--save_variables',
+	  help='After the solve, save the non-zero variable values to FILE, for '
+	    'later use with --fix_variables.  A FILE ending in .csv is written as '
+	    'columns (variable, value, index...); otherwise, as a binary file that '
+	    'is much faster to load.  [Default: do not save]',
+	  action='store',
+	  metavar='FILE',
+	  dest='save_variables',
+	  default=None)
+
 	parser.add_argument( '--how_to_cite',
 	  help='Bibliographical information for citation, in the case that Temoa '
 	    'contributes to a project that leads to a scientific publication.',
@@ -1308,6 +1997,63 @@ def parse_args ( ):
 	  default=False)
 
 
+	preprocess.add_argument('--myopic',
+	  help='Solve the model myopically, as a sequence of overlapping windows '
+	       'of WINDOW periods of time_optimize, rather than with perfect '
+	       'foresight over all periods at once.  After each window is solved, '
+	       'the capacity decisions of its first period are fixed and carried '
+	       'forward as existing capacity into the next window.  [Default: '
+	       'perfect foresight]',
+	  action='store',
+	  type=int,
+	  metavar='WINDOW',
+	  dest='myopic',
+	  default=None)
+
+	preprocess.add_argument('--benders',
+	  help='Solve the model by Benders decomposition over its periods: a '
+	       'master problem decides the capacity (V_Capacity), and the '
+	       'operation of each period is a separate subproblem, solved in '
+	       'parallel.  Intended for horizons too large to solve at once.  '
+	       'Reports the capacity decisions and the cost of each period.  '
+	       '[Default: solve the full model at once]',
+	  action='store_true',
+	  dest='benders',
+	  default=False)
+
+	preprocess.add_argument('--benders_tolerance',
+	  help='With --benders, stop once the relative gap between the lower and '
+	       'upper bounds of the decomposition is at most GAP.  [Default: 1e-4]',
+	  action='store',
+	  type=float,
+	  metavar='GAP',
+	  dest='benders_tolerance',
+	  default=1e-4)
+
+	preprocess.add_argument('--benders_iterations',
+	  help='With --benders, the maximum number of master problem iterations.  '
+	       '[Default: 100]',
+	  action='store',
+	  type=int,
+	  metavar='NUM',
+	  dest='benders_iterations',
+	  default=100)
+
+	preprocess.add_argument('--cluster_seasons',
+	  help='Cluster the seasons of the data (time_season) into NUM_SEASONS '
+	       'representative seasons, based on the similarity of their SegFrac, '
+	       'DemandSpecificDistribution, and CapacityFactor* profiles over the '
+	       'times of day.  Temoa solves the reduced model, reports the '
+	       'clustering error, and maps the results back to the original '
+	       'slices.  Useful, for example, to reduce a year of hourly data to a '
+	       'number of representative days.  [Default: do not cluster]',
+	  action='store',
+	  type=int,
+	  metavar='NUM_SEASONS',
+	  dest='cluster_seasons',
+	  default=None)
+
+
 	solver.add_argument('--solver',
 	  help="Which backend solver to use.  See 'pyomo --help-solvers' for a list "
 	       'of solvers with which Coopr can interface.  The list shown here is '
@@ -1328,6 +2074,73 @@ def parse_args ( ):
 	  dest='generateSolverLP',
 	  default=False)
 
+	solver.add_argument('--presolve',
+	  help='Eliminate the purely definitional ("bookkeeping") variables '
+	       'V_Activity, V_ActivityByPeriodAndProcess, and '
+	       'V_CapacityAvailableByPeriodAndTech, substituting their definitions '
+	       'directly into the constraints and objective that use them.  This '
+	       'creates a smaller LP; the reported values of these variables are '
+	       'reconstructed after the solve.  [Default: keep the variables]',
+	  action='store_true',
+	  dest='presolve',
+	  default=False)
+
+	solver.add_argument('--time_limit',
+	  help='Stop the solver after SECONDS of wall clock time, and report the '
+	       'best solution found so far.  Temoa translates this to the '
+	       'appropriate option for CPLEX, Gurobi, CBC, or GLPK.  [Default: no '
+	       'limit]',
+	  action='store',
+	  type=float,
+	  metavar='SECONDS',
+	  dest='time_limit',
+	  default=None)
+
+	solver.add_argument('--mip_gap',
+	  help='Stop the solver once the relative gap between the best integer '
+	       'solution and the best bound is at most GAP (e.g., 0.01 for 1%%).  '
+	       'Only meaningful for models with integer variables.  [Default: the '
+	       "solver's default]",
+	  action='store',
+	  type=float,
+	  metavar='GAP',
+	  dest='mip_gap',
+	  default=None)
+
+	solver.add_argument('--solver_log',
+	  help="Stream the solver's progress (iteration, objective, bound, gap) "
+	       'while it solves.  Without FILE, show a one-line status on stderr.  '
+	       'With FILE, append one JSON object per solver log line to FILE, '
+	       'suitable for monitoring long runs.  [Default: solve silently]',
+	  action='store',
+	  nargs='?',
+	  const='-',
+	  metavar='FILE',
+	  dest='solver_log',
+	  default=None)
+
+	solver.add_argument('--jobs',
+	  help='The maximum number of processes to run at once, for the ECIU '
+	       'solves, the Benders subproblems, and the Graphviz diagrams.  '
+	       '[Default: the number of CPUs (1.5 times that for --eciu)]',
+	  action='store',
+	  type=int,
+	  metavar='NUM',
+	  dest='jobs',
+	  default=None)
+
+	solver.add_argument('--max_memory',
+	  help='Start no further ECIU solve workers or Graphviz processes once '
+	       'their estimated memory would exceed SIZE (e.g., 64G).  Temoa '
+	       'estimates the memory of each from the memory its workers have so '
+	       'far used, or from the size of the model instance.  [Default: no '
+	       'limit]',
+	  action='store',
+	  type=parse_memory,
+	  metavar='SIZE',
+	  dest='max_memory',
+	  default=None)
+
 	solver.add_argument('--keep_pyomo_lp_file',
 	  help='Save the LP file as written by Pyomo.  This is distinct from the '
 	       "solver's generated LP file, but /should/ represent the same model.  "
@@ -1347,6 +2160,24 @@ def parse_args ( ):
 	  dest='eciu',
 	  default=None)
 
+	stochastic.add_argument('--extensive_form',
+	  help='Solve the extensive form (deterministic equivalent) of a '
+	       'stochastic scenario directory (i.e., where to find '
+	       'ScenarioStructure.dat), built in memory from the reference data '
+	       'and the node data, rather than by PySP.',
+	  metavar='STOCHASTIC_DIRECTORY',
+	  dest='extensive_form',
+	  default=None)
+
+	stochastic.add_argument('--resume',
+	  help='With --eciu, resume an interrupted analysis: skip the solves that '
+	       'the journal in STOCHASTIC_DIRECTORY/eciu_results.sqlite records '
+	       'as complete and whose results are intact, and solve only the '
+	       'rest.  [Default: solve every node again]',
+	  action='store_true',
+	  dest='resume',
+	  default=False)
+
 
 	options = parser.parse_args()
 
@@ -1361,7 +2192,8 @@ def parse_args ( ):
 
 	# It would be nice if this implemented with add_mutually_exclusive_group
 	# but I /also/ want them in separate groups for display.  Bummer.
-	if not (options.dot_dat or options.eciu):
+	stochastic_dir = options.eciu or options.extensive_form
+	if not (options.dot_dat or stochastic_dir):
 		usage = parser.format_usage()
 		msg = ('Missing a data file to optimize (e.g., test.dat)')
 		msg = '{}\n{}{}{}'.format( usage, red_bold, msg, reset )
@@ -1376,13 +2208,31 @@ def parse_args ( ):
 		       'line.')
 		msg = '{}\n{}{}{}'.format( usage, red_bold, msg, reset )
 		raise TemoaCommandLineArgumentError( msg )
-	elif options.eciu:
+
+	elif options.eciu and options.extensive_form:
+		usage = parser.format_usage()
+		msg = ('Conflicting options: --eciu and --extensive_form\n\n'
+		       'Please choose one analysis of the stochastic directory.')
+		msg = '{}\n{}{}{}'.format( usage, red_bold, msg, reset )
+		raise TemoaCommandLineArgumentError( msg )
+
+	elif options.dot_dat and options.extensive_form:
+		usage = parser.format_usage()
+		msg = ('Conflicting option and arguments: --extensive_form and data '
+		       'files\n\n--extensive_form reads the data files of a stochastic '
+		       'directory.  Please remove either of --extensive_form or the data '
+		       'files from the command line.')
+		msg = '{}\n{}{}{}'.format( usage, red_bold, msg, reset )
+		raise TemoaCommandLineArgumentError( msg )
+
+	elif stochastic_dir:
 		# can this be subsumed directly into the argparse module functionality?
 		from os.path import isdir, isfile, join
-		edir = options.eciu
+		edir = stochastic_dir
+		flag = '--eciu' if options.eciu else '--extensive_form'
 
-		if not isdir( options.eciu ):
-			msg = "{}--eciu requires a directory.{}".format( red_bold, reset )
+		if not isdir( edir ):
+			msg = "{}{} requires a directory.{}".format( red_bold, flag, reset )
 			msg = "{}\n\nSupplied path: '{}'".format( msg, edir )
 			raise TemoaCommandLineArgumentError( msg )
 
@@ -1393,6 +2243,29 @@ def parse_args ( ):
 			raise TemoaCommandLineArgumentError(
 			   msg.format( reset, edir, red_bold ))
 
+	if options.resume and not options.eciu:
+		usage = parser.format_usage()
+		msg = ('--resume requires --eciu\n\n'
+		       'Only an ECIU analysis keeps a journal of its solves.')
+		msg = '{}\n{}{}{}'.format( usage, red_bold, msg, reset )
+		raise TemoaCommandLineArgumentError( msg )
+
+	if options.myopic and options.fix_variables:
+		usage = parser.format_usage()
+		msg = ('Conflicting options: --myopic and --fix_variables\n\n'
+		       'Each myopic window is a different model instance, so the '
+		       'variables of a single (perfect foresight) solution do not apply.')
+		msg = '{}\n{}{}{}'.format( usage, red_bold, msg, reset )
+		raise TemoaCommandLineArgumentError( msg )
+
+	if options.benders and (options.myopic or options.fix_variables):
+		usage = parser.format_usage()
+		msg = ('Conflicting options: --benders with --myopic or --fix_variables'
+		       '\n\nBenders decomposition solves the full horizon with perfect '
+		       'foresight, as a master problem and per-period subproblems.')
+		msg = '{}\n{}{}{}'.format( usage, red_bold, msg, reset )
+		raise TemoaCommandLineArgumentError( msg )
+
 	if options.graph_format:
 		try:
 			from subprocess import call
@@ -1451,82 +2324,37 @@ def solve_perfect_foresight ( model, optimizer, options ):
 		modeldata.load( filename=fname )
 	SE.write( '\r[%8.2f\n' % duration() )
 
+	slice_map = None
+	if options.cluster_seasons:
+		from temoa_clustering import ClusterTimeSeasons
+
+		SE.write( '[        ] Clustering time slices.'); SE.flush()
+		slice_map, report = ClusterTimeSeasons( modeldata, options.cluster_seasons )
+		SE.write( '\r[%8.2f\n' % duration() )
+		SE.write( report )
+
+	if options.presolve:
+		EliminateDefinitionalVariables( model )
+
 	SE.write( '[        ] Creating Temoa model instance.'); SE.flush()
 	instance = model.create( modeldata )
 	SE.write( '\r[%8.2f\n' % duration() )
 
 	if options.fix_variables:
 		SE.write( '[        ] Fixing supplied variables.'); SE.flush()
-		import re
-
-		# Assumption: All variables are indexed
-		# We accept \S+ instead of the more precise (\d+(?:\.\d+)?) because we
-		# want to be helpful in case of a user typo.
-		var_data_re = re.compile( r'^ *(\S+) +(V_\w+)\[(\S+)\]$' )
-		int_re = re.compile( r'^\d+$' )
-
-		with open( options.fix_variables, 'rb' ) as f:
-			for lineno, line in enumerate( f, 1 ):    # humans think 1-based
-				match = var_data_re.match( line )
-
-				# We ignore (and thereby allow) lines that don't match the Temoa
-				# value variable[index] per line output.  This enables folks to
-				# comment and uncomment lines if they'd like.
-				if not match: continue
-
-				try:
-					value, vgroup, vindex = match.groups()
-					vindex = vindex.split(',')
-					value = float( value )
-				except ValueError as ve:
-					msg = '\nLine {:d}: Unable to parse value for "{}{}" ({})\n'
-					raise TemoaValidationError( msg.format(
-					  lineno, vgroup, vindex, value ))
-
-				for i, index in enumerate( vindex ):
-					# if index is an integer, convert it so it matches indices
-					# Problem: if modeler has used integer values for indices
-					# other than period or vintage.
-					if int_re.match( index ):
-						vindex[ i ] = int( index )
-
-				try:
-					m_var = getattr( instance, vgroup )[ tuple(vindex) ]
-					m_var.fixed = True
-					m_var.set_value( value )
-
-				except AttributeError as ae:
-					if "'AbstractModel' object has no attribute " in str(ae):
-						# This could be so much cleaner if Coopr had Coopr-specific
-						# error classes.  Sigh.
-
-						msg = 'Line {:d}: Model does not have a variable named "{}".'
-						msg = msg.format( lineno, vgroup )
-						raise TemoaObjectNotFoundError( msg )
-
-					raise
-
-				except KeyError as ke:
-					if 'Error accessing indexed component' in str(ke):
-						# This could be so much cleaner if Coopr had Coopr-specific
-						# error classes.  Sigh.
-
-						msg = 'Line {:d}: Variable "{}" has no index "{}".'
-						vindex = str( tuple(vindex) )
-						msg = msg.format( lineno, vgroup, vindex )
-						raise TemoaKeyError( msg )
-
-					raise
-
+		values = ReadVariableValues( options.fix_variables )
+		fixed_families = FixVariables( instance, values )
+		del values
 		SE.write( '\r[%8.2f\n' % duration() )
+
 		SE.write( '[        ] Preprocessing fixed variables.'); SE.flush()
-		instance.preprocess()
+		PreprocessFixedVariables( instance, fixed_families )
 		SE.write( '\r[%8.2f\n' % duration() )
 
 	# Now do the solve and ...
 	SE.write( '[        ] Solving.'); SE.flush()
 	if opt:
-		result = opt.solve( instance )
+		result = SolveWithProgress( opt, instance, options )
 		SE.write( '\r[%8.2f\n' % duration() )
 
 		# return signal handlers to defaults, again
@@ -1541,11 +2369,16 @@ def solve_perfect_foresight ( model, optimizer, options ):
 	SE.write( msg ); SE.flush()
 	updated_results = instance.update_results( result )
 	instance.load( result )
-	formatted_results = pformat_results( instance, updated_results )
+	formatted_results = pformat_results( instance, updated_results, slice_map )
 	SE.write( '\r[%8.2f\n' % duration() )
 
 	SO.write( formatted_results.getvalue() )
 
+	if options.save_variables:
+		SE.write( '[        ] Saving variable values.'); SE.flush()
+		WriteVariableValues( instance, options.save_variables )
+		SE.write( '\r[%8.2f\n' % duration() )
+
 	if options.graph_format:
 		# we can't simply call SO.close() here, because we use multiprocess.Process
 		# in _graphviz, which also calls close() -- an operation that may only be
@@ -1563,483 +2396,6 @@ def solve_perfect_foresight ( model, optimizer, options ):
 		SE.write( '\r[%8.2f\n' % duration() )
 
 
-def solve_true_cost_of_guessing ( optimizer, options, epsilon=1e-6 ):
-	import multiprocessing as MP, os, cPickle as pickle
-
-	from collections import deque, defaultdict
-	from os import getcwd, chdir
-	from os.path import isfile, abspath, exists
-
-	from pyomo.core import DataPortal, Var
-	from pyomo.pysp.util.scenariomodels import scenario_tree_model
-	from pyomo.pysp.phutils import extractVariableNameAndIndex
-
-	from temoa_model import temoa_create_model
-	from temoa_rules import PeriodCost_rule
-
-	pwd = abspath( getcwd() )
-	chdir( options.eciu )
-	sStructure = scenario_tree_model.create( filename='ScenarioStructure.dat' )
-
-	# Step 1: find the root node.  PySP doesn't make this very easy ...
-
-	# a child -> parent mapping, because every child has only one parent, but
-	# not vice-versa
-	ctpTree = dict()
-
-	to_process = deque()
-	to_process.extend( sStructure.Children.keys() )
-	while to_process:
-		node = to_process.pop()
-		if node in sStructure.Children:
-			# it's a parent!
-			new_nodes = set( sStructure.Children[ node ] )
-			to_process.extend( new_nodes )
-			ctpTree.update({n : node for n in new_nodes })
-
-	                 # parents           -     children
-	root_node = (set( ctpTree.values() ) - set( ctpTree.keys() )).pop()
-
-	ptcTree = defaultdict( list )
-	for c, p in ctpTree.iteritems():
-		ptcTree[ p ].append( c )
-	ptcTree = dict( ptcTree )   # be slightly defensive; catch any additions
-
-	leaf_nodes = set(ctpTree.keys()) - set(ctpTree.values())
-
-	scenario_nodes = dict()
-	for node in leaf_nodes:
-		s = list()
-		scenario_nodes[ node ] = s
-		while node in ctpTree:
-			s.append( node )
-			node = ctpTree[ node ]
-		s.append( node )
-		s.reverse()
-
-	leaf_nodes_by_node = defaultdict(set)
-	for fnode in leaf_nodes:
-		node = fnode
-		while node in ctpTree:
-			leaf_nodes_by_node[ node ].add( fnode )
-			node = ctpTree[ node ]
-		leaf_nodes_by_node[ node ].add( fnode ) # get the root node
-	leaf_nodes_by_node = dict( leaf_nodes_by_node )   # be slightly defensive
-
-
-	def build_full_solve_dict ( tree, node, ptc ):
-		if node not in ptc: return
-
-		for child in ptc[ node ]:
-			if child not in tree:
-				tree[ child ] = tree[ node ]  # i.e., CondProb = 100%
-			build_full_solve_dict( tree, child, ptc )
-
-
-	def build_minimal_solve_dict ( tree, leaves_by_node, node, last, ptc ):
-		""" Remove redundant solves """
-		assume = tuple( leaves_by_node[ node ] )
-		new_assume = assume
-		if last:
-			assume = tuple( sorted( ','.join(i)
-			  for i in cross_product( last, assume ))
-			)
-			new_assume = list()
-
-			for i, a in enumerate(assume):
-				items = a.split(',')
-				if items[ -1 ] != items[ -2 ]:
-					# This is the crux of the check: if the final two assumptions
-					# are the same, then the second is redundant.
-					new_assume.append( assume[i] )
-
-		tree[ node ] = tuple( new_assume )
-
-		while node in ptc and len( ptc[ node ] ) == 1:
-			node = ptc[ node ][0]
-
-		if node in ptc:
-			for child in ptc[ node ]:
-				build_minimal_solve_dict( tree, leaves_by_node, child, assume, ptc )
-
-	##### Begin multiprocessing function #####
-
-	def do_solve (
-	  sem,                # BoundedSemaphore
-	  exc_q,              # This is an MP project: give exceptions to head
-	  solver_options,
-	  solve_counts,
-	  scen_nodes,         # nodes to scenario: { scen : [R, Rs0, ... scen] }
-	  this_node,          # a string, representing which node in the tree
-	  this_assumptions,   # Assumptions so far, comma separated, last one is
-	                      # the assumptions to make from this_node
-	  file_locks,         # MP.Lock dict: to prevent read/write collisions
-	  s_structure,        # PySP Scenario structure object
-	):
-		solve_num, num_solves = solve_counts
-
-		try:
-			from setproctitle import setproctitle as setProcessTitle
-			msg = '({}/{}) Solving assumption: {}'
-			msg = msg.format( solve_num, num_solves, this_assumptions )
-			setProcessTitle( msg )
-			del msg
-		except ImportError, e:
-			pass
-
-		CP = s_structure.ConditionalProbability
-
-		assumptions = this_assumptions.split(',')
-		assumed_fs = assumptions[-1]
-		assumptions = assumptions[:-1]
-
-		node_path = scen_nodes[ assumed_fs ]
-		node_index = node_path.index( this_node )
-
-		# path_so_far = nodes to here, _not_ including here
-		path_so_far = node_path[0:node_index]
-
-		# nodes from here to assumed_fs, _including_ here
-		this_subpath = node_path[node_index:]
-
-		msg = ("({}) Solving from node '{}', having assumed '{}' and assuming "
-		  "'{}'.\n")
-		SE.write( msg.format( solve_num, this_node, ','.join(assumptions),
-		   assumed_fs ))
-
-		from pyomo.opt import SolverFactory
-		opt = SolverFactory( solver_options )
-
-		model = temoa_create_model()
-
-		mdata = DataPortal( model=model )
-		for node_name in scen_nodes[ assumed_fs ]:
-			mdata.load( filename=node_name + '.dat' )
-		m = model.create( mdata )
-
-		# path_so_far includes nodes with CP of 1.
-		past_assumed = ''
-		last_assumed = ''               # TODO: this is currently a hack, because
-		i_assume = iter( assumptions )  # TODO: of an inconsistent data structure
-		for node in path_so_far:
-			if CP[ node ] < 1 or node == 'R':
-				assumed = next( i_assume )
-				if past_assumed:
-					past_assumed += ',' + assumed
-				else:
-					past_assumed += assumed
-			last_assumed = assumed        # TODO: hack: deal with CP = 1
-
-			fname = node + '.pickle'
-
-			with file_locks[ n ]:
-				# Gzip might be nice, but it takes long enough that it's a
-				# bottleneck.  I have not tried any compression less than the
-				# default (9), so it may yet be a win.  However, for now, it kills
-				# parallelism because it happens within the file locks (which are,
-				# unfortunately, a necessity)..
-				with open( fname, 'rb' ) as f:
-					try:
-						saved_data = pickle.load( f )[ past_assumed ]
-					except:
-						msg = ( 'An exception, while loading {}[{}], from node {}, '
-						  ' with path_so_far {};  my_assumptions: {}\n')
-						msg = msg.format( fname, past_assumed, this_node,
-						                  path_so_far, assumptions )
-						exception_q.put( TemoaError( msg ))
-						sem.release()
-						return
-
-			# the pickle loaded a dict, saved_data is now a tuple of
-			#  (node_cost, {'var' : (index, val, index, val ...)})
-
-			node_cost, var_values = saved_data
-			# Fix variables per what was pickled previously
-			for vname, values in var_values.iteritems():
-				m_var = getattr(m, vname)
-				for index, val in iter_in_chunks( values, 2 ):
-					v = m_var[ index ]
-					v.fixed = True
-					v.set_value( val )
-
-		# do the preprocess and solve.
-		m.preprocess()
-		results = opt.solve( m )
-		m.load( results )
-
-		if 'infeasible' in str( results['Solver'] ):
-			msg = ('Infeasible solve.  Node: {}, path_so_far {}; my_assumptions: '
-			  '{}\n\n  Writing fixed variable values to {}')
-			msg = msg.format( this_node, path_so_far, assumptions, fname )
-			exc_q.put( TemoaInfeasibleError( msg ) )
-			sem.release()
-			return
-
-		# now, save the variables for any subsequent runs
-		node_assumptions = this_assumptions
-		for node in this_subpath:
-			stage = s_structure.NodeStage[ node ]
-			stage_vars = s_structure.StageVariables[ stage ]
-
-			# Cheat, and assume some knowledge of the underlying data
-			#   This removes the leading s; e.g., s1990 -> 1990
-			period = int( stage[1:] )
-			node_cost = value( PeriodCost_rule( m, period ))
-
-			vars_to_save = defaultdict( set )
-			node_vars    = defaultdict( list )
-			for var_string in stage_vars:
-				vname, index = extractVariableNameAndIndex( var_string )
-				vars_to_save[ vname ].add( index )
-
-			for vname, indices in vars_to_save.iteritems():
-				m_var = getattr(m, vname)
-				for index in indices:
-					try:
-						val = value( m_var[ index ] )
-					except:
-						if 'infeasible' in str( sol ):
-
-							msg = ( '    ---> Solver found problem infeasible <---' )
-							SE.write( '\n' + msg + '\n\n')
-						raise
-					if val < epsilon:
-						# variables can't be negative, and they may be when within an
-						# epsilon of 0 (because the solver said "good enough")
-						val = 0
-					node_vars[ vname ].extend( (index, val) )
-
-			data_to_save = (node_cost, node_vars)
-
-			fname = node + '.pickle'
-
-			with file_locks[ node ]:
-				with open( fname, 'rb' ) as f:
-					saved_node_data = pickle.load( f )
-
-				saved_node_data[ node_assumptions ] = data_to_save
-				with open( fname, 'wb' ) as f:
-					pickle.dump( saved_node_data, f, pickle.HIGHEST_PROTOCOL )
-					f.flush()
-					os.fdatasync( f.fileno() )
-
-				if node in s_structure.Children:
-					if len( s_structure.Children[ node ] ) > 1:
-						node_assumptions += ',' + assumed_fs
-
-		# sem = the process BoundedSemaphor.  Still shared memory ...
-		sem.release()
-
-
-	###### End multiprocessing function #####
-
-
-	# Step 1: Find out what we need to solve
-	to_solve = dict()
-	build_minimal_solve_dict( to_solve, leaf_nodes_by_node, 'R', (), ptcTree )
-
-	# For printing the solution, need to include all nodes.
-	solved = dict( to_solve )
-	build_full_solve_dict( solved, 'R', ptcTree )
-
-	file_locks     = dict()
-
-	# Step 2: Find out what -- if anything -- has already been processed
-	for n, assumptions in to_solve.iteritems():
-		fname = n + '.pickle'
-		fd = os.open( fname, os.O_CREAT, 0600 )
-		with os.fdopen( fd, 'rb' ) as f:
-			try:
-				saved_data = pickle.load( f )
-			except EOFError as e:
-				# an empty or corrupt file.  No matter.
-				saved_data = {}
-
-		with open( fname, 'wb' ) as f:
-			pickle.dump( saved_data, f, pickle.HIGHEST_PROTOCOL )
-			f.flush()
-			os.fdatasync( f.fileno() )
-
-		file_locks[ n ] = MP.Lock()
-
-	for n in sStructure.Nodes:
-		if n in to_solve: continue
-		file_locks[ n ] = MP.Lock()
-
-		fname = n + '.pickle'
-		f = os.open( fname, os.O_CREAT, 0600 )
-		with os.fdopen( f, 'rb' ) as pickle_file:
-			try:
-				saved_data = pickle.load( pickle_file )
-			except EOFError as e:
-				saved_data = {}
-
-		with open( fname, 'wb' ) as f:
-			pickle.dump( saved_data, f, pickle.HIGHEST_PROTOCOL )
-			f.flush()
-			os.fdatasync( f.fileno() )
-
-
-	jobs_capacity = int( 1.5 * MP.cpu_count() )
-	process_sem = MP.BoundedSemaphore( jobs_capacity )
-	exception_q = MP.Queue()
-
-	# sort is not strictly necessary, but doing so allows us to only start a
-	# small number of processes, rather than potentially overwhelming the OS
-	# process table.
-	last = ''
-
-	import inspect
-
-	def lineno():
-		"""Returns the current line number in our program."""
-		return inspect.currentframe().f_back.f_lineno
-
-	# In fact, sort is half of what we want.  Through observation, it appears
-	# that at larger ECIU stages (i.e. 4+ stage), one partial bottleneck is file
-	# access.  Since the amount of data that needs to be shared for 4-stage is
-	# ~110 MiB, and the amount of data to share for 5 stage is ~400 MiB, there
-	# are two steps that we could take to speed computation:
-	# 1. First, sorting is good, letting us do a stage wise progression.
-	#    However, we're getting hung on disk access, so we should instead solve
-	#    either from random nodes, or divide the list into slices and
-	#    round-robin through them.
-	# 2. For "reasonable" expected sizes of data, could use a tmpfs backing,
-	#    or some sort of shared memory approach
-	class Serial ( object ):
-		def __init__ ( self, beg=0 ):
-			self.beg = beg
-
-		def __call__ ( self ):
-			self.beg += 1
-			return self.beg
-
-	from itertools import cycle
-
-	def roundrobin( *iterables ):
-		"roundrobin('ABC', 'D', 'EF') --> A D E B F C"
-		# Recipe credited to George Sakkis
-		pending = len(iterables)
-		nexts = cycle(iter(it).next for it in iterables)
-		while pending:
-			try:
-				for next in nexts:
-					yield next()
-			except StopIteration:
-				pending -= 1
-				nexts = cycle(islice(nexts, pending))
-
-	to_solve_stages = defaultdict( set )     # { 1 : set('R'), 2 : set('Rs0s0s0', 'Rs0s0s1'), }
-	stage_tracker = defaultdict( Serial() )  # { 'R' : 1, 'Rs0s0' : 2, ...}
-	for i in sorted( to_solve ):
-		stage_num = stage_tracker[ len(i) ]  # referencing it increments the Serial object
-		to_solve_stages[ stage_num ].add( i )
-
-	for stage, nodes in sorted( to_solve_stages.iteritems() ):
-
-		# first, attempt to relieve a file access bottleneck by accessing
-		# files in a chunked round-robin fashion.
-
-		# this is still a poor substitute for a depth-first traversal, but
-		# I have not yet figured that logic out.
-		indices = list(xrange( stage ))
-		indices.reverse()
-		indexgetter = iget( *indices )
-
-		assumptions_to_nodes = defaultdict(set)
-		for n in nodes:
-			for a in to_solve[ n ]:
-				assumptions_to_nodes[ a ].add( n )
-		to_solve_assumptions = assumptions_to_nodes.keys()
-		to_solve_assumptions = [i.split(',') for i in to_solve_assumptions]
-		to_solve_assumptions.sort( key=indexgetter )
-		to_solve_assumptions = [','.join(i) for i in to_solve_assumptions]
-
-		to_solve_pairs = [
-		  (n, a)
-
-		  for a in to_solve_assumptions
-		  for n in assumptions_to_nodes[ a ]
-		]
-		del assumptions_to_nodes, to_solve_assumptions
-
-		step = int(len( to_solve_pairs ) / jobs_capacity)
-		step = max( 1, step )
-		iters = [islice( to_solve_pairs, i, i + step )
-		         for i in xrange( 0, len(to_solve_pairs), step )]
-
-		# Preparing to solve the next stage.  Let this stage finish, first.
-		active_children = MP.active_children()
-		for p in active_children:
-			p.join()
-
-		num_solves = len( to_solve_pairs )
-		solve_counter = 0
-		SE.write('\nThere are {} solves in this stage\n'.format( num_solves ))
-		for node, a in roundrobin( *iters ):
-			process_sem.acquire()
-			if not exception_q.empty():
-				for i in xrange( jobs_capacity -1 ):
-					process_sem.acquire()
-				e = exception_q.get()
-
-				raise e
-			solve_counter += 1  # For informing of progress through process names
-
-			args = (
-			  process_sem,
-			  exception_q,
-			  options.solver,
-			  (solve_counter, num_solves),
-			  scenario_nodes,
-			  node,
-			  a,
-			  file_locks,
-			  sStructure
-			)
-
-			MP.Process( target=do_solve, args=args ).start()
-			# do_solve( *args )   # in case of need to debug: uncomment
-
-		# don't care who's active; just clean up any zombies at end stage
-		MP.active_children()
-
-	# _Now_ we care, because active children mean we can't read results yet.
-	processes = MP.active_children()
-	for p in processes:
-		p.join()
-
-	# Finally: let's marshal the results and give 'em to the modeler!
-	data = list()
-	data.append(('','','','"Previously Assumed" is a chronologically ordered list of assumptions made, up to "this" node',))
-	data.append(('At Node', 'Previously Assumed', 'Node Cost'))
-
-	to_process.append( root_node )  # invariant from above: was empty deque
-	last = root_node                # for blank lines between stages
-	while to_process:
-		node = to_process.popleft()
-		if len( node ) != len( last ):
-			data.append( tuple() ) # blank line
-
-		fname = node + '.pickle'
-		with open( fname, 'rb' ) as f:
-			node_data = pickle.load( f )
-		for assumption in sorted( node_data ):
-			row = [ node, assumption, node_data[ assumption ][ 0 ] ]
-			data.append( row )
-		del node_data
-
-		if node in ptcTree:
-			to_process.extend( ptcTree[ node ] )
-		last = node
-
-	import csv, cStringIO
-	csvdata = cStringIO.StringIO()
-	writer = csv.writer( csvdata ); writer.writerows( data )
-	print csvdata.getvalue()
-	chdir( pwd )
-
-
 def temoa_solve ( model ):
 	from sys import argv, version_info
 
@@ -2060,6 +2416,8 @@ def temoa_solve ( model ):
 			opt.keepfiles = True
 			opt.symbolic_solver_labels = True
 
+		SetSolverLimits( opt, options.solver, options.time_limit, options.mip_gap )
+
 	elif options.solver != 'NONE':
 		SE.write( "\nWarning: Unable to initialize solver interface for '{}'\n\n"
 			.format( options.solver ))
@@ -2075,10 +2433,20 @@ def temoa_solve ( model ):
 			  '\n  handling this situation appropriately.\n\n')
 
 	try:
-		if options.dot_dat:
+		if options.dot_dat and options.myopic:
+			from temoa_myopic import solve_myopic
+			solve_myopic( model, opt, options )
+		elif options.dot_dat and options.benders:
+			from temoa_benders import solve_benders
+			solve_benders( model, opt, options )
+		elif options.dot_dat:
 			solve_perfect_foresight( model, opt, options )
 		elif options.eciu:
+			from temoa_eciu import solve_true_cost_of_guessing
 			solve_true_cost_of_guessing( opt, options )
+		elif options.extensive_form:
+			from temoa_extensive import solve_extensive_form
+			solve_extensive_form( opt, options )
 	except IOError as e:
 		if e.errno == errno.EPIPE:
 			# stdout has been closed, e.g., a user has quit the 'less' pager
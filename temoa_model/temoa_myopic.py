@@ -0,0 +1,301 @@
+"""
+Temoa - Tools for Energy Model Optimization and Analysis
+  linear optimization; least cost; dynamic system visualization
+
+Copyright (C) 2011-2014  Kevin Hunter, Joseph DeCarolis
+
+This program is free software: you can redistribute it and/or modify it under
+the terms of the GNU Affero General Public License as published by the Free
+Software Foundation, either version 3 of the License, or (at your option) any
+later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+PARTICULAR PURPOSE.  See the GNU Affero General Public License for more details.
+
+Developers of this script will check out a complete copy of the GNU Affero
+General Public License in the file COPYING.txt.  Users uncompressing this from
+an archive may not have received this license file.  If not, see
+<http://www.gnu.org/licenses/>.
+"""
+
+__all__ = ('solve_myopic',)
+
+from copy import deepcopy
+from sys import stderr as SE, stdout as SO
+
+from pyomo.core import value
+
+from temoa_lib import (
+  TemoaInfeasibleError, TemoaValidationError, dataportal_set,
+  dataportal_set_update, dataportal_param, dataportal_param_update,
+  SolveWithProgress
+)
+
+
+# For each parameter that a modeler may specify, the positions within its
+# index of a period, a vintage, a technology, and a physical commodity, or None
+# if the parameter is not indexed by that kind of set.  This is how a myopic
+# window knows which data to keep.
+_param_positions = {
+  #  name                          period  vintage  tech  physical
+  'CapacityToActivity'         : ( None,   None,    0,    None ),
+  'ExistingCapacity'           : ( None,   1,       0,    None ),
+  'Efficiency'                 : ( None,   2,       1,    0    ),
+  'CapacityFactorProcess'      : ( None,   3,       2,    None ),
+  'CapacityFactorTech'         : ( None,   None,    2,    None ),
+  'LifetimeTech'               : ( None,   None,    0,    None ),
+  'LifetimeLoanTech'           : ( None,   None,    0,    None ),
+  'LifetimeProcess'            : ( None,   1,       0,    None ),
+  'LifetimeLoanProcess'        : ( None,   1,       0,    None ),
+  'GrowthRateMax'              : ( None,   None,    0,    None ),
+  'GrowthRateSeed'             : ( None,   None,    0,    None ),
+  'Demand'                     : ( 0,      None,    None, None ),
+  'ResourceBound'              : ( 0,      None,    None, 1    ),
+  'CostFixedVintageDefault'    : ( None,   1,       0,    None ),
+  'CostVariableVintageDefault' : ( None,   1,       0,    None ),
+  'CostFixed'                  : ( 0,      2,       1,    None ),
+  'CostVariable'               : ( 0,      2,       1,    None ),
+  'CostInvest'                 : ( None,   1,       0,    None ),
+  'DiscountRate'               : ( None,   1,       0,    None ),
+  'TechInputSplit'             : ( None,   None,    1,    0    ),
+  'TechOutputSplit'            : ( None,   None,    0,    None ),
+  'MinCapacity'                : ( 0,      None,    1,    None ),
+  'MaxCapacity'                : ( 0,      None,    1,    None ),
+  'EmissionLimit'              : ( 0,      None,    None, None ),
+  'EmissionActivity'           : ( None,   3,       2,    1    ),
+}
+
+# Parameters that only pertain to the loans of vintages within time_optimize.
+# Once a window has moved past a vintage, that vintage is "existing", and its
+# loan has already been accounted for.
+_loan_params = ('CostInvest', 'DiscountRate', 'LifetimeLoanProcess')
+
+_tech_sets = ('tech_resource', 'tech_production', 'tech_baseload', 'tech_storage')
+
+
+def _as_tuple ( key ):
+	if isinstance( key, tuple ):
+		return key
+	return (key,)
+
+
+def myopic_windows ( periods, window ):
+	"""\
+Given the sorted optimization periods and a window size (in number of periods),
+yield (window_periods, committed_periods) tuples.  Each window is solved in
+turn, but only the decisions of the committed periods -- the first period of
+the window, or all of the window's periods for the last window -- are carried
+forward.
+
+    >>> list( myopic_windows( [2000, 2010, 2020, 2030], 2 ))
+    [([2000, 2010], [2000]), ([2010, 2020], [2010]), ([2020, 2030], [2020, 2030])]
+"""
+	for i in xrange( len( periods )):
+		end = min( i + window, len( periods ))
+		if end == len( periods ):
+			yield periods[ i:end ], periods[ i:end ]
+			return
+		yield periods[ i:end ], periods[ i:i +1 ]
+
+
+def restrict_data_to_window ( modeldata, base, window_periods, future_end, committed ):
+	"""\
+Replace the data of modeldata with a copy of the base (i.e., full horizon) data,
+restricted to window_periods.  All periods of the full horizon prior to the
+window become part of time_exist, and the capacity decisions made for them in
+previous windows (committed: { (t, v) : capacity }) become ExistingCapacity.
+"""
+	namespace = modeldata.data()
+	namespace.clear()
+	namespace.update( deepcopy( base ))
+
+	first, last = window_periods[ 0 ], window_periods[ -1 ]
+	periods = set( window_periods )
+
+	time_exist = dataportal_set( modeldata, 'time_exist' )
+	time_future = dataportal_set( modeldata, 'time_future' )
+	past = sorted( p for p in time_future if p < first )
+
+	dataportal_set_update( modeldata, 'time_exist', sorted(set( time_exist + past )))
+	dataportal_set_update( modeldata, 'time_future', window_periods + [future_end] )
+
+	# previously decided capacity is now existing capacity
+	ExistingCapacity = dataportal_param( modeldata, 'ExistingCapacity' )
+	ExistingCapacity.update( committed )
+	dataportal_param_update( modeldata, 'ExistingCapacity', ExistingCapacity )
+
+	# Processes that are no longer (or not yet) available to this window
+	LifetimeTech    = dataportal_param( modeldata, 'LifetimeTech' )
+	LifetimeProcess = dataportal_param( modeldata, 'LifetimeProcess' )
+	def alive ( t, v ):
+		life = LifetimeProcess.get( (t, v), LifetimeTech.get( t, 30 ))
+		return v + life > first
+
+	Efficiency = dict(
+	  ((i, t, v, o), eff)
+	  for (i, t, v, o), eff in dataportal_param( modeldata, 'Efficiency' ).iteritems()
+	  if v <= last
+	  if v >= first or ((t, v) in ExistingCapacity and alive( t, v ))
+	)
+	dataportal_param_update( modeldata, 'Efficiency', Efficiency )
+
+	used_techs    = set( t for i, t, v, o in Efficiency )
+	used_physical = set( i for i, t, v, o in Efficiency )
+	for name in _tech_sets:
+		techs = dataportal_set( modeldata, name )
+		dataportal_set_update( modeldata, name, [t for t in techs if t in used_techs] )
+	physical = dataportal_set( modeldata, 'commodity_physical' )
+	dataportal_set_update( modeldata, 'commodity_physical',
+	  [c for c in physical if c in used_physical] )
+
+	processes = set( (t, v) for i, t, v, o in Efficiency )
+
+	for name, (ppos, vpos, tpos, cpos) in _param_positions.iteritems():
+		if name == 'Efficiency': continue
+		data = dataportal_param( modeldata, name )
+		if not data: continue
+
+		def keep ( key ):
+			key = _as_tuple( key )
+			if ppos is not None and key[ ppos ] not in periods:
+				return False
+			if tpos is not None and key[ tpos ] not in used_techs:
+				return False
+			if cpos is not None and key[ cpos ] not in used_physical:
+				return False
+			if vpos is not None:
+				if (key[ tpos ], key[ vpos ]) not in processes:
+					return False
+				if name in _loan_params and key[ vpos ] < first:
+					return False
+			return True
+
+		dataportal_param_update( modeldata, name,
+		  dict( (k, val) for k, val in data.iteritems() if keep( k )) )
+
+
+def solve_myopic ( model, optimizer, options, epsilon=1e-6 ):
+	"""\
+Solve the model as a sequence of overlapping windows of options.myopic periods
+of time_optimize, rather than all periods at once.  After each window is
+solved, the capacity built in its first period (V_Capacity of that vintage) is
+fixed and carried forward as existing capacity into the next window, which
+starts one period later.  Memory and solve time per window thus scale with
+the window size rather than with the length of the full horizon.
+"""
+	from time import clock
+
+	from pyomo.core import DataPortal
+
+	from pformat_results import pformat_results
+	from temoa_rules import PeriodCost_rule
+
+	opt = optimizer              # for us lazy programmer types
+	dot_dats = options.dot_dat
+
+	if not opt:
+		SE.write( '\r---------- Not solving: no available solver\n' )
+		return
+
+	SE.write( '[        ] Reading data files.'); SE.flush()
+	begin = clock()
+	duration = lambda: clock() - begin
+
+	modeldata = DataPortal( model=model )
+	for fname in dot_dats:
+		if fname[-4:] != '.dat':
+			msg = "\n\nExpecting a dot dat (e.g., data.dat) file, found '{}'\n"
+			raise TemoaValidationError( msg.format( fname ))
+		modeldata.load( filename=fname )
+	SE.write( '\r[%8.2f\n' % duration() )
+
+	slice_map = None
+	if options.cluster_seasons:
+		from temoa_clustering import ClusterTimeSeasons
+
+		SE.write( '[        ] Clustering time slices.'); SE.flush()
+		slice_map, report = ClusterTimeSeasons( modeldata, options.cluster_seasons )
+		SE.write( '\r[%8.2f\n' % duration() )
+		SE.write( report )
+
+	if options.presolve:
+		from temoa_lib import EliminateDefinitionalVariables
+		EliminateDefinitionalVariables( model )
+
+	base = deepcopy( modeldata.data() )
+
+	time_future = sorted( dataportal_set( modeldata, 'time_future' ))
+	periods = time_future[:-1]
+	P_0 = periods[ 0 ]
+
+	window_size = options.myopic
+	if window_size < 1:
+		msg = 'The myopic window must be at least 1 period.  Got: {}'
+		raise TemoaValidationError( msg.format( window_size ))
+
+	committed = dict()     # { (t, v) : capacity }
+	committed_costs = dict()  # { p : cost, discounted to the first period }
+
+	for window, commit in myopic_windows( periods, window_size ):
+		future_end = time_future[ time_future.index( window[-1] ) +1 ]
+		label = '{}-{}'.format( window[0], window[-1] )
+
+		SE.write( '[        ] Myopic window {}: preparing data.'.format( label ))
+		SE.flush()
+		restrict_data_to_window( modeldata, base, window, future_end, committed )
+		if window[0] != P_0:
+			# The growth rate constraints are relative to the first period of the
+			# model, which would now be the first period of the window.  With
+			# the capacity carried forward from previous windows, the seed would
+			# likely make the window infeasible.
+			if dataportal_param( modeldata, 'GrowthRateSeed' ):
+				SE.write( '\nNotice: GrowthRateMax and GrowthRateSeed only apply '
+				  'to the first myopic window.\n' )
+			dataportal_param_update( modeldata, 'GrowthRateMax', {} )
+			dataportal_param_update( modeldata, 'GrowthRateSeed', {} )
+		SE.write( '\r[%8.2f\n' % duration() )
+
+		SE.write( '[        ] Myopic window {}: creating instance.'.format( label ))
+		SE.flush()
+		instance = model.create( modeldata )
+		SE.write( '\r[%8.2f\n' % duration() )
+
+		SE.write( '[        ] Myopic window {}: solving.'.format( label ))
+		SE.flush()
+		result = SolveWithProgress( opt, instance, options )
+		SE.write( '\r[%8.2f\n' % duration() )
+
+		updated_results = instance.update_results( result )
+		instance.load( result )
+
+		if 'infeasible' in str( result['Solver'] ):
+			msg = ('Myopic window {} is infeasible.  The capacity decisions of the '
+			  'previous windows (periods before {}) may not allow this window '
+			  'to meet its demands.')
+			raise TemoaInfeasibleError( msg.format( label, window[0] ))
+
+		for (t, v) in instance.V_Capacity:
+			if v not in commit: continue
+			cap = value( instance.V_Capacity[t, v] )
+			if cap < epsilon: continue
+			committed[ t, v ] = cap
+
+		# PeriodCost_rule discounts to the first period of the window; bring it
+		# back to the first period of the full horizon.
+		GDR = value( instance.GlobalDiscountRate )
+		discount = (1 + GDR) ** (P_0 - window[0])
+		for p in commit:
+			committed_costs[ p ] = value( PeriodCost_rule( instance, p )) * discount
+
+		msg = '\n# Myopic window: periods {}; committed periods: {}\n'
+		SO.write( msg.format( ', '.join( map( str, window )),
+		                      ', '.join( map( str, commit ))))
+		formatted_results = pformat_results( instance, updated_results, slice_map )
+		SO.write( formatted_results.getvalue() )
+
+	SO.write( '\n# Myopic summary: cost of each committed period, discounted to '
+	  '{}\n'.format( P_0 ))
+	for p in sorted( committed_costs ):
+		SO.write( '  {}  {}\n'.format( p, committed_costs[ p ] ))
+	SO.write( '  Total  {}\n'.format( sum( committed_costs.values() )))
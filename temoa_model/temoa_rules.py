@@ -78,6 +78,14 @@ Temoa optimizes only a single characteristic year within each period.
 
 
 def PeriodCost_rule ( M, p ):
+	return PeriodCapitalCost_rule( M, p ) + PeriodOperatingCost_rule( M, p )
+
+
+def PeriodCapitalCost_rule ( M, p ):
+	"""\
+The costs of period p that depend only upon installed capacity: the loan
+payments of vintage p and the fixed costs of the processes active in p.
+"""
 	P_0 = min( M.time_optimize )
 	GDR = value( M.GlobalDiscountRate )
 	MLL = M.ModelLoanLife
@@ -111,8 +119,16 @@ def PeriodCost_rule ( M, p ):
 	  if S_p == p
 	)
 
+	return (loan_costs + fixed_costs)
+
+
+def PeriodOperatingCost_rule ( M, p ):
+	"""\
+The costs of period p that depend upon how the installed capacity is operated:
+the variable costs of each process' activity.
+"""
 	variable_costs = sum(
-	    M.V_ActivityByPeriodAndProcess[p, S_t, S_v]
+	    ActivityByPeriodAndProcessExpression( M, p, S_t, S_v )
 	  * (
 	      value( M.CostVariable[p, S_t, S_v] )
 	    * value( M.PeriodRate[ p ] )
@@ -122,8 +138,7 @@ def PeriodCost_rule ( M, p ):
 	  if S_p == p
 	)
 
-	period_costs = (loan_costs + fixed_costs + variable_costs)
-	return period_costs
+	return variable_costs
 
 
 ##############################################################################
@@ -268,9 +283,9 @@ functionality is currently on the Temoa TODO list.
 	#   computationally, however, multiplication is cheaper than division, so:
 	#       (ActA * SegB) == (ActB * SegA)
 	expr = (
-	    M.V_Activity[p, s, d, t, v]   * M.SegFrac[s, d_0]
+	    ActivityExpression( M, p, s, d, t, v )   * M.SegFrac[s, d_0]
 	 ==
-	    M.V_Activity[p, s, d_0, t, v] * M.SegFrac[s, d]
+	    ActivityExpression( M, p, s, d_0, t, v ) * M.SegFrac[s, d]
 	)
 	return expr
 
@@ -323,7 +338,7 @@ def MinCapacity_Constraint ( M, p, t ):
 	r""" See MaxCapacity_Constraint """
 
 	min_cap = value( M.MinCapacity[p, t] )
-	expr = (M.V_CapacityAvailableByPeriodAndTech[p, t] >= min_cap)
+	expr = (CapacityAvailableExpression( M, p, t ) >= min_cap)
 	return expr
 
 
@@ -349,7 +364,7 @@ for these constraints are period and tech_all, not tech and vintage.
    \forall \{p, t\} \in \Theta_{\text{MaxCapacity parameter}}
 """
 	max_cap = value( M.MaxCapacity[p, t] )
-	expr = (M.V_CapacityAvailableByPeriodAndTech[p, t] <= max_cap)
+	expr = (CapacityAvailableExpression( M, p, t ) <= max_cap)
 	return expr
 
 
@@ -446,7 +461,7 @@ In constraint in set notation is:
 	out = sum( M.V_FlowOut[p, s, d, S_i, t, v, o]
 	  for S_i in ProcessInputsByOutput( p, t, v, o ) )
 
-	expr = ( out == M.TechOutputSplit[t, o] * M.V_Activity[p, s, d, t, v] )
+	expr = ( out == M.TechOutputSplit[t, o] * ActivityExpression( M, p, s, d, t, v ) )
 	return expr
 
 
@@ -517,7 +532,7 @@ slice ``<s``,\ ``d>``.
 	  * M.V_Capacity[t, v]
 	)
 
-	expr = (produceable >= M.V_Activity[p, s, d, t, v])
+	expr = (produceable >= ActivityExpression( M, p, s, d, t, v ))
 	return expr
 
 
@@ -750,21 +765,21 @@ could be more tightly specified and could have at least one input data anomaly.
 def GrowthRateConstraint_rule ( M, p, t ):
 	GRS = value( M.GrowthRateSeed[ t ] )
 	GRM = value( M.GrowthRateMax[ t ] )
-	CapPT = M.V_CapacityAvailableByPeriodAndTech
+	CapPT = lambda p_: CapacityAvailableExpression( M, p_, t )
 
-	periods = sorted(set(p_ for p_, t_ in CapPT if t_ == t) )
+	periods = sorted(set(p_ for p_, t_ in M.CapacityAvailableVar_pt if t_ == t) )
 
 	if p not in periods:
 		return Constraint.Skip
 
 	if p == periods[0]:
-		expr = ( CapPT[p, t] <= GRS )
+		expr = ( CapPT( p ) <= GRS )
 
 	else:
 		p_prev = periods.index( p )
 		p_prev = periods[ p_prev -1]
 
-		expr = ( CapPT[p, t] <= GRM * CapPT[p_prev, t] + GRS )
+		expr = ( CapPT( p ) <= GRM * CapPT( p_prev ) + GRS )
 
 	return expr
 